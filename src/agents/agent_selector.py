@@ -1,161 +1,457 @@
+import asyncio
 import json
-from langchain_core.messages import AIMessage
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_google_genai import ChatGoogleGenerativeAI
+import logging
+import threading
+from contextlib import aclosing, nullcontext
+from typing import TYPE_CHECKING, Any, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
 
 from shared.state import AgentState
-from agents.geo import GeographyAgent
-from agents.culture import CultureAgent
+from agents.base_agent import BaseAgent
+from agents.registry import DEFAULT_AGENT, agent_configs
+from agents.router import DEFAULT_KEYWORDS, LocalRouter
+from shared.cache import ResponseCache, make_cache_key
+from shared.json_stream import JSONObjectStream, parse_json_object
+from shared.resilience import ResilientCaller
+from shared.singleflight import SingleFlight, call_key
+
+if TYPE_CHECKING:
+    # annotation only; importing the Gemini client is slow
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    from agents.routing_batcher import RoutingBatcher
+
+
+logger = logging.getLogger(__name__)
+
+SELECTOR_SYSTEM_PROMPT = """
+             You are an intelligent agent selector with a deep understanding of different types of requests and agent capabilities.
+             Available agents and their specializations:
+{agent_list}
+             CRITICAL: Respond with ONLY valid JSON in this EXACT format:
+                {{"selected_agent": "{example_agent}", "reasoning": "your reason here"}}
+             Rules:
+                - selected_agent must be exactly one of: {agent_names}{composite_rule}
+                - No text before or after the JSON
+                - Use double quotes for all strings
+                - No trailing commas
+             
+             Consider edge cases where a request might fit multiple categories - choose the agent whose core strengths best match the primary need."""
+
+COMPOSITE_RULE = """
+                - If the request clearly spans several domains, you may add up to {extra} more agents from the same list
+                  as "additional_agents": ["..."]; selected_agent stays the primary one"""
+
+SELECTOR_HUMAN_PROMPT = "Please analyze this request and select the best agent: {input}"
+
+BATCH_SELECTOR_SYSTEM_PROMPT = """
+             You are an intelligent agent selector with a deep understanding of different types of requests and agent capabilities.
+             Available agents and their specializations:
+{agent_list}
+             You will receive several numbered requests from different users. Route each one on its own.
+             CRITICAL: Respond with ONLY a valid JSON array holding one object per request, in request order:
+                [{{"id": 1, "selected_agent": "{example_agent}", "reasoning": "your reason here"}}, ...]
+             Rules:
+                - id is the request's number
+                - selected_agent must be exactly one of: {agent_names}{composite_rule}
+                - Keep each reasoning under 15 words
+                - No text before or after the JSON
+                - Use double quotes for all strings
+                - No trailing commas"""
+
+BATCH_SELECTOR_HUMAN_PROMPT = "Please select the best agent for each of these requests:\n{requests}"
+
+
+def routing_schema(agent_names: Iterable[str], max_agents: int = 1) -> Dict[str, Any]:
+    """
+    JSON schema of the selector's reply, for schema-constrained decoding
+    (see shared.models). selected_agent is ordered first so it can be acted
+    on while reasoning streams.
+    """
+    names = list(agent_names)
+    properties: Dict[str, Any] = {
+        "selected_agent": {"type": "string", "enum": names},
+        "reasoning": {"type": "string"},
+    }
+    if max_agents > 1:
+        properties["additional_agents"] = {"type": "array", "items": {"type": "string", "enum": names},
+                                           "maxItems": max_agents - 1}
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": ["selected_agent", "reasoning"],
+        "propertyOrdering": list(properties),
+    }
+
+
+def batch_routing_schema(agent_names: Iterable[str], max_agents: int = 1) -> Dict[str, Any]:
+    """
+    JSON schema of a batched routing reply: one routing_schema object per
+    request, each carrying the request's number as "id".
+    """
+    item = routing_schema(agent_names, max_agents)
+    item["properties"] = {"id": {"type": "integer"}, **item["properties"]}
+    item["required"] = ["id"] + item["required"]
+    item["propertyOrdering"] = list(item["properties"])
+    return {"type": "array", "items": item}
 
 
 class AgentSelector:
     """Select the best specialised agent for the user request."""
     
-    def __init__(self, llm:ChatGoogleGenerativeAI):
+    def __init__(self, llm:"ChatGoogleGenerativeAI", agents: Dict[str, BaseAgent], confidence_threshold: float = 0.6,
+                 max_agents: int = 1):
         self.llm = llm
-        self.available_agents = {
-            "GeographyAgent" : GeographyAgent(self.llm),
-            "CultureAgent"   : CultureAgent(self.llm),
-            "LoreAgent" : LoreAgent(self.llm),
-            "EconomicsAgent": EconomicsAgent(self.llm),
-            "PoliticsAgent": PoliticsAgent(self.llm)
-        }
+        # Shared with the graph builder; see agents.registry
+        self.available_agents = agents
+        # More than one lets the selector fan a composite request out to several agents
+        self.max_agents = max_agents
+
+        # Selector system prompt is fixed for the process, so build it once;
+        # configs are read from the registry so lazily built agents stay unbuilt
+        configs = agent_configs(self.available_agents)
+        agent_list = "\n".join(
+            f"                {index}. {name}: {config['description']}"
+            for index, (name, config) in enumerate(configs.items(), start=1)
+        )
+        prompt_fields = dict(
+            agent_list=agent_list,
+            example_agent=next(iter(self.available_agents)),
+            agent_names=", ".join(f'"{name}"' for name in self.available_agents),
+            composite_rule=COMPOSITE_RULE.format(extra=max_agents - 1) if max_agents > 1 else ""
+        )
+        self._system_message = SystemMessage(content=SELECTOR_SYSTEM_PROMPT.format(**prompt_fields))
+        self._batch_system_message = SystemMessage(content=BATCH_SELECTOR_SYSTEM_PROMPT.format(**prompt_fields))
 
-    def select_agent(self, state:AgentState) -> AgentState:
+        # Local routing tier; the LLM is only asked when confidence is below threshold
+        self.confidence_threshold = confidence_threshold
+        self.router = LocalRouter(
+            {name: config["description"] for name, config in configs.items()}
+        )
+        self.routing_stats = {"local": 0, "llm": 0}
+        # requests are routed from pool threads too (batch runs, speculation)
+        self._stats_lock = threading.Lock()
+
+        # Optional cap on in-flight LLM calls, shared with the agents
+        self.llm_limiter: Optional[asyncio.Semaphore] = None
+        # Optional response cache shared with the agents
+        self.cache: Optional[ResponseCache] = None
+        # Optional coalescing of identical in-flight calls, shared with the agents
+        self.single_flight: Optional[SingleFlight] = None
+        # Optional deadlines, retries, hedging and circuit breaker for the selector tier
+        self.resilience: Optional[ResilientCaller] = None
+        # Read the reply as it streams and stop once the JSON object closes
+        self.stream_decisions = True
+        # Optional micro-batching of LLM routing across concurrent requests (see agents.routing_batcher)
+        self.batcher: Optional["RoutingBatcher"] = None
+
+    def select_agent(self, state:AgentState) -> dict:
         """
         Analyze the user's request and determine the most appropriate agent.
         """    
         # Input Validation
         if "input_prompt" not in state:
-            print("ERROR: input_prompt not found in state!")
-            return state
+            logger.error("input_prompt not found in state")
+            return {}
+
+        # Local Routing - skip the LLM for unambiguous prompts
+        local_state = self.route_locally(state)
+        if local_state is not None:
+            return local_state
+
+        return self.select_with_llm(state)
+
+    def select_with_llm(self, state:AgentState, on_agent: Optional[Callable[[str], None]] = None) -> dict:
+        """
+        Ask the selector LLM for a decision, bypassing the local router.
+        Args:
+            state: Current workflow state
+            on_agent: Called with selected_agent as soon as that field has
+                streamed, before the rest of the reply (e.g. to start the agent).
+                Not used with a batcher, which returns each decision as soon as it streams
+        """
+        formated_prompt = self._build_prompt(state)
+
+        cache_key = self._cache_key(state, formated_prompt)
+        cached = self.cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            return self._parse_decision(state, cached, routing_path="cache")
 
-        # Agent Description Gathering
+        # get selector's decision; an unavailable selector degrades to keyword routing
         try:
-            agent_descriptions = {}
-            for name, agent in self.available_agents.items():
-                agent_descriptions[name] = agent.config["description"]
-                print(f"Agents Available \n{name}: {agent_descriptions[name]}")
+            logger.debug("Calling selector LLM")
+            if self.batcher is not None:
+                return self._batched_decision(state, self.batcher.route(state["input_prompt"]), cache_key)
+            response = self._invoke(formated_prompt, on_agent)
         except Exception as e:
-            print(f"ERROR - Could not get agent descriptions: {e}")
-            return self._create_fallback_state(state, f"Agent config error: {e}")
+            self._report_llm_failure(e, formated_prompt)
+            return self._degraded_selection(state, e)
 
+        if cache_key:
+            self.cache.set(cache_key, response.content)
 
-        # Prompt Construction
-        selector_prompt = ChatPromptTemplate.from_messages([
-            ("system", """
-             You are an intelligent agent selector with a deep understanding of different types of requests and agent capabilities.
-             Available agents and their specializations:
-                1. GeographyAgent: {geo_agent_desc}
-                2. CultureAgent: {culture_agent_desc}
-                3. LoreAgent: {lore_agent_desc}
-                4. PoliticsAgent: {politics_agent_desc}
-                5. EconomicsAgent: {economics_agent_desc}
-             CRITICAL: Respond with ONLY valid JSON in this EXACT format:
-                {{"selected_agent": "GeographyAgent", "reasoning": "your reason here"}}
-                OR
-                {{"selected_agent": "CultureAgent", "reasoning": "your reason here"}}
-             Rules:
-                - selected_agent must be exactly "GeographyAgent" or "CultureAgent"
-                - No text before or after the JSON
-                - Use double quotes for all strings
-                - No trailing commas
-             
-             Consider edge cases where a request might fit multiple categories - choose the agent whose core strengths best match the primary need."""),
-            ("human", "Please analyze this request and select the best agent: {input}")
-        ])
-
-        # formatting prompt
-        formated_prompt = selector_prompt.format_messages(
-                geo_agent_desc = agent_descriptions["GeographyAgent"],
-                culture_agent_desc = agent_descriptions["CultureAgent"],
-                lore_agent_desc = agent_descriptions["LoreAgent"],
-                politics_agent_desc = agent_descriptions["PoliticsAgent"],
-                economics_agent_desc = agent_descriptions["EconomicsAgent"],
-                input = state["input_prompt"]
-        )
+        return self._parse_decision(state, response.content)
+
+    async def aselect_agent(self, state:AgentState) -> dict:
+        """
+        Async version of select_agent. Holds a slot of the shared LLM limiter
+        while waiting on the selector call.
+        """
+        if "input_prompt" not in state:
+            logger.error("input_prompt not found in state")
+            return {}
+
+        local_state = self.route_locally(state)
+        if local_state is not None:
+            return local_state
+
+        return await self.aselect_with_llm(state)
+
+    async def aselect_with_llm(self, state:AgentState, on_agent: Optional[Callable[[str], None]] = None) -> dict:
+        """
+        Async version of select_with_llm.
+        """
+        formated_prompt = self._build_prompt(state)
+
+        cache_key = self._cache_key(state, formated_prompt)
+        cached = self.cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            return self._parse_decision(state, cached, routing_path="cache")
 
-        # get selector's decision
         try:
-            print("-----------------LLM Calling---------------")
-            response = self.llm.invoke(formated_prompt)        
+            logger.debug("Calling selector LLM")
+            if self.batcher is not None:
+                return self._batched_decision(state, await self.batcher.aroute(state["input_prompt"]), cache_key)
+            response = await self._ainvoke(formated_prompt, on_agent)
         except Exception as e:
-            print(f"DEBUG - LLM call failed: {type(e).__name__}")
-            print(f"DEBUG - Error details: {str(e)}")
-            print(f"DEBUG - Formatted prompt: {formated_prompt}")
-            raise e
+            self._report_llm_failure(e, formated_prompt)
+            return self._degraded_selection(state, e)
 
+        if cache_key:
+            self.cache.set(cache_key, response.content)
+
+        return self._parse_decision(state, response.content)
+
+    def _invoke(self, formated_prompt: List[BaseMessage], on_agent: Optional[Callable[[str], None]] = None) -> BaseMessage:
+        def upstream():
+            if not self.stream_decisions:
+                return self.llm.invoke(formated_prompt)
+            return self._read_stream(self.llm.stream(formated_prompt), on_agent)
+
+        def call():
+            if self.resilience is None:
+                return upstream()
+            return self.resilience.call(upstream)
+
+        if self.single_flight is None:
+            return call()
+        return self.single_flight.do(call_key(self.llm, formated_prompt), call)
+
+    async def _ainvoke(self, formated_prompt: List[BaseMessage], on_agent: Optional[Callable[[str], None]] = None) -> BaseMessage:
+        async def upstream():
+            if not self.stream_decisions:
+                return await self.llm.ainvoke(formated_prompt)
+            return await self._aread_stream(self.llm.astream(formated_prompt), on_agent)
+
+        async def call():
+            if self.resilience is not None:
+                return await self.resilience.acall(upstream, self.llm_limiter)
+            async with self.llm_limiter or nullcontext():
+                return await upstream()
+
+        if self.single_flight is None:
+            return await call()
+        return await self.single_flight.ado(call_key(self.llm, formated_prompt), call)
+
+    def _read_stream(self, chunks: Iterator[BaseMessage], on_agent: Optional[Callable[[str], None]]) -> BaseMessage:
+        """
+        Accumulate a streamed reply, reporting selected_agent as soon as it is
+        complete and closing the stream once the JSON object ends.
+        """
+        parser, message = JSONObjectStream(), None
+        try:
+            for chunk in chunks:
+                message = chunk if message is None else message + chunk
+                if self._feed(parser, chunk, on_agent):
+                    break
+        finally:
+            chunks.close()
+        return message if message is not None else AIMessage(content="")
+
+    async def _aread_stream(self, chunks: AsyncIterator[BaseMessage],
+                            on_agent: Optional[Callable[[str], None]]) -> BaseMessage:
+        """
+        Async version of _read_stream.
+        """
+        parser, message = JSONObjectStream(), None
+        async with aclosing(chunks):
+            async for chunk in chunks:
+                message = chunk if message is None else message + chunk
+                if self._feed(parser, chunk, on_agent):
+                    break
+        return message if message is not None else AIMessage(content="")
+
+    def _feed(self, parser: JSONObjectStream, chunk: BaseMessage, on_agent: Optional[Callable[[str], None]]) -> bool:
+        """Parse one chunk; True once the reply's JSON object is complete."""
+        completed = parser.feed(chunk.content if isinstance(chunk.content, str) else "")
+        if on_agent is not None and "selected_agent" in completed:
+            on_agent(parser.fields["selected_agent"])
+        return parser.done
+
+    def route_locally(self, state:AgentState) -> Optional[dict]:
+        """
+        Route with the local classifier when it is confident enough.
+        Counts the request in routing_stats either way: "local" when it is
+        routed here, "llm" when it isn't, so call it once per request, before
+        any selector LLM call is made for it.
+        Args:
+            state: Request state; only "input_prompt" is read
+        Returns:
+            The state update selecting the agent (routing_path "local"), or
+            None when the request has to go to the selector LLM
+        """
+        local_agent, confidence = self.router.predict(state["input_prompt"])
+        local = confidence >= self.confidence_threshold
+        with self._stats_lock:
+            self.routing_stats["local" if local else "llm"] += 1
+        if local:
+            reasoning = f"Routed locally (confidence {confidence:.2f})"
+            return {
+                "selected_agent": local_agent,
+                "selected_agents": [local_agent],
+                "agent_reasoning": reasoning,
+                "routing_path": "local",
+                "messages": [AIMessage(content=f"Selected {local_agent}: {reasoning}")]
+            }
+        return None
+
+    def _build_prompt(self, state:AgentState) -> List[BaseMessage]:
+        """
+        Selector messages for the request. The system message is built once in
+        __init__, so only the human turn is created here.
+        """
+        return [self._system_message, HumanMessage(content=SELECTOR_HUMAN_PROMPT.format(input=state["input_prompt"]))]
+
+    def build_batch_prompt(self, prompts: List[str]) -> List[BaseMessage]:
+        """
+        Selector messages routing several requests in one call. Each request
+        is JSON-quoted so one user's text can't read as another request.
+        """
+        requests = "\n".join(f"{index}. {json.dumps(prompt)}" for index, prompt in enumerate(prompts, start=1))
+        return [self._batch_system_message, HumanMessage(content=BATCH_SELECTOR_HUMAN_PROMPT.format(requests=requests))]
+
+    def _batched_decision(self, state:AgentState, content: Optional[str], cache_key: Optional[str]) -> dict:
+        """
+        State update from the request's element of a batched reply; a missing
+        element falls back to keyword selection for this request only.
+        """
+        if content is None:
+            return self._keyword_update(state, "Fallback selection: no decision for this request in the batched reply",
+                                        "fallback")
+        update = self._parse_decision(state, content)
+        if cache_key and update["routing_path"] == "llm":
+            self.cache.set(cache_key, content)
+        return update
+
+    def _cache_key(self, state:AgentState, formated_prompt: List[BaseMessage]) -> Optional[str]:
+        """
+        Key for the routing decision; routing ignores thread memory.
+        """
+        if self.cache is None:
+            return None
+        return make_cache_key(state["input_prompt"], type(self).__name__, formated_prompt[0].content,
+                              model=getattr(self.llm, "model", ""))
+
+    def _report_llm_failure(self, error: Exception, formated_prompt: List[BaseMessage]) -> None:
+        logger.warning("Selector LLM call failed: %s: %s", type(error).__name__, error)
+        logger.debug("Selector prompt was: %s", formated_prompt)
+
+    def _parse_decision(self, state:AgentState, content: str, routing_path: str = "llm") -> dict:
+        """
+        Turn the selector's JSON reply into a state update, falling back to
+        keyword selection when the reply cannot be used.
+        """
         try:
             # Response Parsing
-            decision = json.loads(response.content)
+            decision = parse_json_object(content)
             selected_agent = decision["selected_agent"]
-            reasoning = decision["reasoning"]
+            # the agent is what routing needs; a missing or cut-off reasoning is not worth a fallback
+            reasoning = decision.get("reasoning") or "No reasoning given"
 
             # Agent Validation
             if selected_agent not in self.available_agents:
                 raise ValueError(f"Unknown agent: {selected_agent}")
+
+            # Composite requests: keep known, distinct extras up to max_agents
+            selected_agents = [selected_agent]
+            for extra in decision.get("additional_agents") or []:
+                if len(selected_agents) >= self.max_agents:
+                    break
+                if extra in self.available_agents and extra not in selected_agents:
+                    selected_agents.append(extra)
+
+            # Learn from the LLM so similar prompts route locally next time
+            self.router.add_example(state["input_prompt"], selected_agent)
             
             # State Update
-            state_update: AgentState = {
-                **state,
+            state_update = {
                 "selected_agent": selected_agent,
+                "selected_agents": selected_agents,
                 "agent_reasoning": reasoning,
-                "messages": state["messages"] + [AIMessage(content=f"Selected {selected_agent}: {reasoning}")]
+                "routing_path": routing_path,
+                "messages": [AIMessage(content=f"Selected {', '.join(selected_agents)}: {reasoning}")]
             }
             return state_update
         
 
-        except (json.JSONDecodeError, KeyError, ValueError) as e:
-            selected_agent = self._fallback_selection(state["input_prompt"])
-            reasoning = f"Fallback selection due to parsing error: {str(e)}"
+        except (KeyError, TypeError, ValueError) as e:
+            logger.info("Selector reply unusable, falling back to keywords: %s", e)
+            return self._keyword_update(state, f"Fallback selection due to parsing error: {str(e)}", "fallback")
 
-            state_update: AgentState  = {
-                **state,
-                "selected_agent": selected_agent,
-                "agent_reasoning": reasoning,
-                "messages": state["messages"] + [AIMessage(content= f"Selected {selected_agent} : {reasoning}")] #give values not key
-            }
-            return state_update
-        
-    def _fallback_selection(self, input_text: str) -> str:
-        text_lower = input_text.lower()
+    def _degraded_selection(self, state:AgentState, error: Exception) -> dict:
+        """
+        Keyword routing while the selector LLM is unavailable (failed after
+        retries, out of time, or its circuit is open).
+        """
+        reasoning = f"Selector unavailable ({type(error).__name__}), selected by keywords"
+        return self._keyword_update(state, reasoning, "degraded")
 
-        # Geography keywords
-        geography_keywords = ["geography", "terrain", "world", "rocky", "mountain", "desert", "forest"]
+    def _keyword_update(self, state:AgentState, reasoning: str, routing_path: str) -> dict:
+        selected_agent = self._fallback_selection(state["input_prompt"])
+        return {
+            "selected_agent": selected_agent,
+            "selected_agents": [selected_agent],
+            "agent_reasoning": reasoning,
+            "routing_path": routing_path,
+            "messages": [AIMessage(content= f"Selected {selected_agent} : {reasoning}")] #give values not key
+        }
         
-        # Culture keywords  
-        culture_keywords = ["culture", "people", "society", "community", "tradition"]
-
-        # Lore keywords
-        lore_keywords = ["story", "lore","plot", "tale", "history"]
-
-        # Economics keywords
-        ecnomics_keywords = ["economics", "trade", "market", "resources", "wealth"]
-
-        # Politics keywords
-        politics_keywords = ["politics", "government", "power", "leadership", "authority"]
-
-        # Count keyword matches
-        geography_score = sum(1 for keyword in geography_keywords if keyword in text_lower)
-        culture_score = sum(1 for keyword in culture_keywords if keyword in text_lower)
-        lore_score = sum(1 for keyword in lore_keywords if keyword in text_lower)
-        ecnomics_score = sum(1 for keyword in ecnomics_keywords if keyword in text_lower)
-        politics_score = sum(1 for keyword in politics_keywords if keyword in text_lower)
-
-        # Store scores in a dictionary
-        scores = {
-                "GeographyAgent": geography_score,
-                "CultureAgent": culture_score,
-                "LoreAgent": lore_score,
-                "EcnomicsAgent": ecnomics_score,
-                "PoliticsAgent": politics_score
+    def _keyword_scores(self, input_text: str) -> Dict[str, int]:
+        """
+        Count keyword matches per agent.
+        """
+        text_lower = input_text.lower()
+        return {
+            name: sum(1 for keyword in DEFAULT_KEYWORDS.get(name, []) if keyword in text_lower)
+            for name in self.available_agents
         }
 
+    def candidate_agents(self, input_text: str, k: int) -> List[str]:
+        """
+        Up to k agents most likely to be selected, ranked by keyword score.
+        Agents without any keyword match are never candidates.
+        """
+        scores = self._keyword_scores(input_text)
+        ranked = sorted((name for name in scores if scores[name] > 0), key=scores.get, reverse=True)
+        return ranked[:k]
+
+    def _fallback_selection(self, input_text: str) -> str:
+        scores = self._keyword_scores(input_text)
+
         score_values = list(scores.values())
 
         # Edge case: all scores are the same (including all zeros)
         if score_values.count(score_values[0]) == len(score_values):
-            return "LoreAgent"
+            return DEFAULT_AGENT if DEFAULT_AGENT in scores else next(iter(scores))
 
         # Otherwise, select agent with highest score
         agent_selected = max(scores, key=scores.get)
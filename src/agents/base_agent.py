@@ -3,10 +3,28 @@ Base class for all specialized agents.
 This provides common functionality and ensures consistent behavior.
 """
 
+import asyncio
 from abc import ABC, abstractmethod
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_google_genai import ChatGoogleGenerativeAI
+from contextlib import nullcontext
+from typing import TYPE_CHECKING, List, Optional
+from langchain_core.messages import AIMessage, BaseMessage
+from shared.cache import ResponseCache, make_cache_key, memory_digest
+from shared.resilience import ResilientCaller
+from shared.singleflight import SingleFlight, call_key
 from shared.state import AgentState,AgentConfig
+from shared.entities import format_entity
+from shared.summary import build_story_context
+
+if TYPE_CHECKING:
+    # annotations only; both imports are slow and only needed once an agent is built
+    from langchain_core.prompts import ChatPromptTemplate
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+STORY_CONTEXT_SUFFIX = """
+
+Story so far (build on it and do not contradict it):
+{story}
+"""
 
 class BaseAgent(ABC):
     """
@@ -14,39 +32,150 @@ class BaseAgent(ABC):
     This ensures consistency and makes it easy to add new agent types.
     """
 
-    def __init__(self, llm:ChatGoogleGenerativeAI ):
+    def __init__(self, llm:"ChatGoogleGenerativeAI" ):
         self.llm = llm
         self.config = self.get_config()
+        # agent prompt is compiled once and reused for every request
+        self.prompt_template = self._build_template()
+        # Optional cap on in-flight LLM calls, shared across agents and selector
+        self.llm_limiter: Optional[asyncio.Semaphore] = None
+        # Optional response cache shared across agents and selector
+        self.cache: Optional[ResponseCache] = None
+        # Optional coalescing of identical in-flight calls, shared across agents and selector
+        self.single_flight: Optional[SingleFlight] = None
+        # Optional deadlines, retries, hedging and circuit breaker for this agent's tier
+        self.resilience: Optional[ResilientCaller] = None
+        # Token budget for the story context injected into the prompt
+        self.context_token_budget = 600
 
     @abstractmethod
     def get_config(self) -> AgentConfig:
         """
         Each agent must define its own configuration.
         This method forces agents to explicitly declare their capabilities.
+        It must only return static data: the registry reads it without
+        constructing the agent.
         """
         pass
 
-    def process_request(self, state: AgentState) -> AgentState:
+    def process_request(self, state: AgentState) -> dict:
         """
         Standard method for processing requests that all agents share.
         This implements the common pattern while allowing customization.
         """
-        # agent specialized prompt
-        agent_prompt = ChatPromptTemplate.from_messages([
-                ("system", self.config["system_prompt"]),
+        # serve repeats from the response cache
+        cache_key = self._cache_key(state)
+        cached = self.cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            return {"messages" : [AIMessage(content=cached)]}
+
+        formatted_prompt = self._format_prompt(state)
+
+        response = self._invoke(formatted_prompt)
+        self._store(cache_key, response)
+
+        # return only the agent response; the messages channel appends it
+        return {"messages" : [response]}
+
+    async def aprocess_request(self, state: AgentState) -> dict:
+        """
+        Async version of process_request, used by the graph under ainvoke.
+        """
+        cache_key = self._cache_key(state)
+        cached = self.cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            return {"messages" : [AIMessage(content=cached)]}
+
+        formatted_prompt = self._format_prompt(state)
+
+        response = await self._ainvoke(formatted_prompt)
+        self._store(cache_key, response)
+
+        return {"messages" : [response]}
+
+    def _invoke(self, formatted_prompt: List[BaseMessage]) -> BaseMessage:
+        """
+        One LLM call, shared with identical calls already in flight when
+        single-flight is on and run under the tier's resilience policy.
+        """
+        def call():
+            if self.resilience is None:
+                return self.llm.invoke(formatted_prompt)
+            return self.resilience.call(lambda: self.llm.invoke(formatted_prompt))
+
+        if self.single_flight is None:
+            return call()
+        return self.single_flight.do(call_key(self.llm, formatted_prompt), call)
+
+    async def _ainvoke(self, formatted_prompt: List[BaseMessage]) -> BaseMessage:
+        """
+        Async version of _invoke; only the leading call's attempts hold limiter slots.
+        """
+        async def call():
+            if self.resilience is not None:
+                return await self.resilience.acall(lambda: self.llm.ainvoke(formatted_prompt), self.llm_limiter)
+            async with self.llm_limiter or nullcontext():
+                return await self.llm.ainvoke(formatted_prompt)
+
+        if self.single_flight is None:
+            return await call()
+        return await self.single_flight.ado(call_key(self.llm, formatted_prompt), call)
+
+    def _cache_key(self, state: AgentState) -> Optional[str]:
+        """
+        Key for this request in the response cache, None when caching is off.
+        """
+        if self.cache is None:
+            return None
+        entries = state.get("thread_memory", {}).get(state.get("thread_id"), [])
+        return make_cache_key(
+            state["input_prompt"],
+            type(self).__name__,
+            self.config["system_prompt"],
+            memory_digest(entries, state.get("memory_summary", ""), self._entity_lines(state)),
+            getattr(self.llm, "model", "")
+        )
+
+    def _store(self, cache_key: Optional[str], response: BaseMessage) -> None:
+        if cache_key and isinstance(response.content, str):
+            self.cache.set(cache_key, response.content)
+
+    def _build_template(self) -> "ChatPromptTemplate":
+        """
+        Agent specialized prompt. Story context goes in the {story} slot,
+        or after the instructions when the prompt has none.
+        """
+        from langchain_core.prompts import ChatPromptTemplate
+
+        system_prompt = self.config["system_prompt"]
+        if "{story}" not in system_prompt:
+            system_prompt += STORY_CONTEXT_SUFFIX
+        return ChatPromptTemplate.from_messages([
+                ("system", system_prompt),
                 ("human", "{input}")
-            
         ])
 
+    def _format_prompt(self, state: AgentState) -> List[BaseMessage]:
+        """
+        Build the agent's chat messages for the current request.
+        """
         # process request with agent expretise
-        formatted_prompt = agent_prompt.format_messages(
-            input = state["input_prompt"]
+        return self.prompt_template.format_messages(
+            input = state["input_prompt"],
+            story = self._story_context(state)
         )
 
-        response = self.llm.invoke(formatted_prompt)
+    def _story_context(self, state: AgentState) -> str:
+        """
+        Relevant known entities, the thread's digest and its most recent
+        entries, within the token budget.
+        """
+        entries = state.get("thread_memory", {}).get(state.get("thread_id"), [])
+        return build_story_context(state.get("memory_summary", ""), entries, self.context_token_budget,
+                                   self._entity_lines(state))
 
-        # return updated agent response to state
-        return {
-            **state,
-            "messages" : state["messages"] + [response]
-        }
+    def _entity_lines(self, state: AgentState) -> List[str]:
+        """
+        Prompt lines for the entities retrieved for this request.
+        """
+        return [format_entity(entity) for entity in state.get("world_entities") or []]
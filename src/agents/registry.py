@@ -0,0 +1,107 @@
+"""
+Single declaration of the specialised agents.
+The selector, the router and the graph builder all read from here, so a new
+agent is one line in AGENT_CLASSES.
+"""
+
+import threading
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Iterator, List, Optional, Type
+
+from agents.base_agent import BaseAgent
+from agents.geo import GeographyAgent
+from agents.culture import CultureAgent
+from agents.lore import LoreAgent
+from agents.ecnmoice import EconomicsAgent
+from agents.politics import PoliticsAgent
+from shared.state import AgentConfig
+
+
+# Graph node name -> agent class, in the order the selector lists them
+AGENT_CLASSES: Dict[str, Type[BaseAgent]] = {
+    "GeographyAgent": GeographyAgent,
+    "CultureAgent": CultureAgent,
+    "LoreAgent": LoreAgent,
+    "PoliticsAgent": PoliticsAgent,
+    "EconomicsAgent": EconomicsAgent,
+}
+
+# Agent used when nothing else matches
+DEFAULT_AGENT = "LoreAgent"
+
+
+def build_agents(llm, agent_classes: Dict[str, Type[BaseAgent]] = AGENT_CLASSES) -> Dict[str, BaseAgent]:
+    """
+    Instantiate every registered agent once, sharing the given LLM.
+    """
+    return {name: agent_class(llm) for name, agent_class in agent_classes.items()}
+
+
+def agent_config(agent_class: Type[BaseAgent]) -> AgentConfig:
+    """
+    An agent class's declared config, read without running its __init__
+    (get_config only returns static data).
+    """
+    return object.__new__(agent_class).get_config()
+
+
+def agent_configs(agents: Mapping) -> Dict[str, AgentConfig]:
+    """
+    Config of every agent in `agents`, without constructing lazily built ones.
+    """
+    if isinstance(agents, LazyAgents):
+        return {name: agents.config(name) for name in agents}
+    return {name: agent.config for name, agent in agents.items()}
+
+
+class LazyAgents(Mapping):
+    """
+    Name -> agent mapping that constructs each agent on first access.
+    Iterating, len() and `in` only look at the registered names.
+    Args:
+        llm: Shared LLM handed to every agent
+        agent_classes: Registered agent classes
+        on_build: Called with each agent's name and the agent right after it is constructed
+        llm_for: Per-agent LLM lookup by name; overrides `llm` when given
+    """
+
+    def __init__(self, llm, agent_classes: Dict[str, Type[BaseAgent]] = AGENT_CLASSES,
+                 on_build: Optional[Callable[[str, BaseAgent], None]] = None,
+                 llm_for: Optional[Callable[[str], Any]] = None):
+        self.llm = llm
+        self._llm_for = llm_for
+        self._classes = dict(agent_classes)
+        self._on_build = on_build
+        self._built: Dict[str, BaseAgent] = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name: str) -> BaseAgent:
+        agent = self._built.get(name)
+        if agent is not None:
+            return agent
+        with self._lock:
+            agent = self._built.get(name)
+            if agent is None:
+                llm = self._llm_for(name) if self._llm_for is not None else self.llm
+                agent = self._classes[name](llm)
+                if self._on_build is not None:
+                    self._on_build(name, agent)
+                self._built[name] = agent
+        return agent
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._classes)
+
+    def __len__(self) -> int:
+        return len(self._classes)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._classes
+
+    def config(self, name: str) -> AgentConfig:
+        built = self._built.get(name)
+        return built.config if built is not None else agent_config(self._classes[name])
+
+    def built(self) -> List[str]:
+        """Names of the agents constructed so far."""
+        return list(self._built)
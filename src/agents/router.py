@@ -0,0 +1,156 @@
+"""
+Local routing tier that sits in front of the selector LLM.
+Scores a prompt against every agent with a hashed n-gram TF-IDF model and
+only defers to the LLM when the best match is not clear enough.
+"""
+
+import math
+import re
+import threading
+import zlib
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+# Seed vocabulary per agent, the same signals the selector's keyword fallback uses
+DEFAULT_KEYWORDS: Dict[str, List[str]] = {
+    "GeographyAgent": ["geography", "terrain", "world", "rocky", "mountain", "desert", "forest"],
+    "CultureAgent": ["culture", "people", "society", "community", "tradition"],
+    "LoreAgent": ["story", "lore", "plot", "tale", "history"],
+    "EconomicsAgent": ["economics", "trade", "market", "resources", "wealth"],
+    "PoliticsAgent": ["politics", "government", "power", "leadership", "authority"],
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens with a crude plural strip ("mountains" -> "mountain")."""
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class LocalRouter:
+    """
+    Hashed n-gram classifier over agent descriptions, keywords and past decisions.
+    Each agent is one TF-IDF "document"; prompts are scored by cosine similarity.
+    Safe to train and query from several threads at once.
+    """
+
+    def __init__(self,
+                 agent_descriptions: Dict[str, str],
+                 keywords: Optional[Dict[str, Iterable[str]]] = None,
+                 n_features: int = 2 ** 14,
+                 keyword_weight: float = 3.0,
+                 max_examples: int = 200):
+        self.n_features = n_features
+        self.keyword_weight = keyword_weight
+        self.agent_names = list(agent_descriptions)
+
+        keywords = DEFAULT_KEYWORDS if keywords is None else keywords
+
+        # seed counts per agent: description once, keywords boosted
+        self._seed_counts: Dict[str, Dict[int, float]] = {}
+        for name, description in agent_descriptions.items():
+            counts: Dict[int, float] = {}
+            self._accumulate(counts, description, 1.0)
+            for keyword in keywords.get(name, []):
+                self._accumulate(counts, keyword, self.keyword_weight)
+            self._seed_counts[name] = counts
+
+        # past routing decisions, bounded per agent
+        self._examples: Dict[str, deque] = {name: deque(maxlen=max_examples) for name in self.agent_names}
+
+        # (idf, vector per agent), replaced as a whole so scoring sees one model
+        self._model: Tuple[Dict[int, float], Dict[str, Dict[int, float]]] = ({}, {})
+        self._dirty = True
+        self._lock = threading.Lock()  # examples and _dirty
+        self._rebuild_lock = threading.Lock()  # one rebuild at a time, published in order
+
+    # Feature hashing
+    def _features(self, text: str) -> List[int]:
+        tokens = tokenize(text)
+        grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        return [zlib.crc32(gram.encode("utf-8")) % self.n_features for gram in grams]
+
+    def _accumulate(self, counts: Dict[int, float], text: str, weight: float) -> None:
+        for feature in self._features(text):
+            counts[feature] = counts.get(feature, 0.0) + weight
+
+    # Training
+    def add_example(self, prompt: str, agent_name: str) -> None:
+        """Record a confirmed routing decision so similar prompts route locally next time."""
+        if agent_name not in self._examples:
+            return
+        with self._lock:
+            self._examples[agent_name].append(prompt)
+            self._dirty = True
+
+    def _trained(self) -> Tuple[Dict[int, float], Dict[str, Dict[int, float]]]:
+        """The current model, rebuilt first if examples were added."""
+        if self._dirty:
+            with self._rebuild_lock:
+                if self._dirty:
+                    self._rebuild()
+        return self._model
+
+    def _rebuild(self) -> None:
+        # examples added from here on mark the model dirty again
+        with self._lock:
+            examples = {name: list(self._examples[name]) for name in self.agent_names}
+            self._dirty = False
+        docs: Dict[str, Dict[int, float]] = {}
+        for name in self.agent_names:
+            counts = dict(self._seed_counts[name])
+            for example in examples[name]:
+                self._accumulate(counts, example, 1.0)
+            docs[name] = counts
+
+        # smoothed idf across agent documents
+        n_docs = len(docs)
+        doc_freq: Dict[int, int] = {}
+        for counts in docs.values():
+            for feature in counts:
+                doc_freq[feature] = doc_freq.get(feature, 0) + 1
+        idf = {f: math.log((1 + n_docs) / (1 + df)) + 1.0 for f, df in doc_freq.items()}
+
+        self._model = (idf, {name: self._normalize(counts, idf) for name, counts in docs.items()})
+
+    @staticmethod
+    def _normalize(counts: Dict[int, float], idf: Dict[int, float]) -> Dict[int, float]:
+        vector = {f: (1.0 + math.log(c)) * idf.get(f, 0.0) for f, c in counts.items() if c > 0}
+        norm = math.sqrt(sum(v * v for v in vector.values()))
+        if norm == 0:
+            return {}
+        return {f: v / norm for f, v in vector.items()}
+
+    # Inference
+    def scores(self, text: str) -> Dict[str, float]:
+        """Cosine similarity of the prompt against every agent."""
+        idf, vectors = self._trained()
+
+        counts: Dict[int, float] = {}
+        self._accumulate(counts, text, 1.0)
+        query = self._normalize(counts, idf)
+
+        return {
+            name: sum(weight * vector.get(feature, 0.0) for feature, weight in query.items())
+            for name, vector in vectors.items()
+        }
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """
+        Best agent for the prompt and a confidence in [0, 1].
+        Confidence is the relative margin between the top two scores, so a prompt
+        that matches two domains equally well scores 0 and goes to the LLM.
+        """
+        ranked = sorted(self.scores(text).items(), key=lambda item: item[1], reverse=True)
+        best_agent, best_score = ranked[0]
+        if best_score <= 0:
+            return best_agent, 0.0
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+        return best_agent, (best_score - runner_up) / best_score
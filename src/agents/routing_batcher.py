@@ -0,0 +1,236 @@
+"""
+Micro-batched routing.
+Under load every LLM-routed request would resend the selector's system
+prompt and all agent descriptions to route one line of text. The batcher
+collects the prompts that arrive within `max_wait` seconds (at most
+`max_batch_size`), routes them with one selector call that answers with a
+JSON array, and hands each request its own element as soon as that element
+has streamed.
+"""
+
+import asyncio
+import json
+import threading
+import time
+import weakref
+from contextlib import aclosing, nullcontext
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.messages import BaseMessage
+
+from shared.json_stream import JSONArrayStream
+from shared.resilience import ResilientCaller
+
+
+class _Slot:
+    """One request waiting in a batch. Sync slots signal an Event, async ones a Future."""
+    __slots__ = ("prompt", "event", "future", "reply", "error", "taken")
+
+    def __init__(self, prompt: str, future: Optional[asyncio.Future] = None):
+        self.prompt = prompt
+        self.future = future
+        self.event = threading.Event() if future is None else None
+        self.reply: Optional[str] = None
+        self.error: Optional[BaseException] = None
+        self.taken = False
+
+    @property
+    def resolved(self) -> bool:
+        return self.future.done() if self.future is not None else self.event.is_set()
+
+    def resolve(self, reply: Optional[str], error: Optional[BaseException] = None) -> None:
+        # hedged or retried attempts may answer twice; the first answer wins
+        if self.resolved:
+            return
+        if self.future is not None:
+            if error is not None:
+                self.future.set_exception(error)
+            else:
+                self.future.set_result(reply)
+            return
+        self.reply, self.error = reply, error
+        self.event.set()
+
+
+class RoutingBatcher:
+    """
+    Routes prompts in batches through one selector call each.
+    route()/aroute() return the raw JSON of the request's own decision, or
+    None when the batched reply had no usable element for it (the caller
+    falls back to keyword routing for that request only). An upstream
+    failure is raised to every request in the batch.
+    Args:
+        llm: Client for batched routing calls
+        build_prompt: Messages routing a list of prompts (see AgentSelector.build_batch_prompt)
+        max_batch_size: Prompts per call; a full batch is sent at once
+        max_wait: Seconds the first prompt of a batch waits for company
+    """
+
+    def __init__(self, llm, build_prompt: Callable[[List[str]], List[BaseMessage]],
+                 max_batch_size: int = 8, max_wait: float = 0.01):
+        self.llm = llm
+        self.build_prompt = build_prompt
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        # Optional cap on in-flight LLM calls, shared with the agents
+        self.llm_limiter: Optional[asyncio.Semaphore] = None
+        # Optional deadlines, retries, hedging and circuit breaker for batched calls
+        self.resilience: Optional[ResilientCaller] = None
+        self.stats = {"batches": 0, "items": 0, "duplicates": 0, "largest_batch": 0, "missing": 0}
+
+        self._cond = threading.Condition()
+        self._pending: List[_Slot] = []
+        # async batches are per event loop; their futures can't cross loops
+        self._apending: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, Any]]" = \
+            weakref.WeakKeyDictionary()
+
+    # Sync
+    def route(self, prompt: str) -> Optional[str]:
+        """
+        Batch the prompt with others arriving from other threads. The first
+        caller whose wait runs out (or the one filling the batch) sends it.
+        """
+        slot = _Slot(prompt)
+        with self._cond:
+            self._pending.append(slot)
+            if len(self._pending) >= self.max_batch_size:
+                batch = self._take()
+            else:
+                deadline = time.monotonic() + self.max_wait
+                while not slot.taken and (remaining := deadline - time.monotonic()) > 0:
+                    self._cond.wait(remaining)
+                batch = None if slot.taken else self._take()
+        if batch:
+            self._send(batch)
+        slot.event.wait()
+        if slot.error is not None:
+            raise slot.error
+        return slot.reply
+
+    def _take(self) -> List[_Slot]:
+        """Claim every pending sync slot. Called with self._cond held."""
+        batch, self._pending = self._pending, []
+        for slot in batch:
+            slot.taken = True
+        self._cond.notify_all()
+        return batch
+
+    def _send(self, batch: List[_Slot]) -> None:
+        def upstream():
+            chunks = self.llm.stream(messages)
+            try:
+                parser = JSONArrayStream()
+                for chunk in chunks:
+                    self._feed(groups, parser, chunk)
+                    if all(slot.resolved for slot in batch):
+                        break
+            finally:
+                chunks.close()
+            self._feed_end(groups, parser)
+
+        # every slot is resolved, even when the prompt can't be built
+        try:
+            messages, groups = self._open(batch)
+            self.resilience.call(upstream) if self.resilience is not None else upstream()
+        except Exception as e:
+            self._close(batch, e)
+        else:
+            self._close(batch)
+
+    # Async
+    async def aroute(self, prompt: str) -> Optional[str]:
+        """
+        Async version of route. A timer on the event loop sends the batch
+        `max_wait` seconds after its first prompt, unless it fills first.
+        """
+        loop = asyncio.get_running_loop()
+        queue = self._apending.setdefault(loop, {"slots": [], "timer": None, "tasks": set()})
+        slot = _Slot(prompt, loop.create_future())
+        queue["slots"].append(slot)
+        if len(queue["slots"]) >= self.max_batch_size:
+            self._aflush(queue)
+        elif queue["timer"] is None:
+            queue["timer"] = loop.call_later(self.max_wait, self._aflush, queue)
+        return await slot.future
+
+    def _aflush(self, queue: Dict[str, Any]) -> None:
+        if queue["timer"] is not None:
+            queue["timer"].cancel()
+            queue["timer"] = None
+        batch, queue["slots"] = queue["slots"], []
+        if not batch:
+            return
+        # the call runs in the context of the request that filled the batch (or,
+        # after a timeout, the first one), so its callbacks see the LLM call
+        task = asyncio.ensure_future(self._asend(batch))
+        queue["tasks"].add(task)
+        task.add_done_callback(queue["tasks"].discard)
+
+    async def _asend(self, batch: List[_Slot]) -> None:
+        async def upstream():
+            parser = JSONArrayStream()
+            async with aclosing(self.llm.astream(messages)) as chunks:
+                async for chunk in chunks:
+                    self._feed(groups, parser, chunk)
+                    if all(slot.resolved for slot in batch):
+                        break
+            self._feed_end(groups, parser)
+
+        try:
+            messages, groups = self._open(batch)
+            if self.resilience is not None:
+                await self.resilience.acall(upstream, self.llm_limiter)
+            else:
+                async with self.llm_limiter or nullcontext():
+                    await upstream()
+        except Exception as e:
+            self._close(batch, e)
+        else:
+            self._close(batch)
+
+    # Shared
+    def _open(self, batch: List[_Slot]) -> Tuple[List[BaseMessage], List[List[_Slot]]]:
+        """
+        The batch's messages, and its slots grouped by prompt in request order;
+        identical prompts are routed once.
+        """
+        groups: Dict[str, List[_Slot]] = {}
+        for slot in batch:
+            groups.setdefault(slot.prompt, []).append(slot)
+        # sync batches are sent from the requests' own threads
+        with self._cond:
+            self.stats["batches"] += 1
+            self.stats["items"] += len(batch)
+            self.stats["duplicates"] += len(batch) - len(groups)
+            self.stats["largest_batch"] = max(self.stats["largest_batch"], len(batch))
+        return self.build_prompt(list(groups)), list(groups.values())
+
+    def _feed(self, groups: List[List[_Slot]], parser: JSONArrayStream, chunk: BaseMessage) -> None:
+        for decision in parser.feed(chunk.content if isinstance(chunk.content, str) else ""):
+            self._assign(groups, decision, parser.count)
+
+    def _feed_end(self, groups: List[List[_Slot]], parser: JSONArrayStream) -> None:
+        # a reply cut off by the output cap may still have named the last agent
+        for decision in parser.finish():
+            self._assign(groups, decision, parser.count)
+
+    def _assign(self, groups: List[List[_Slot]], decision: Dict[str, Any], position: int) -> None:
+        """
+        Hand one element to its requests: by "id" (1-based), else by its
+        position in this attempt's reply.
+        """
+        index = decision.pop("id", None)
+        if not (isinstance(index, int) and 1 <= index <= len(groups)):
+            index = position
+        if index <= len(groups):
+            reply = json.dumps(decision)
+            for slot in groups[index - 1]:
+                slot.resolve(reply)
+
+    def _close(self, batch: List[_Slot], error: Optional[BaseException] = None) -> None:
+        unresolved = [slot for slot in batch if not slot.resolved]
+        if error is None and unresolved:
+            with self._cond:
+                self.stats["missing"] += len(unresolved)
+        for slot in unresolved:
+            slot.resolve(None, error)
@@ -0,0 +1 @@
+# Makes this directory a package.
@@ -0,0 +1,251 @@
+"""
+Latency/throughput benchmark for the orchestrator, run against FakeChatModel.
+Run from src/:
+    python -m benchmarks.orchestrator_bench --threads 50 --turns 10 --latency 0.2 --out bench.json
+
+Reports p50/p95/p99 request latency, requests/sec, LLM calls per request and
+a per-request time breakdown (graph overhead, prompt formatting, state
+handling, LLM), and writes everything to a JSON file so runs can be compared.
+"""
+
+import argparse
+import asyncio
+import functools
+import json
+import platform
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from shared.fake_llm import FakeChatModel
+from workflow.orchestrator import WorkFlowOrchestrator
+
+
+# Mix of unambiguous (local-routable) and cross-domain prompts
+PROMPTS = [
+    "Describe the mountains and deserts of the northern wastes",
+    "What traditions does the river society keep",
+    "Tell me the history of the fallen kings",
+    "Who holds power in the capital and how is the government run",
+    "What does the market trade and where does its wealth come from",
+    "A desert trading empire ruled by priest-kings",
+    "Describe the capital",
+    "Invent a festival for the coastal clans",
+    "What legends surround the glass forest",
+    "How do the mountain tribes settle disputes over resources",
+]
+
+
+class PhaseTimer:
+    """Thread-safe accumulator of seconds spent per phase."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.seconds: Dict[str, float] = {}
+
+    def add(self, phase: str, seconds: float) -> None:
+        with self._lock:
+            self.seconds[phase] = self.seconds.get(phase, 0.0) + seconds
+
+    def wrap(self, phase: str, func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_timed(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    self.add(phase, time.perf_counter() - start)
+            return async_timed
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(phase, time.perf_counter() - start)
+        return timed
+
+
+def instrument(orchestrator: WorkFlowOrchestrator, timer: PhaseTimer) -> None:
+    """
+    Wrap the orchestrator's phases with timers. Graph nodes look their
+    handlers up on every call, so the wrapped methods are picked up as is.
+    """
+    selector = orchestrator.selector
+    selector._build_prompt = timer.wrap("prompt_formatting", selector._build_prompt)
+    selector.select_agent = timer.wrap("nodes", selector.select_agent)
+    selector.aselect_agent = timer.wrap("nodes", selector.aselect_agent)
+    if orchestrator.speculator is not None:
+        orchestrator.speculator.run = timer.wrap("nodes", orchestrator.speculator.run)
+        orchestrator.speculator.arun = timer.wrap("nodes", orchestrator.speculator.arun)
+
+    for agent in orchestrator.agents.values():
+        agent._format_prompt = timer.wrap("prompt_formatting", agent._format_prompt)
+        agent.process_request = timer.wrap("nodes", agent.process_request)
+        agent.aprocess_request = timer.wrap("nodes", agent.aprocess_request)
+
+    orchestrator._initial_state = timer.wrap("request_setup", orchestrator._initial_state)
+    orchestrator._finalize_request = timer.wrap("request_setup", orchestrator._finalize_request)
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def run_async(orchestrator: WorkFlowOrchestrator, threads: int, turns: int) -> Tuple[List[float], int]:
+    latencies: List[float] = []
+    errors = 0
+
+    async def session(thread_id: int):
+        nonlocal errors
+        for turn in range(turns):
+            prompt = PROMPTS[(thread_id + turn) % len(PROMPTS)]
+            start = time.perf_counter()
+            try:
+                await orchestrator.aprocess_request(prompt, thread_id=thread_id)
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(session(thread_id) for thread_id in range(threads)))
+    return latencies, errors
+
+
+def run_sync(orchestrator: WorkFlowOrchestrator, threads: int, turns: int, workers: int) -> Tuple[List[float], int]:
+    latencies: List[float] = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def session(thread_id: int):
+        for turn in range(turns):
+            prompt = PROMPTS[(thread_id + turn) % len(PROMPTS)]
+            start = time.perf_counter()
+            try:
+                orchestrator.process_request(prompt, thread_id=thread_id)
+            except Exception:
+                with lock:
+                    errors[0] += 1
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(session, range(threads)))
+    return latencies, errors[0]
+
+
+def summarize(latencies: List[float], errors: int, wall: float, timer: PhaseTimer, llm_stats: dict) -> dict:
+    completed = len(latencies)
+    ordered = sorted(latencies)
+    per_request = lambda seconds: seconds / completed if completed else 0.0
+
+    nodes = timer.seconds.get("nodes", 0.0)
+    formatting = timer.seconds.get("prompt_formatting", 0.0)
+    setup = timer.seconds.get("request_setup", 0.0)
+    llm = llm_stats["llm_seconds"]
+
+    return {
+        "requests": completed,
+        "errors": errors,
+        "wall_seconds": wall,
+        "requests_per_second": completed / wall if wall else 0.0,
+        "latency_seconds": {
+            "p50": percentile(ordered, 50),
+            "p95": percentile(ordered, 95),
+            "p99": percentile(ordered, 99),
+            "mean": per_request(sum(latencies)),
+            "max": ordered[-1] if ordered else 0.0,
+        },
+        "llm_calls_per_request": llm_stats["calls"] / completed if completed else 0.0,
+        # mean seconds per request; under concurrency node time includes event-loop waits
+        "breakdown_seconds_per_request": {
+            "llm": per_request(llm),
+            "prompt_formatting": per_request(formatting),
+            "state_handling": per_request(max(0.0, nodes - llm - formatting) + setup),
+            "graph_overhead": per_request(max(0.0, sum(latencies) - nodes - setup)),
+        },
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the orchestrator against a local fake LLM")
+    parser.add_argument("--threads", type=int, default=20, help="concurrent conversation threads")
+    parser.add_argument("--turns", type=int, default=5, help="sequential requests per thread")
+    parser.add_argument("--mode", choices=["async", "sync"], default="async")
+    parser.add_argument("--workers", type=int, default=8, help="worker threads in sync mode")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake LLM seconds per call")
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--tail-rate", type=float, default=0.0, help="fraction of fake LLM calls that stall")
+    parser.add_argument("--tail-latency", type=float, default=2.0, help="seconds a stalled call takes")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--no-resilience", action="store_true", help="disable deadlines/hedging/retries/breaker")
+    parser.add_argument("--routing-threshold", type=float, default=0.6)
+    parser.add_argument("--max-llm-calls", type=int, default=16)
+    parser.add_argument("--speculative", action="store_true")
+    parser.add_argument("--no-early-start", action="store_true",
+                        help="wait for the selector's full reply before starting the agent")
+    parser.add_argument("--batch-routing", action="store_true", help="route concurrent prompts in shared selector calls")
+    parser.add_argument("--routing-batch-size", type=int, default=8)
+    parser.add_argument("--routing-batch-wait", type=float, default=0.01, help="seconds a batch waits to fill")
+    parser.add_argument("--out", default="bench_results.json")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    llm = FakeChatModel(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                        tail_rate=args.tail_rate, tail_latency=args.tail_latency)
+    orchestrator = WorkFlowOrchestrator(
+        llm=llm,
+        routing_threshold=args.routing_threshold,
+        max_concurrent_llm_calls=args.max_llm_calls,
+        speculative=args.speculative,
+        resilient_llm_calls=not args.no_resilience,
+        early_agent_start=not args.no_early_start,
+        batch_routing=args.batch_routing,
+        routing_batch_size=args.routing_batch_size,
+        routing_batch_wait=args.routing_batch_wait,
+    )
+    timer = PhaseTimer()
+    instrument(orchestrator, timer)
+
+    start = time.perf_counter()
+    if args.mode == "async":
+        latencies, errors = asyncio.run(run_async(orchestrator, args.threads, args.turns))
+    else:
+        latencies, errors = run_sync(orchestrator, args.threads, args.turns, args.workers)
+    wall = time.perf_counter() - start
+
+    results = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "metrics": summarize(latencies, errors, wall, timer, llm.stats),
+        "routing": orchestrator.routing_stats(),
+        "resilience": orchestrator.resilience_stats(),
+        "routing_batches": orchestrator.routing_batch_stats(),
+    }
+
+    with open(args.out, "w", encoding="utf-8") as handle:
+        json.dump(results, handle, indent=2)
+
+    metrics = results["metrics"]
+    print(f" {metrics['requests']} requests in {wall:.2f}s "
+          f"({metrics['requests_per_second']:.1f} req/s), "
+          f"p50 {metrics['latency_seconds']['p50'] * 1000:.1f}ms "
+          f"p95 {metrics['latency_seconds']['p95'] * 1000:.1f}ms "
+          f"p99 {metrics['latency_seconds']['p99'] * 1000:.1f}ms")
+    print(f" Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
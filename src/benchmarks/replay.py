@@ -0,0 +1,206 @@
+"""
+Replay recorded traffic (see shared.traffic) against the current build.
+Run from src/:
+    python -m benchmarks.replay traffic.jsonl.gz --speeds 1,10,max --out replay.json
+
+Each speed re-drives the log on a fresh orchestrator: requests arrive at
+their recorded offsets divided by the speed ("max": all at once, at most
+--concurrency in flight), on their recorded threads. By default the LLM is a
+local stand-in drawing each call's latency from those recorded for its tier
+(shared.fake_llm.ReplayChatModel); --llm gemini replays against the real
+model (needs GOOGLE_API_KEY).
+
+Reports, per speed: offered vs achieved requests/sec, latency percentiles,
+queueing delay (late dispatch plus waiting for the thread's earlier
+requests), LLM time per request and per-thread memory growth; and the first
+speed at which the build saturated (achieved throughput under 90% of
+offered, or p95 latency over twice that of the slowest speed).
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import platform
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from benchmarks.orchestrator_bench import percentile
+from shared.fake_llm import ReplayChatModel
+from shared.traffic import TrafficRecord, TrafficRecorder, read_traffic
+from workflow.orchestrator import WorkFlowOrchestrator
+
+
+def parse_speed(text: str) -> float:
+    """A speed multiplier; "max" (as fast as possible) is infinity."""
+    return math.inf if text.strip().lower() in ("max", "inf") else float(text)
+
+
+def build_orchestrator(args, records: List[TrafficRecord]) -> WorkFlowOrchestrator:
+    llm = None if args.llm == "gemini" else ReplayChatModel.from_traffic(records, seed=args.seed)
+    return WorkFlowOrchestrator(
+        llm=llm,
+        max_concurrent_llm_calls=args.max_llm_calls,
+        resilient_llm_calls=not args.no_resilience,
+        batch_routing=args.batch_routing,
+        recorder=TrafficRecorder(),
+    )
+
+
+async def replay(orchestrator: WorkFlowOrchestrator, records: List[TrafficRecord], speed: float,
+                 concurrency: int) -> dict:
+    """Drive the records through the orchestrator at `speed`. Returns the raw measurements."""
+    first = records[0]["ts"]
+    limit = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    lags: List[float] = []
+    errors = 0
+    peak_memory = 0
+
+    async def send(record: TrafficRecord):
+        nonlocal errors, peak_memory
+        due = start + (0.0 if math.isinf(speed) else (record["ts"] - first) / speed)
+        await asyncio.sleep(max(0.0, due - time.perf_counter()))
+        async with limit:
+            # how late the request goes out, on top of any wait in the orchestrator
+            lags.append(max(0.0, time.perf_counter() - due))
+            try:
+                await orchestrator.aprocess_request(record["input"], thread_id=record["thread_id"])
+            except Exception:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - due)
+            peak_memory = max(peak_memory, orchestrator.session_stats()["memory_bytes"])
+
+    start = time.perf_counter()
+    await asyncio.gather(*(send(record) for record in records))
+    return {"wall": time.perf_counter() - start, "latencies": latencies, "lags": lags, "errors": errors,
+            "peak_memory_bytes": peak_memory}
+
+
+def memory_growth(replayed: List[TrafficRecord]) -> dict:
+    """Per-thread memory after the replay, and how much each request added."""
+    by_thread: Dict[int, List[int]] = {}
+    for record in replayed:
+        by_thread.setdefault(record["thread_id"], []).append(record["memory_bytes"])
+    final = sorted(sizes[-1] for sizes in by_thread.values())
+    growth = [(sizes[-1] - sizes[0]) / (len(sizes) - 1) for sizes in by_thread.values() if len(sizes) > 1]
+    return {
+        "threads": len(by_thread),
+        "final_bytes_mean": sum(final) / len(final) if final else 0.0,
+        "final_bytes_p95": percentile(final, 95),
+        "final_bytes_max": final[-1] if final else 0,
+        "bytes_per_request_mean": sum(growth) / len(growth) if growth else 0.0,
+    }
+
+
+def summarize(records: List[TrafficRecord], speed: float, run: dict, replayed: List[TrafficRecord]) -> dict:
+    span = records[-1]["ts"] - records[0]["ts"]
+    completed = len(run["latencies"])
+    ordered = sorted(run["latencies"])
+    lags = sorted(run["lags"])
+    waits = sorted(record["queue_seconds"] for record in replayed)
+    llm_seconds = [sum(call[1] for call in record["llm"]) for record in replayed]
+    offered = None if math.isinf(speed) or not span else len(records) * speed / span
+    return {
+        "speed": "max" if math.isinf(speed) else speed,
+        "requests": completed,
+        "errors": run["errors"],
+        "wall_seconds": run["wall"],
+        "offered_rps": offered,
+        "achieved_rps": completed / run["wall"] if run["wall"] else 0.0,
+        "latency_seconds": {
+            "p50": percentile(ordered, 50),
+            "p95": percentile(ordered, 95),
+            "p99": percentile(ordered, 99),
+            "max": ordered[-1] if ordered else 0.0,
+        },
+        "queueing_seconds": {
+            # sent later than due (event loop or --concurrency saturated)
+            "dispatch_p50": percentile(lags, 50),
+            "dispatch_p95": percentile(lags, 95),
+            # waiting for the thread's earlier requests
+            "thread_p50": percentile(waits, 50),
+            "thread_p95": percentile(waits, 95),
+        },
+        "llm_seconds_per_request": sum(llm_seconds) / len(llm_seconds) if llm_seconds else 0.0,
+        "llm_calls_per_request": sum(len(record["llm"]) for record in replayed) / len(replayed) if replayed else 0.0,
+        "memory": {**memory_growth(replayed), "peak_total_bytes": run["peak_memory_bytes"]},
+    }
+
+
+def saturation(runs: List[dict]) -> Optional[dict]:
+    """The first run, by increasing speed, whose throughput or tail latency broke down."""
+    if not runs:
+        return None
+    ordered = sorted(runs, key=lambda run: math.inf if run["speed"] == "max" else run["speed"])
+    baseline_p95 = ordered[0]["latency_seconds"]["p95"]
+    for run in ordered:
+        reasons = []
+        if run["offered_rps"] and run["achieved_rps"] < 0.9 * run["offered_rps"]:
+            reasons.append("throughput")
+        if run is not ordered[0] and baseline_p95 and run["latency_seconds"]["p95"] > 2 * baseline_p95:
+            reasons.append("p95 latency")
+        if reasons:
+            return {"speed": run["speed"], "achieved_rps": run["achieved_rps"], "reasons": reasons}
+    return None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded traffic against the orchestrator")
+    parser.add_argument("traffic", help="log written by --record-traffic / shared.traffic.TrafficRecorder")
+    parser.add_argument("--speeds", default="1,10,max", help='comma-separated multipliers; "max" for no pacing')
+    parser.add_argument("--llm", choices=["replay", "gemini"], default="replay",
+                        help="local stand-in with the recorded latencies, or the real model")
+    parser.add_argument("--limit", type=int, help="replay only the first N requests")
+    parser.add_argument("--concurrency", type=int, default=256, help="requests in flight at once")
+    parser.add_argument("--max-llm-calls", type=int, default=16)
+    parser.add_argument("--batch-routing", action="store_true")
+    parser.add_argument("--no-resilience", action="store_true")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the stand-in's latency draws")
+    parser.add_argument("--out", default="replay_results.json")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    records = sorted(read_traffic(args.traffic), key=lambda record: record["ts"])[:args.limit]
+    if not records:
+        print(f" No requests in {args.traffic}")
+        return
+
+    runs = []
+    for speed in (parse_speed(text) for text in args.speeds.split(",")):
+        orchestrator = build_orchestrator(args, records)
+        run = asyncio.run(replay(orchestrator, records, speed, args.concurrency))
+        replayed = orchestrator.recorder.records
+        runs.append(summarize(records, speed, run, replayed))
+        result = runs[-1]
+        offered = f"{result['offered_rps']:.1f}" if result["offered_rps"] else "-"
+        print(f" x{result['speed']}: offered {offered} req/s, achieved {result['achieved_rps']:.1f} req/s, "
+              f"p95 {result['latency_seconds']['p95'] * 1000:.0f}ms, "
+              f"queueing p95 {result['queueing_seconds']['dispatch_p95'] * 1000:.0f}ms dispatch / "
+              f"{result['queueing_seconds']['thread_p95'] * 1000:.0f}ms thread, "
+              f"{result['errors']} errors, "
+              f"{result['memory']['bytes_per_request_mean']:.0f} B/request per thread")
+
+    results = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "recorded": {"requests": len(records), "threads": len({record["thread_id"] for record in records}),
+                     "span_seconds": records[-1]["ts"] - records[0]["ts"]},
+        "runs": runs,
+        "saturated_at": saturation(runs),
+    }
+    with open(args.out, "w", encoding="utf-8") as handle:
+        json.dump(results, handle, indent=2)
+    saturated = results["saturated_at"]
+    print(f" Saturated at x{saturated['speed']} ({', '.join(saturated['reasons'])})" if saturated
+          else " No saturation within the speeds tried")
+    print(f" Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Startup-time benchmark: import and initialization cost of the CLI and the
+orchestrator, each phase measured in a fresh interpreter. Run from src/:
+    python -m benchmarks.startup_bench --repeat 5 --out startup.json
+
+Phases:
+    import_main            import main (what the CLI pays before parsing args)
+    import_orchestrator    import workflow.orchestrator
+    construct              WorkFlowOrchestrator() with the default (lazy) Gemini client
+    construct_second       another instance in the same process
+    warm_up                compile the graph and create the Gemini client
+    first_request          construct + first request against FakeChatModel
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+from typing import Dict, List
+
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Each snippet prints the seconds spent in the phase being measured
+PHASES: Dict[str, str] = {
+    "import_main": """
+import time
+start = time.perf_counter()
+import main
+print(time.perf_counter() - start)
+""",
+    "import_orchestrator": """
+import time
+start = time.perf_counter()
+import workflow.orchestrator
+print(time.perf_counter() - start)
+""",
+    "construct": """
+import time
+from workflow.orchestrator import WorkFlowOrchestrator
+start = time.perf_counter()
+WorkFlowOrchestrator()
+print(time.perf_counter() - start)
+""",
+    "construct_second": """
+import time
+from workflow.orchestrator import WorkFlowOrchestrator
+WorkFlowOrchestrator().warm_up()
+start = time.perf_counter()
+WorkFlowOrchestrator().workflow
+print(time.perf_counter() - start)
+""",
+    "warm_up": """
+import time
+from workflow.orchestrator import WorkFlowOrchestrator
+orchestrator = WorkFlowOrchestrator()
+start = time.perf_counter()
+orchestrator.warm_up()
+print(time.perf_counter() - start)
+""",
+    "first_request": """
+import time
+start = time.perf_counter()
+from shared.fake_llm import FakeChatModel
+from workflow.orchestrator import WorkFlowOrchestrator
+WorkFlowOrchestrator(llm=FakeChatModel()).process_request("Describe the capital")
+print(time.perf_counter() - start)
+""",
+}
+
+
+def measure(snippet: str) -> float:
+    env = {**os.environ, "GOOGLE_API_KEY": os.environ.get("GOOGLE_API_KEY", "startup-bench")}
+    output = subprocess.run([sys.executable, "-c", snippet], cwd=SRC_DIR, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Measure import and initialization cost")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per phase")
+    parser.add_argument("--phases", nargs="*", choices=list(PHASES), default=list(PHASES))
+    parser.add_argument("--out", default="startup_results.json")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    results: Dict[str, Dict[str, float]] = {}
+    for phase in args.phases:
+        samples: List[float] = [measure(PHASES[phase]) for _ in range(args.repeat)]
+        results[phase] = {"median": statistics.median(samples), "min": min(samples), "max": max(samples)}
+        print(f" {phase:<22} median {results[phase]['median'] * 1000:8.1f}ms  min {results[phase]['min'] * 1000:8.1f}ms")
+
+    with open(args.out, "w", encoding="utf-8") as handle:
+        json.dump({
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "config": vars(args),
+            "seconds": results,
+        }, handle, indent=2)
+    print(f" Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,83 +1,261 @@
-"""
-Interactive Multi-Agent System with Gemini Integration
-Run with: python main.py
-
-This creates an interactive session where you can ask questions
-and see how the system routes them to different specialized agents.
-"""
-
-import os
-from dotenv import load_dotenv
-from workflow.orchestrator import WorkFlowOrchestrator
-
-def print_header():
-    print("\n" + "="*20)
-    print(" MULTI-AGENT INTELLIGENCE SYSTEM (Powered by Gemini)")
-    print("="*20)
-    print(
-        "This system analyzes your questions and routes them to specialized agents.\n"
-        "The system will show you which agent was selected and why.\n"
-        "Type 'quit' or 'exit' to end the session."
-    )
-    print("="*20)
-
-
-def print_response(result: dict, user_input: str):
-    """Render the agent decision and answer."""
-    print(f"\n YOUR Input: {user_input}")
-    print("-" * 20)
-    
-    agent_name = result['selected_agent'].replace('_', ' ').title()
-    print(f" SELECTED AGENT: {agent_name}")
-    print(f" ROUTING LOGIC: {result['reasoning']}")
-    print("-" * 50)
-    
-    print(f" RESPONSE:")
-    print(result['response'])
-    print("="*70)
-
-
-def main():
-    
-    load_dotenv()
-    if not os.getenv("GOOGLE_API_KEY"):
-        print("ERROR: Google API key not found!")
-        return
-    
-    print_header()
-    
-    try:
-        print("Initializing multi-agent system with Gemini...")
-        orchestrator = WorkFlowOrchestrator()  
-        print("System ready! Ask me anything.\n")
-        
-        
-        while True:
-            try:
-                user_input = input(" Your question: ").strip()
-                
-                if user_input.lower() in ['quit', 'exit', '']:
-                    print("\n Thanks for using the Multi-Agent System!")
-                    break
-                
-                # Process the request through the agent network
-                result = orchestrator.process_request(user_input, thread_id=1)
-                print("-" * 70)
-                print("Answering your question...\n")
-                print_response(result, user_input)
-                print("-" * 70)
-                
-            except KeyboardInterrupt:
-                print("\n\n Session ended by user. Goodbye!")
-                break
-            except Exception as e:
-                print(f"\n Error processing request: {str(e)}")
-                print("Please try again with a different question.\n")
-                
-    except Exception as e:
-        print(f" Failed to initialize system: {str(e)}")
-        print("Please check your API key and internet connection.")
-
-if __name__ == "__main__":
-
-    main()
+"""
+Interactive Multi-Agent System with Gemini Integration
+Run with: python main.py
+Serve many sessions over TCP with: python main.py --serve --port 8765
+Spread them over worker processes with: python main.py --serve --shards 4
+Generate worlds from a file of prompts with: python main.py --batch seeds.jsonl --batch-out worlds.jsonl
+Keep every answer and world section in an archive with: python main.py --archive world.archive
+
+This creates an interactive session where you can ask questions
+and see how the system routes them to different specialized agents.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import threading
+from typing import TYPE_CHECKING, Optional
+from dotenv import load_dotenv
+
+if TYPE_CHECKING:
+    # imported inside main() so --help and argument errors return immediately
+    from workflow.orchestrator import WorkFlowOrchestrator
+
+def print_header():
+    print("\n" + "="*20)
+    print(" MULTI-AGENT INTELLIGENCE SYSTEM (Powered by Gemini)")
+    print("="*20)
+    print(
+        "This system analyzes your questions and routes them to specialized agents.\n"
+        "The system will show you which agent was selected and why.\n"
+        "Type 'world <premise>' to build a full world document, 'revise <section>: <request>'\n"
+        "to change one section and update only what depends on it, 'new' for a fresh thread,\n"
+        "and 'quit' or 'exit' to end the session."
+    )
+    print("="*20)
+
+
+def print_response(result: dict, user_input: str):
+    """Render the agent decision and answer."""
+    print(f"\n YOUR Input: {user_input}")
+    print("-" * 20)
+    
+    agent_name = " + ".join(result['selected_agents']).replace('_', ' ').title()
+    print(f" SELECTED AGENT: {agent_name}")
+    print(f" ROUTING LOGIC: {result['reasoning']}")
+    print("-" * 50)
+    
+    print(f" RESPONSE:")
+    print(result['response'])
+    print("="*70)
+
+
+def print_world(result: dict):
+    """Render a world document and what the last build or revision cost."""
+    print(f"\n WORLD: {result['premise']}")
+    for section, content in result["sections"].items():
+        print("-" * 50)
+        marker = " (your edit)" if section in result["edited"] else ""
+        print(f" {section.removesuffix('Agent').upper()}{marker}")
+        print(content)
+    print("-" * 50)
+    print(f" Regenerated: {', '.join(result['regenerated']) or 'nothing'}; "
+          f"reused: {', '.join(result['reused']) or 'nothing'}")
+    print("=" * 70)
+
+
+async def print_streamed_response(orchestrator: "WorkFlowOrchestrator", user_input: str, thread_id: int):
+    """Show the routing decision first, then the answer as it is generated."""
+    print(f"\n YOUR Input: {user_input}")
+    print("-" * 20)
+
+    async for event in orchestrator.astream_request(user_input, thread_id=thread_id):
+        if event["type"] == "route":
+            agent_name = " + ".join(event['selected_agents']).replace('_', ' ').title()
+            print(f" SELECTED AGENT: {agent_name}")
+            print(f" ROUTING LOGIC: {event['reasoning']}")
+            print("-" * 50)
+            print(f" RESPONSE:")
+        elif event["type"] == "chunk":
+            print(event["content"], end="", flush=True)
+        elif event["type"] == "done":
+            print("\n" + "="*70)
+
+
+async def interactive_session(orchestrator: "WorkFlowOrchestrator", stream: bool = True):
+    """Read prompts from stdin without blocking the event loop. "new" starts a fresh thread."""
+    thread_id = orchestrator.start_new_thread()
+    while True:
+        try:
+            user_input = (await asyncio.to_thread(input, " Your question: ")).strip()
+        except (KeyboardInterrupt, EOFError):
+            print("\n\n Session ended by user. Goodbye!")
+            break
+
+        if user_input.lower() in ['quit', 'exit', '']:
+            print("\n Thanks for using the Multi-Agent System!")
+            break
+
+        if user_input.lower() == 'new':
+            thread_id = orchestrator.start_new_thread()
+            continue
+
+        try:
+            command, _, rest = user_input.partition(" ")
+            if command.lower() == 'world' and rest:
+                print_world(await orchestrator.abuild_world(rest.strip(), thread_id=thread_id))
+                continue
+            if command.lower() == 'revise' and ":" in rest:
+                section, _, request = rest.partition(":")
+                print_world(await orchestrator.arevise_world(section, instruction=request.strip(),
+                                                             thread_id=thread_id))
+                continue
+
+            # Process the request through the agent network
+            if stream:
+                await print_streamed_response(orchestrator, user_input, thread_id)
+                continue
+
+            result = await orchestrator.aprocess_request(user_input, thread_id=thread_id)
+            print("-" * 70)
+            print("Answering your question...\n")
+            print_response(result, user_input)
+            print("-" * 70)
+
+        except Exception as e:
+            print(f"\n Error processing request: {str(e)}")
+            print("Please try again with a different question.\n")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Multi-agent fantasy world creator")
+    parser.add_argument("--serve", action="store_true", help="run the concurrent session server instead of the REPL")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--shards", type=int, default=1,
+                        help="with --serve, worker processes the threads are spread over")
+    parser.add_argument("--no-stream", action="store_true", help="print answers only once complete")
+    parser.add_argument("--max-llm-calls", type=int, default=16, help="cap on in-flight Gemini calls")
+    parser.add_argument("--selector-model", help="model used for routing (default: shared.models)")
+    parser.add_argument("--structured-routing", action="store_true",
+                        help="constrain the selector's reply to the routing JSON schema")
+    parser.add_argument("--batch-routing", action="store_true",
+                        help="route prompts arriving together with one selector call (for --serve/--batch)")
+    parser.add_argument("--agent-model", help="model the agents write with (default: shared.models)")
+    parser.add_argument("--max-threads", type=int, help="live conversation threads kept before LRU eviction")
+    parser.add_argument("--max-memory-mb", type=float, help="thread memory kept before LRU eviction")
+    parser.add_argument("--thread-idle-ttl", type=float, help="seconds before an idle thread is evicted")
+    parser.add_argument("--archive", help="append every answer and world section to this archive file")
+    parser.add_argument("--archive-compress", action="store_true", help="zstd-compress archived records")
+    parser.add_argument("--record-traffic", metavar="PATH",
+                        help="log every request for benchmarks.replay (.gz to compress)")
+    parser.add_argument("--log-level", default="WARNING", help="DEBUG, INFO, WARNING or ERROR")
+    parser.add_argument("--metrics-jsonl", help="append per-node/LLM/request metrics to this JSON-lines file")
+    parser.add_argument("--batch", metavar="IN_JSONL", help="generate worlds for every prompt in this JSONL file and exit")
+    parser.add_argument("--batch-out", default="batch_results.jsonl",
+                        help="batch results (and resume checkpoint), one JSON line per item")
+    parser.add_argument("--batch-pool", choices=["async", "thread"], default="async")
+    parser.add_argument("--workers", type=int, default=8, help="batch items in flight at once")
+    parser.add_argument("--rpm", type=float, help="batch LLM requests per minute")
+    parser.add_argument("--tpm", type=float, help="batch LLM tokens per minute")
+    return parser.parse_args()
+
+
+def build_orchestrator(args, shard: Optional[int] = None) -> "WorkFlowOrchestrator":
+    """
+    The orchestrator the command line asks for. With `shard`, it is one
+    worker of a sharded server: files get a per-shard suffix and the LLM
+    call cap is split between the workers.
+    """
+    from workflow.orchestrator import WorkFlowOrchestrator
+    from shared.archive import WorldArchive
+    from shared.metrics import HistogramSink, Instrumentation, JSONLinesSink
+    from shared.traffic import TrafficRecorder
+
+    def shard_path(path: str) -> str:
+        return path if shard is None else f"{path}.{shard}"
+
+    instrumentation = None
+    if args.metrics_jsonl:
+        instrumentation = Instrumentation([HistogramSink(), JSONLinesSink(shard_path(args.metrics_jsonl))])
+    model_configs = {}
+    if args.selector_model:
+        model_configs["selector"] = {"model": args.selector_model}
+    if args.agent_model:
+        model_configs["agent"] = {"model": args.agent_model}
+    # Hedged agent calls would interleave two token streams, so agents are
+    # only hedged when answers are not streamed
+    resilience_policies = {}
+    if args.batch or args.serve or args.no_stream:
+        resilience_policies["agent"] = {"hedge": True}
+    max_llm_calls = args.max_llm_calls if shard is None else -(-args.max_llm_calls // args.shards)
+    return WorkFlowOrchestrator(max_concurrent_llm_calls=max_llm_calls,
+                                instrumentation=instrumentation, model_configs=model_configs,
+                                resilience_policies=resilience_policies,
+                                structured_routing=args.structured_routing,
+                                batch_routing=args.batch_routing,
+                                archive=WorldArchive(shard_path(args.archive), compress=args.archive_compress)
+                                if args.archive else None,
+                                recorder=TrafficRecorder(shard_path(args.record_traffic)) if args.record_traffic else None,
+                                max_threads=args.max_threads, thread_idle_ttl=args.thread_idle_ttl,
+                                max_memory_bytes=int(args.max_memory_mb * 2**20) if args.max_memory_mb else None)
+
+
+def main():
+    
+    args = parse_args()
+    logging.basicConfig(level=args.log_level.upper(), format="%(levelname)s %(name)s: %(message)s")
+    load_dotenv()
+    if not os.getenv("GOOGLE_API_KEY"):
+        print("ERROR: Google API key not found!")
+        return
+    
+    print_header()
+    
+    if args.serve and args.shards > 1:
+        import functools
+        from workflow.sharding import ShardedServer
+        # each worker process builds its own orchestrator for its shard
+        server = ShardedServer(functools.partial(build_orchestrator, args), workers=args.shards,
+                               host=args.host, port=args.port)
+        try:
+            asyncio.run(server.serve_forever())
+        except KeyboardInterrupt:
+            print("\n\n Server stopped. Goodbye!")
+        return
+
+    try:
+        print("Initializing multi-agent system with Gemini...")
+        orchestrator = build_orchestrator(args)
+        # Compile the graph and create the Gemini client while the user types
+        threading.Thread(target=orchestrator.warm_up, name="warm-up", daemon=True).start()
+        print("System ready! Ask me anything.\n")
+                
+    except Exception as e:
+        print(f" Failed to initialize system: {str(e)}")
+        print("Please check your API key and internet connection.")
+        return
+
+    try:
+        if args.batch:
+            from workflow.batch import BatchRunner
+            runner = BatchRunner(orchestrator, workers=args.workers,
+                                 requests_per_minute=args.rpm, tokens_per_minute=args.tpm)
+            if args.batch_pool == "async":
+                stats = asyncio.run(runner.arun(args.batch, args.batch_out))
+            else:
+                stats = runner.run(args.batch, args.batch_out)
+            print(f" Batch done: {stats['completed']} completed, {stats['failed']} failed, "
+                  f"{stats['skipped']} already done. Results in {args.batch_out}")
+        elif args.serve:
+            from workflow.server import SessionServer
+            asyncio.run(SessionServer(orchestrator, args.host, args.port).serve_forever())
+        else:
+            asyncio.run(interactive_session(orchestrator, stream=not args.no_stream))
+    except KeyboardInterrupt:
+        print("\n\n Session ended by user. Goodbye!")
+
+if __name__ == "__main__":
+
+    main()
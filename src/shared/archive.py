@@ -0,0 +1,406 @@
+"""
+Append-only world archive.
+Every generated answer and world section can be appended to one segment
+file of length-prefixed records, each optionally zstd-compressed. A sidecar
+index of fixed-width entries (thread, offset, agent, kind) is loaded on open,
+and records are read through mmap, so fetching one thread's latest sections
+touches only those records, and analytics jobs can scan millions of records
+without parsing a JSON dump.
+
+Segment:  FILE_MAGIC, then per record: RECORD_HEADER + payload
+          (payload = JSON of the ArchiveRecord, zstd-compressed when flagged)
+Index:    INDEX_MAGIC, then INDEX_ENTRY per record, in segment order
+
+A record is indexed once per agent it names (a composite answer under each
+contributing agent). The index is written after its record, so a crash can
+only leave it behind the segment: the process that opens the archive for
+writing re-indexes the missing tail and cuts off a torn last record. Only
+one process may write at a time; readers (readonly=True) never write, and
+index a tail the index misses in memory only, up to the last complete record.
+
+Command line (from src/):
+    python -m shared.archive export world.archive out.jsonl [--thread 7]
+    python -m shared.archive import in.jsonl world.archive [--compress]
+    python -m shared.archive stats world.archive
+"""
+
+import argparse
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from typing_extensions import NotRequired, TypedDict
+
+FILE_MAGIC = b"WARCHIV1"
+INDEX_MAGIC = b"WAINDEX1"
+# record marker, payload length, CRC32 of the stored payload, thread id, flags
+RECORD_HEADER = struct.Struct("<4sIIqB")
+RECORD_MARKER = b"WREC"
+# thread id, record offset, agent and kind (UTF-8, NUL-padded)
+INDEX_ENTRY = struct.Struct("<qQ48s8s")
+MAX_AGENT_BYTES = 48
+MAX_KIND_BYTES = 8
+
+FLAG_ZSTD = 1
+
+
+class ArchiveRecord(TypedDict):
+    thread_id: int
+    agent: str  # responding agent(s) or world section
+    kind: str  # "response" or "section"
+    agents: NotRequired[List[str]]  # each agent of a composite answer, indexed separately
+    prompt: str
+    content: str
+    timestamp: str
+    edited: NotRequired[bool]  # world section written by the user
+    revision: NotRequired[int]  # world section revision
+
+
+def _index_key(text: str, size: int, field: str) -> bytes:
+    """
+    Raises:
+        ValueError: when the name does not fit its index field
+    """
+    key = text.encode("utf-8")
+    if not key or len(key) > size:
+        raise ValueError(f"Archive {field} must be 1 to {size} UTF-8 bytes: {text!r}")
+    return key
+
+
+def _index_names(record: ArchiveRecord) -> List[str]:
+    """The agents a record is indexed under."""
+    return list(dict.fromkeys(record.get("agents") or [record["agent"]]))
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError as e:
+        raise ImportError("zstd-compressed archives need the zstandard package (pip install zstandard)") from e
+    return zstandard
+
+
+class WorldArchive:
+    """
+    Segment file plus offset index at `path` and `path + ".idx"`.
+    Args:
+        path: Segment file; created if missing (unless readonly)
+        compress: Compress new records with zstd (reading compressed records
+            needs the zstandard package either way)
+        level: zstd compression level
+        readonly: Open for reading only: nothing is written or truncated,
+            so it is safe while another process appends
+    """
+
+    def __init__(self, path: str, compress: bool = False, level: int = 3, readonly: bool = False):
+        self.path = path
+        self.index_path = path + ".idx"
+        self.compress = compress
+        self.level = level
+        self.readonly = readonly
+        self._lock = threading.Lock()
+        # guards remapping, so readers never slice a closed map
+        self._map_lock = threading.Lock()
+        self._compressor = _zstd().ZstdCompressor(level=level) if compress and not readonly else None
+        self._decompressor = None
+
+        # offsets of every record, (offset, agents, kind) per thread and
+        # (offset, kind) per agent, in append order
+        self._offsets: List[int] = []
+        self._by_thread: Dict[int, List[Tuple[int, Tuple[str, ...], str]]] = {}
+        self._by_agent: Dict[str, List[Tuple[int, str]]] = {}
+        self._map: Optional[mmap.mmap] = None
+        self._mapped_size = 0
+        self._segment = self._index = None
+
+        if readonly:
+            self._check_magic(path, FILE_MAGIC)
+            if os.path.exists(self.index_path):
+                self._check_magic(self.index_path, INDEX_MAGIC)
+                self._load_index()
+        else:
+            self._segment = open(path, "a+b")
+            if self._segment.tell() == 0:
+                self._segment.write(FILE_MAGIC)
+                self._segment.flush()
+            self._index = open(self.index_path, "a+b")
+            if self._index.tell() == 0:
+                self._index.write(INDEX_MAGIC)
+                self._index.flush()
+            self._check_magic(path, FILE_MAGIC)
+            self._check_magic(self.index_path, INDEX_MAGIC)
+            self._load_index()
+        self.stats = {"appended": 0, "recovered": self._recover_tail()}
+
+    # Opening
+    @staticmethod
+    def _check_magic(path: str, magic: bytes) -> None:
+        with open(path, "rb") as handle:
+            if handle.read(len(magic)) != magic:
+                raise ValueError(f"{path} is not a world archive file")
+
+    def _load_index(self) -> None:
+        size = os.path.getsize(self.index_path) - len(INDEX_MAGIC)
+        size -= size % INDEX_ENTRY.size  # drop a torn last entry
+        if size > 0:
+            with open(self.index_path, "rb") as handle:
+                handle.seek(len(INDEX_MAGIC))
+                data = handle.read(size)
+            for thread_id, offset, agent, kind in INDEX_ENTRY.iter_unpack(data):
+                self._remember(thread_id, offset, agent.rstrip(b"\0").decode("utf-8", "ignore"),
+                               kind.rstrip(b"\0").decode("utf-8", "ignore"))
+        # rewrite without the torn entry so appends stay aligned
+        if not self.readonly and os.path.getsize(self.index_path) != len(INDEX_MAGIC) + max(size, 0):
+            self._index.truncate(len(INDEX_MAGIC) + max(size, 0))
+            self._index.seek(0, os.SEEK_END)
+
+    def _recover_tail(self) -> int:
+        """
+        Index the complete records the index missed. A writer also indexes
+        them on disk and cuts off a torn or damaged last record; a reader
+        just stops there, as it may be a record still being written.
+        Returns:
+            How many records were recovered
+        """
+        recovered = 0
+        end = os.path.getsize(self.path)
+        # from the last indexed record, which may lack some of its agents' entries
+        position = self._offsets[-1] if self._offsets else len(FILE_MAGIC)
+        while position < end:
+            record_end = self._record_end(position, end)
+            if record_end is None:
+                if not self.readonly:
+                    self._segment.truncate(position)
+                    self._segment.seek(0, os.SEEK_END)
+                break
+            record = self.read(position)
+            entries = self._by_thread.get(record["thread_id"]) or [(None, (), None)]
+            indexed = entries[-1][1] if entries[-1][0] == position else ()
+            missing = [agent for agent in _index_names(record) if agent not in indexed]
+            for agent in missing:
+                if self.readonly:
+                    self._remember(record["thread_id"], position, agent, record["kind"])
+                else:
+                    self._write_index(record["thread_id"], position, agent, record["kind"])
+            recovered += bool(missing) and not indexed
+            position = record_end
+        if not self.readonly:
+            self._index.flush()
+        return recovered
+
+    def _record_end(self, offset: int, end: Optional[int] = None) -> Optional[int]:
+        """End of the record at `offset`; None if it is torn or damaged."""
+        data = self._view(offset, RECORD_HEADER.size)
+        if len(data) < RECORD_HEADER.size:
+            return None
+        marker, length, crc, _, _ = RECORD_HEADER.unpack(data)
+        record_end = offset + RECORD_HEADER.size + length
+        if marker != RECORD_MARKER or (end is not None and record_end > end):
+            return None
+        if end is not None and zlib.crc32(self._view(offset + RECORD_HEADER.size, length)) != crc:
+            return None
+        return record_end
+
+    # Writing
+    def _remember(self, thread_id: int, offset: int, agent: str, kind: str) -> None:
+        """Add one index entry; entries of one record (one per agent) are consecutive."""
+        if self._offsets and offset <= self._offsets[-1]:
+            entries = self._by_thread.get(thread_id)
+            if offset < self._offsets[-1] or not entries or entries[-1][0] != offset or agent in entries[-1][1]:
+                return  # an entry indexed already
+            entries[-1] = (offset, entries[-1][1] + (agent,), kind)
+        else:
+            self._offsets.append(offset)
+            self._by_thread.setdefault(thread_id, []).append((offset, (agent,), kind))
+        self._by_agent.setdefault(agent, []).append((offset, kind))
+
+    def _write_index(self, thread_id: int, offset: int, agent: str, kind: str) -> None:
+        self._index.write(INDEX_ENTRY.pack(thread_id, offset, agent.encode("utf-8"), kind.encode("utf-8")))
+        self._remember(thread_id, offset, agent, kind)
+
+    def _encode(self, record: ArchiveRecord) -> bytes:
+        # validated before anything is written
+        for agent in _index_names(record):
+            _index_key(agent, MAX_AGENT_BYTES, "agent names")
+        _index_key(record["kind"], MAX_KIND_BYTES, "kinds")
+        payload = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        flags = 0
+        if self._compressor is not None:
+            payload, flags = self._compressor.compress(payload), FLAG_ZSTD
+        return RECORD_HEADER.pack(RECORD_MARKER, len(payload), zlib.crc32(payload), record["thread_id"], flags) + payload
+
+    def extend(self, records: List[ArchiveRecord]) -> List[int]:
+        """
+        Append records with one flush of each file.
+        Returns:
+            Their offsets
+        Raises:
+            ValueError: on a read-only archive, or an agent name or kind too
+                long for the index (nothing is written then)
+        """
+        if self.readonly:
+            raise ValueError(f"{self.path} is open read-only")
+        encoded = [self._encode(record) for record in records]
+        offsets = []
+        with self._lock:
+            offset = self._segment.tell()
+            for record, data in zip(records, encoded):
+                offsets.append(offset)
+                offset += len(data)
+            self._segment.write(b"".join(encoded))
+            self._segment.flush()
+            for record, offset in zip(records, offsets):
+                for agent in _index_names(record):
+                    self._write_index(record["thread_id"], offset, agent, record["kind"])
+            self._index.flush()
+            self.stats["appended"] += len(records)
+        return offsets
+
+    def append(self, record: ArchiveRecord) -> int:
+        return self.extend([record])[0]
+
+    # Reading
+    def _view(self, offset: int, length: int) -> bytes:
+        """Bytes of the segment through mmap, remapping once the file has grown."""
+        with self._map_lock:
+            if offset + length > self._mapped_size:
+                size = os.path.getsize(self.path)
+                if size > self._mapped_size:
+                    if self._map is not None:
+                        self._map.close()
+                    with open(self.path, "rb") as handle:
+                        self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+                    self._mapped_size = size
+            if self._map is None:
+                return b""
+            # a copy, so it outlives a later remap
+            return self._map[offset:offset + length]
+
+    def read(self, offset: int) -> ArchiveRecord:
+        """
+        The record at `offset`.
+        Raises:
+            ValueError: when there is no intact record there
+        """
+        marker, length, crc, _, flags = RECORD_HEADER.unpack(self._view(offset, RECORD_HEADER.size))
+        payload = self._view(offset + RECORD_HEADER.size, length)
+        if marker != RECORD_MARKER or zlib.crc32(payload) != crc:
+            raise ValueError(f"No intact archive record at offset {offset}")
+        if flags & FLAG_ZSTD:
+            if self._decompressor is None:
+                self._decompressor = _zstd().ZstdDecompressor()
+            payload = self._decompressor.decompress(payload)
+        return json.loads(payload)
+
+    def thread_ids(self) -> List[int]:
+        return list(self._by_thread)
+
+    def offsets(self, thread_id: Optional[int] = None, agent: Optional[str] = None,
+                kind: Optional[str] = None) -> List[int]:
+        """Offsets of the matching records, oldest first, from the index alone."""
+        if thread_id is not None:
+            return [offset for offset, agents, record_kind in self._by_thread.get(thread_id, [])
+                    if (agent is None or agent in agents) and (kind is None or record_kind == kind)]
+        if agent is not None:
+            return [offset for offset, record_kind in self._by_agent.get(agent, [])
+                    if kind is None or record_kind == kind]
+        return list(self._offsets)
+
+    def records(self, thread_id: Optional[int] = None, agent: Optional[str] = None,
+                kind: Optional[str] = None) -> Iterator[ArchiveRecord]:
+        for offset in self.offsets(thread_id, agent, kind):
+            yield self.read(offset)
+
+    def latest(self, thread_id: int, kind: str = "section") -> Dict[str, ArchiveRecord]:
+        """
+        The newest record per agent for the thread, e.g. its current world
+        sections; reads one record per agent. A composite answer counts for
+        each of its agents.
+        """
+        newest: Dict[str, int] = {}
+        for offset, agents, record_kind in self._by_thread.get(thread_id, []):
+            if record_kind == kind:
+                for agent in agents:
+                    newest[agent] = offset
+        records: Dict[int, ArchiveRecord] = {}
+        for offset in newest.values():
+            if offset not in records:
+                records[offset] = self.read(offset)
+        return {agent: records[offset] for agent, offset in newest.items()}
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    # Export / import
+    def export_jsonl(self, path: str, thread_id: Optional[int] = None) -> int:
+        """Write the matching records as JSON lines. Returns how many."""
+        count = 0
+        with open(path, "w", encoding="utf-8") as handle:
+            for record in self.records(thread_id):
+                handle.write(json.dumps(record, ensure_ascii=False) + "\n")
+                count += 1
+        return count
+
+    def import_jsonl(self, path: str, batch_size: int = 1000) -> int:
+        """Append every record of a JSON-lines file. Returns how many."""
+        count, batch = 0, []
+        with open(path, encoding="utf-8") as handle:
+            for line in handle:
+                if not line.strip():
+                    continue
+                batch.append(json.loads(line))
+                if len(batch) >= batch_size:
+                    count += len(self.extend(batch))
+                    batch = []
+        if batch:
+            count += len(self.extend(batch))
+        return count
+
+    def close(self) -> None:
+        with self._lock, self._map_lock:
+            if self._map is not None:
+                self._map.close()
+                self._map, self._mapped_size = None, 0
+            for handle in (self._segment, self._index):
+                if handle is not None:
+                    handle.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export, import or inspect a world archive")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="write the archive as JSON lines")
+    export.add_argument("archive")
+    export.add_argument("out")
+    export.add_argument("--thread", type=int, help="only this thread's records")
+    import_ = commands.add_parser("import", help="append JSON lines to an archive")
+    import_.add_argument("jsonl")
+    import_.add_argument("archive")
+    import_.add_argument("--compress", action="store_true", help="zstd-compress the imported records")
+    stats = commands.add_parser("stats", help="count records per kind")
+    stats.add_argument("archive")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        archive = WorldArchive(args.archive, readonly=True)
+        print(f" Exported {archive.export_jsonl(args.out, args.thread)} records to {args.out}")
+    elif args.command == "import":
+        archive = WorldArchive(args.archive, compress=args.compress)
+        print(f" Imported {archive.import_jsonl(args.jsonl)} records into {args.archive}")
+    else:
+        archive = WorldArchive(args.archive, readonly=True)
+        kinds: Dict[str, int] = {}
+        for entries in archive._by_thread.values():
+            for _, _, kind in entries:
+                kinds[kind] = kinds.get(kind, 0) + 1
+        print(f" {len(archive)} records, {len(archive.thread_ids())} threads, "
+              f"{os.path.getsize(args.archive)} bytes: {kinds}")
+    archive.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Response cache for LLM calls.
+With temperature 0 the same messages produce the same completion, so repeated
+requests can be answered without a network round trip.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Iterable, Optional, Tuple
+
+from shared.state import MemoryEntry
+
+
+def normalize_prompt(text: str) -> str:
+    """Case- and whitespace-insensitive form of a user prompt."""
+    return " ".join(text.lower().split())
+
+
+def memory_digest(entries: Iterable[MemoryEntry], summary: str = "", extra: Iterable[str] = ()) -> str:
+    """
+    Digest of a thread's memory window, summary and any other context lines
+    (e.g. retrieved entities); changes whenever any of them does.
+    """
+    digest = hashlib.sha256(summary.encode("utf-8"))
+    for line in extra:
+        digest.update(line.encode("utf-8"))
+        digest.update(b"\x02")
+    for entry in entries:
+        digest.update(entry["prompt"].encode("utf-8"))
+        digest.update(b"\x00")
+        digest.update(entry["response"].encode("utf-8"))
+        digest.update(b"\x01")
+    return digest.hexdigest()
+
+
+def make_cache_key(prompt: str, agent_name: str, system_prompt: str, memory: str = "", model: str = "") -> str:
+    """
+    Cache key for one LLM call.
+    Args:
+        prompt: The user's input, normalized before hashing
+        agent_name: Agent (or selector) making the call
+        system_prompt: The caller's system prompt; editing it invalidates old entries
+        memory: memory_digest() of the context window, empty if the call ignores memory
+        model: Model answering the call; switching a tier's model invalidates old entries
+    """
+    system_hash = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+    raw = json.dumps([normalize_prompt(prompt), agent_name, system_hash, memory, model])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache(ABC):
+    """
+    Interface all cache backends implement.
+    Values are the completion text; entries expire after `ttl` seconds and the
+    backend holds at most `max_entries`, evicting the least recently used.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = 3600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+
+    def _expires_at(self) -> Optional[float]:
+        return time.time() + self.ttl if self.ttl is not None else None
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        pass
+
+    @abstractmethod
+    def set(self, key: str, value: str) -> None:
+        pass
+
+    @abstractmethod
+    def clear(self) -> None:
+        pass
+
+
+class LRUCache(ResponseCache):
+    """In-process backend built on an OrderedDict."""
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = 3600.0):
+        super().__init__(max_entries, ttl)
+        self._entries: "OrderedDict[str, Tuple[str, Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                self.stats["misses"] += 1
+                return None
+
+            value, expires_at = item
+            if expires_at is not None and expires_at < time.time():
+                del self._entries[key]
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        with self._lock:
+            self._entries[key] = (value, self._expires_at())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCache(ResponseCache):
+    """On-disk backend; survives restarts and can be shared by processes on one box."""
+
+    def __init__(self, path: str = "response_cache.sqlite3", max_entries: int = 100_000,
+                 ttl: Optional[float] = 24 * 3600.0):
+        super().__init__(max_entries, ttl)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " expires_at REAL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed_at)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+
+            value, expires_at = row
+            if expires_at is not None and expires_at < now:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return None
+
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.stats["hits"] += 1
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, self._expires_at(), now)
+            )
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+            overflow = count - self.max_entries
+            if overflow > 0:
+                # drop expired rows first, then the least recently used
+                expired = self._conn.execute(
+                    "DELETE FROM responses WHERE expires_at IS NOT NULL AND expires_at < ?", (now,)
+                ).rowcount
+                self.stats["expired"] += expired
+                overflow -= expired
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY accessed_at ASC LIMIT ?)", (overflow,)
+                )
+                self.stats["evictions"] += overflow
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
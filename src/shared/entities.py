@@ -0,0 +1,354 @@
+"""
+World-entity index for retrieval-based consistency context.
+Named places, factions, figures and resources are extracted from every
+agent response and kept per thread in an inverted index (term -> entities).
+Agents then get only the entities relevant to the current prompt instead of
+whole past responses, so prompts stay small as a world grows.
+"""
+
+import math
+import re
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Set, Tuple
+
+from agents.router import tokenize
+from shared.state import WorldEntity
+
+
+# Head or title words that decide an entity's kind
+PLACE_WORDS = frozenset("""
+mountain peak range ridge river sea ocean lake bay coast isle island desert forest wood vale valley
+plain steppe marsh swamp fen city town village port harbor harbour citadel keep spire waste reach
+gate pass fall hill highland lowland expanse shore cliff canyon glacier tundra jungle delta sound
+strait cape crag basin gulf dune oasis capital road
+""".split())
+FACTION_WORDS = frozenset("""
+guild clan house order empire kingdom council tribe league brotherhood sisterhood company church
+cult dynasty republic confederacy covenant legion circle syndicate court senate assembly host
+throne realm union pact faith temple sept
+""".split())
+FIGURE_TITLES = frozenset("""
+king queen lord lady prince princess emperor empress archon priest priestess saint general captain
+duke duchess chancellor sultan khan oracle magister elder warlord baron baroness matriarch patriarch
+high grand sage prophet regent count countess sir dame
+""".split())
+RESOURCE_WORDS = frozenset("""
+ore iron silver gold salt silk spice glass stone steel timber wine crystal amber pearl grain dye
+incense metal resin oil leaf root herb copper tin jade ivory obsidian coal marble fur
+""".split())
+
+# Capitalized words that start sentences without naming anything
+_COMMON_CAPITALS = frozenset("""
+a an the in on at its it their there here this these those they he she we our his her
+beneath above below across along among amid around before after during from into over under
+within without where when while with yet but and or so as by for of to each every all some
+many most few no not now then once still only even also both either neither
+""".split())
+
+# Words that never make a description or query term useful for retrieval
+_STOPWORDS = _COMMON_CAPITALS | frozenset("""
+is are was were be been has have had do does did what which who whom whose why how tell describe
+me you your about more than that like can could would should will shall may might must
+""".split())
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+_WORD_RE = re.compile(r"[A-Za-z][A-Za-z'’-]*")
+_CONNECTORS = frozenset({"of", "the", "de", "du", "al", "el"})
+
+
+def _classify(words: List[str]) -> str:
+    lowered = [(tokenize(word) or [word.lower()])[0] for word in words]
+    if lowered[0] in FIGURE_TITLES:
+        return "figure"
+    if any(word in FACTION_WORDS for word in lowered):
+        return "faction"
+    if any(word in PLACE_WORDS for word in lowered):
+        return "place"
+    if any(word in RESOURCE_WORDS for word in lowered):
+        return "resource"
+    return "name"
+
+
+def _candidates(sentence: str) -> Iterable[Tuple[List[str], bool]]:
+    """
+    Runs of capitalized words (joined by of/the), with whether they start the
+    sentence. Punctuation between two words ends a run.
+    """
+    run: List[str] = []
+    run_start = 0
+    pending: List[str] = []  # connectors seen after a capitalized word
+    previous_end = 0
+    for index, match in enumerate(_WORD_RE.finditer(sentence)):
+        word = match.group()
+        if run and sentence[previous_end:match.start()].strip():
+            yield run, run_start == 0
+            run, pending = [], []
+        previous_end = match.end()
+        if word[0].isupper():
+            if not run:
+                run_start = index
+            run.extend(pending)
+            pending = []
+            run.append(word)
+        elif run and word.lower() in _CONNECTORS:
+            pending.append(word)
+        else:
+            if run:
+                yield run, run_start == 0
+            run, pending = [], []
+    if run:
+        yield run, run_start == 0
+
+
+def extract_entities(text: str, agent: str = "") -> List[WorldEntity]:
+    """
+    Heuristic named-entity extraction from one response.
+    A run of capitalized words is a name unless it is a lone common word
+    opening a sentence; the kind comes from title and head words.
+    """
+    found: Dict[str, WorldEntity] = {}
+    for sentence in _SENTENCE_RE.split(text.strip()):
+        for words, sentence_start in _candidates(sentence):
+            if sentence_start and words[0].lower() in _COMMON_CAPITALS:
+                words = words[1:]
+                while words and words[0].lower() in _CONNECTORS:
+                    words = words[1:]
+            if not words or (len(words) == 1 and sentence_start and words[0].lower() in _COMMON_CAPITALS):
+                continue
+            if len(words) == 1 and len(words[0]) < 3:
+                continue
+
+            name = " ".join(words)
+            key = name.lower()
+            if key in found:
+                found[key]["mentions"] += 1
+                continue
+            found[key] = WorldEntity(
+                name=name,
+                kind=_classify(words),
+                description=" ".join(sentence.split()[:40]),
+                mentions=1,
+                agent=agent
+            )
+    return list(found.values())
+
+
+def format_entity(entity: WorldEntity) -> str:
+    """One prompt line for an entity."""
+    return f"- {entity['name']} ({entity['kind']}): {entity['description']}"
+
+
+def _terms(entity: WorldEntity) -> Tuple[Set[str], Set[str]]:
+    """Index terms of an entity's name and of its description."""
+    name_terms = set(tokenize(entity["name"]))
+    description_terms = set(tokenize(entity["description"])) - name_terms
+    return name_terms, {term for term in description_terms if len(term) > 2 and term not in _STOPWORDS}
+
+
+def _query_terms(query: str) -> Set[str]:
+    return {term for term in tokenize(query) if term not in _STOPWORDS}
+
+
+def _rank(hits: Iterable[Tuple[str, str, bool]], total: int, mentions: Dict[str, int], limit: int) -> List[str]:
+    """
+    Rank entity keys from (entity key, term, matched in name) postings hits.
+    Rarer terms count more; matches in the name count triple.
+    """
+    hits = list(hits)
+    document_frequency: Dict[str, int] = {}
+    for _, term, _ in hits:
+        document_frequency[term] = document_frequency.get(term, 0) + 1
+
+    scores: Dict[str, float] = {}
+    for key, term, in_name in hits:
+        weight = math.log(1 + total / document_frequency[term])
+        scores[key] = scores.get(key, 0.0) + weight * (3.0 if in_name else 1.0)
+    ranked = sorted(scores, key=lambda key: (scores[key], mentions.get(key, 0)), reverse=True)
+    return ranked[:limit]
+
+
+class EntityIndex(ABC):
+    """
+    Interface all entity index backends implement.
+    Entities are keyed by thread and lowercased name; re-adding an entity
+    bumps its mention count and refreshes its description.
+    """
+
+    @abstractmethod
+    def add(self, thread_id: int, entities: List[WorldEntity]) -> None:
+        pass
+
+    @abstractmethod
+    def search(self, thread_id: int, query: str, limit: int = 8) -> List[WorldEntity]:
+        """The thread's entities most relevant to `query`, best first."""
+        pass
+
+    @abstractmethod
+    def entities(self, thread_id: int) -> List[WorldEntity]:
+        pass
+
+    @abstractmethod
+    def clear(self, thread_id: int) -> None:
+        pass
+
+    def unload(self, thread_id: int) -> None:
+        """
+        Drop what this process holds for the thread, e.g. when its session is
+        evicted; durable data is kept. Process-local indexes forget the thread.
+        """
+        pass
+
+    def count(self, thread_id: int) -> int:
+        return len(self.entities(thread_id))
+
+
+class InMemoryEntityIndex(EntityIndex):
+    """Process-local backend: per thread, an entity table and a postings dict."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entities: Dict[int, Dict[str, WorldEntity]] = {}
+        self._postings: Dict[int, Dict[str, Dict[str, bool]]] = {}  # term -> {entity key: in name}
+
+    def add(self, thread_id: int, entities: List[WorldEntity]) -> None:
+        with self._lock:
+            table = self._entities.setdefault(thread_id, {})
+            postings = self._postings.setdefault(thread_id, {})
+            for entity in entities:
+                key = entity["name"].lower()
+                known = table.get(key)
+                if known is not None:
+                    entity = {**entity, "kind": known["kind"], "mentions": known["mentions"] + entity["mentions"]}
+                table[key] = entity
+                name_terms, description_terms = _terms(entity)
+                for term in name_terms:
+                    postings.setdefault(term, {})[key] = True
+                for term in description_terms:
+                    postings.setdefault(term, {}).setdefault(key, False)
+
+    def search(self, thread_id: int, query: str, limit: int = 8) -> List[WorldEntity]:
+        with self._lock:
+            table = self._entities.get(thread_id)
+            if not table:
+                return []
+            postings = self._postings[thread_id]
+            hits = [(key, term, in_name)
+                    for term in _query_terms(query) if term in postings
+                    for key, in_name in postings[term].items()]
+            mentions = {key: entity["mentions"] for key, entity in table.items()}
+            return [table[key] for key in _rank(hits, len(table), mentions, limit)]
+
+    def entities(self, thread_id: int) -> List[WorldEntity]:
+        with self._lock:
+            return list(self._entities.get(thread_id, {}).values())
+
+    def clear(self, thread_id: int) -> None:
+        with self._lock:
+            self._entities.pop(thread_id, None)
+            self._postings.pop(thread_id, None)
+
+    def unload(self, thread_id: int) -> None:
+        self.clear(thread_id)
+
+
+class SQLiteEntityIndex(EntityIndex):
+    """Persistent backend; pairs with SQLiteMemoryStore and can share its database file."""
+
+    def __init__(self, path: str = "thread_memory.sqlite3"):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entities ("
+            " thread_id INTEGER NOT NULL,"
+            " key TEXT NOT NULL,"
+            " name TEXT NOT NULL,"
+            " kind TEXT NOT NULL,"
+            " description TEXT NOT NULL,"
+            " mentions INTEGER NOT NULL,"
+            " agent TEXT NOT NULL,"
+            " PRIMARY KEY (thread_id, key))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entity_postings ("
+            " thread_id INTEGER NOT NULL,"
+            " term TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " in_name INTEGER NOT NULL,"
+            " PRIMARY KEY (thread_id, term, key))"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def _entity(row) -> WorldEntity:
+        return WorldEntity(name=row[0], kind=row[1], description=row[2], mentions=row[3], agent=row[4])
+
+    def add(self, thread_id: int, entities: List[WorldEntity]) -> None:
+        with self._lock:
+            for entity in entities:
+                key = entity["name"].lower()
+                self._conn.execute(
+                    "INSERT INTO entities (thread_id, key, name, kind, description, mentions, agent)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)"
+                    " ON CONFLICT (thread_id, key) DO UPDATE SET"
+                    " description = excluded.description, mentions = mentions + excluded.mentions,"
+                    " agent = excluded.agent",
+                    (thread_id, key, entity["name"], entity["kind"], entity["description"],
+                     entity["mentions"], entity["agent"])
+                )
+                name_terms, description_terms = _terms(entity)
+                self._conn.executemany(
+                    "INSERT INTO entity_postings (thread_id, term, key, in_name) VALUES (?, ?, ?, 1)"
+                    " ON CONFLICT (thread_id, term, key) DO UPDATE SET in_name = 1",
+                    [(thread_id, term, key) for term in name_terms]
+                )
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO entity_postings (thread_id, term, key, in_name) VALUES (?, ?, ?, 0)",
+                    [(thread_id, term, key) for term in description_terms]
+                )
+            self._conn.commit()
+
+    def search(self, thread_id: int, query: str, limit: int = 8) -> List[WorldEntity]:
+        terms = sorted(_query_terms(query))
+        if not terms:
+            return []
+        placeholders = ",".join("?" * len(terms))
+        with self._lock:
+            (total,) = self._conn.execute(
+                "SELECT COUNT(*) FROM entities WHERE thread_id = ?", (thread_id,)
+            ).fetchone()
+            hits = self._conn.execute(
+                f"SELECT key, term, in_name FROM entity_postings WHERE thread_id = ? AND term IN ({placeholders})",
+                (thread_id, *terms)
+            ).fetchall()
+            if not hits:
+                return []
+            keys = sorted({row[0] for row in hits})
+            rows = self._conn.execute(
+                f"SELECT key, name, kind, description, mentions, agent FROM entities"
+                f" WHERE thread_id = ? AND key IN ({','.join('?' * len(keys))})",
+                (thread_id, *keys)
+            ).fetchall()
+        table = {row[0]: self._entity(row[1:]) for row in rows}
+        mentions = {key: entity["mentions"] for key, entity in table.items()}
+        ranked = _rank(((key, term, bool(in_name)) for key, term, in_name in hits), total, mentions, limit)
+        return [table[key] for key in ranked if key in table]
+
+    def entities(self, thread_id: int) -> List[WorldEntity]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT name, kind, description, mentions, agent FROM entities WHERE thread_id = ?", (thread_id,)
+            ).fetchall()
+        return [self._entity(row) for row in rows]
+
+    def clear(self, thread_id: int) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM entities WHERE thread_id = ?", (thread_id,))
+            self._conn.execute("DELETE FROM entity_postings WHERE thread_id = ?", (thread_id,))
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
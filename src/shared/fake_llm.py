@@ -0,0 +1,207 @@
+"""
+Offline stand-in for the Gemini chat model.
+Deterministic, network-free and configurable (latency, jitter, slow-call
+tail, error rate, scripted routing replies) so the orchestration overhead can be measured and
+regression-tested without an API key.
+"""
+
+import asyncio
+import hashlib
+import itertools
+import json
+import random
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+from agents.registry import AGENT_CLASSES
+
+
+_WORDS = (
+    "ancient river salt glass empire clan market ridge storm temple ember harbor "
+    "desert priest caravan frost valley spire oath crown forest tide ash guild"
+).split()
+
+
+class FakeLLMError(RuntimeError):
+    """Injected failure, raised with probability `error_rate`."""
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Local chat model.
+    Selector calls (system prompt asks for "selected_agent") get a JSON routing
+    reply, either from `routing_replies` in order or chosen by hashing the
+    prompt; batched selector calls get a JSON array with one such reply per
+    numbered request. Every other call gets `response_words` deterministic words.
+    """
+
+    latency: float = 0.0  # seconds per call
+    jitter: float = 0.0  # +/- seconds, uniform
+    tail_rate: float = 0.0  # fraction of calls that hit a provider hiccup...
+    tail_latency: float = 0.0  # ...and take this many seconds instead
+    error_rate: float = 0.0
+    routing_replies: List[str] = []  # raw selector replies, cycled; may be malformed on purpose
+    response_words: int = 70
+    seed: Optional[int] = 0
+
+    _rng: random.Random = PrivateAttr()
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _routing_cycle: Any = PrivateAttr(default=None)
+    _stats: dict = PrivateAttr(default_factory=lambda: {"calls": 0, "errors": 0, "llm_seconds": 0.0})
+
+    def model_post_init(self, __context: Any) -> None:
+        self._rng = random.Random(self.seed)
+        if self.routing_replies:
+            self._routing_cycle = itertools.cycle(self.routing_replies)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    @property
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._stats = {"calls": 0, "errors": 0, "llm_seconds": 0.0}
+
+    # Behaviour
+    @staticmethod
+    def _tier(run_manager) -> Optional[str]:
+        """The model role shared.models tagged the call with."""
+        return (run_manager.metadata or {}).get("tier") if run_manager is not None else None
+
+    def _delay(self, tier: Optional[str]) -> float:
+        """Seconds a call takes, before any tail stall. Called with self._lock held."""
+        return max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+
+    def _plan_call(self, tier: Optional[str] = None) -> Tuple[float, bool]:
+        with self._lock:
+            delay = self._delay(tier)
+            if self.tail_rate and self._rng.random() < self.tail_rate:
+                delay = self.tail_latency
+            failed = self._rng.random() < self.error_rate
+            self._stats["calls"] += 1
+            self._stats["llm_seconds"] += delay
+            if failed:
+                self._stats["errors"] += 1
+        return delay, failed
+
+    def _reply(self, messages: List[BaseMessage]) -> str:
+        system = next((m.content for m in messages if isinstance(m, SystemMessage)), "")
+        human = messages[-1].content if messages else ""
+        digest = hashlib.sha256(f"{system}\x00{human}".encode("utf-8")).digest()
+
+        if '"selected_agent"' in system and "JSON array" in system:
+            requests = [line for line in human.splitlines() if line[:1].isdigit()]
+            return "[" + ", ".join(self._routing_reply(system, request) for request in requests) + "]"
+        if '"selected_agent"' in system:
+            return self._routing_reply(system, human)
+
+        words = [_WORDS[digest[i % len(digest)] % len(_WORDS)] for i in range(self.response_words)]
+        return " ".join(words).capitalize() + "."
+
+    def _routing_reply(self, system: str, request: str) -> str:
+        if self._routing_cycle is not None:
+            with self._lock:
+                return next(self._routing_cycle)
+        digest = hashlib.sha256(f"{system}\x00{request}".encode("utf-8")).digest()
+        agent_names = list(AGENT_CLASSES)
+        agent = agent_names[digest[0] % len(agent_names)]
+        return json.dumps({"selected_agent": agent, "reasoning": "scripted by FakeChatModel"})
+
+    def _message(self, content: str, messages: List[BaseMessage]) -> AIMessage:
+        input_tokens = sum(len(str(m.content)) for m in messages) // 4
+        output_tokens = len(content) // 4
+        return AIMessage(content=content, usage_metadata={
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        })
+
+    # BaseChatModel hooks
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs: Any) -> ChatResult:
+        delay, failed = self._plan_call(self._tier(run_manager))
+        time.sleep(delay)
+        if failed:
+            raise FakeLLMError("injected failure")
+        return ChatResult(generations=[ChatGeneration(message=self._message(self._reply(messages), messages))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, **kwargs: Any) -> ChatResult:
+        delay, failed = self._plan_call(self._tier(run_manager))
+        await asyncio.sleep(delay)
+        if failed:
+            raise FakeLLMError("injected failure")
+        return ChatResult(generations=[ChatGeneration(message=self._message(self._reply(messages), messages))])
+
+    def _chunks(self, messages: List[BaseMessage]) -> List[AIMessageChunk]:
+        """Reply split into word chunks; the last one carries the usage metadata."""
+        reply = self._message(self._reply(messages), messages)
+        words = reply.content.split(" ")
+        chunks = [AIMessageChunk(content=word + " ") for word in words[:-1]]
+        chunks.append(AIMessageChunk(content=words[-1], usage_metadata=reply.usage_metadata))
+        return chunks
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        delay, failed = self._plan_call(self._tier(run_manager))
+        chunks = self._chunks(messages)
+        # a third of the latency before the first token, the rest spread over the tokens
+        time.sleep(delay / 3)
+        if failed:
+            raise FakeLLMError("injected failure")
+        for chunk in chunks:
+            time.sleep(2 * delay / 3 / len(chunks))
+            yield ChatGenerationChunk(message=chunk)
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        delay, failed = self._plan_call(self._tier(run_manager))
+        chunks = self._chunks(messages)
+        await asyncio.sleep(delay / 3)
+        if failed:
+            raise FakeLLMError("injected failure")
+        for chunk in chunks:
+            await asyncio.sleep(2 * delay / 3 / len(chunks))
+            yield ChatGenerationChunk(message=chunk)
+
+
+class ReplayChatModel(FakeChatModel):
+    """
+    Local stand-in for replaying recorded traffic (see shared.traffic): each
+    call takes a latency drawn from those recorded for its tier, or
+    `latency` +/- `jitter` for tiers the recording has none for.
+    """
+
+    tier_latencies: Dict[str, List[float]] = {}
+
+    @classmethod
+    def from_traffic(cls, records, **kwargs: Any) -> "ReplayChatModel":
+        """
+        Stand-in for a recorded log: its per-tier latencies, and answers as
+        long as the median recorded answer.
+        """
+        tier_latencies: Dict[str, List[float]] = {}
+        sizes = []
+        for record in records:
+            sizes.append(record["response_chars"])
+            for tier, seconds, _ in record["llm"]:
+                tier_latencies.setdefault(tier or "agent", []).append(seconds)
+        if sizes and "response_words" not in kwargs:
+            # generated words average about six characters with the space
+            kwargs["response_words"] = max(1, sorted(sizes)[len(sizes) // 2] // 6)
+        return cls(tier_latencies=tier_latencies, **kwargs)
+
+    def _delay(self, tier: Optional[str]) -> float:
+        recorded = self.tier_latencies.get(tier or "agent")
+        return self._rng.choice(recorded) if recorded else super()._delay(tier)
@@ -0,0 +1,48 @@
+"""
+Consistent hashing of thread IDs onto shards.
+Each shard owns `replicas` points on a 64-bit ring and a thread belongs to
+the first point at or after its own hash, so going from N to N+1 shards
+moves only about 1/(N+1) of the threads, all of them onto the new shard.
+"""
+
+import bisect
+import hashlib
+from typing import Dict, Iterable, List, Tuple
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Args:
+        shards: Shard numbers
+        replicas: Points per shard; more points spread threads more evenly
+    """
+
+    def __init__(self, shards: Iterable[int], replicas: int = 64):
+        self.shards = sorted(set(shards))
+        if not self.shards:
+            raise ValueError("A hash ring needs at least one shard")
+        self.replicas = replicas
+        points: List[Tuple[int, int]] = sorted(
+            (_hash(f"shard-{shard}-{replica}"), shard) for shard in self.shards for replica in range(replicas))
+        self._points = [point for point, _ in points]
+        self._owners = [shard for _, shard in points]
+
+    def shard_for(self, thread_id: int) -> int:
+        index = bisect.bisect(self._points, _hash(f"thread-{thread_id}"))
+        return self._owners[index % len(self._owners)]
+
+    def moves(self, other: "HashRing", thread_ids: Iterable[int]) -> Dict[int, Tuple[int, int]]:
+        """Thread -> (shard here, shard in `other`) for the threads that change shard."""
+        moves = {}
+        for thread_id in thread_ids:
+            source, target = self.shard_for(thread_id), other.shard_for(thread_id)
+            if source != target:
+                moves[thread_id] = (source, target)
+        return moves
+
+    def __len__(self) -> int:
+        return len(self.shards)
@@ -0,0 +1,168 @@
+"""
+Tolerant, incremental parsing of a JSON object out of streamed LLM text.
+The selector is asked for bare JSON, but replies sometimes come wrapped in a
+code fence, after a sentence of preamble, or with a trailing comma. The
+parser skips to the first "{", then reports each top-level field as soon as
+its value is complete, so a caller can act on "selected_agent" while
+"reasoning" is still being generated. Batched replies (a JSON array of such
+objects) are read one element at a time the same way.
+"""
+
+import json
+import re
+from typing import Any, Dict, List
+
+_TRAILING_COMMA = re.compile(r",\s*([\]}])")
+
+
+def _decode(raw: str) -> Any:
+    try:
+        return json.loads(raw)
+    except json.JSONDecodeError:
+        return json.loads(_TRAILING_COMMA.sub(r"\1", raw))
+
+
+class JSONObjectStream:
+    """
+    Incremental parser for the first JSON object in a text stream.
+    feed() returns the names of the top-level fields completed by that chunk;
+    completed values are in `fields`, and `done` is set once the object closes.
+    Values that cannot be decoded are skipped rather than raised.
+    """
+
+    def __init__(self):
+        self.fields: Dict[str, Any] = {}
+        self.done = False
+        self._buffer = ""
+        self._pos = 0
+        self._state = "seek"
+        self._key = ""
+        self._start = 0  # where the current key or value started in _buffer
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, text: str) -> List[str]:
+        self._buffer += text
+        completed: List[str] = []
+        buffer = self._buffer
+        while self._pos < len(buffer) and not self.done:
+            char = buffer[self._pos]
+            state = self._state
+
+            if state == "seek":
+                if char == "{":
+                    self._state = "key"
+            elif state == "key":
+                if char == '"':
+                    self._state, self._start, self._escaped = "key_string", self._pos, False
+                elif char == "}":
+                    self.done = True
+            elif state == "key_string":
+                if self._string_closed(char):
+                    self._key = buffer[self._start + 1:self._pos]
+                    self._state = "colon"
+            elif state == "colon":
+                if char == ":":
+                    self._state = "value"
+            elif state == "value":
+                if not char.isspace():
+                    self._start = self._pos
+                    if char == '"':
+                        self._state, self._escaped = "string_value", False
+                    elif char in "[{":
+                        self._state, self._depth, self._in_string = "nested_value", 1, False
+                    else:
+                        self._state = "literal_value"
+            elif state == "string_value":
+                if self._string_closed(char):
+                    self._complete(buffer[self._start:self._pos + 1], completed)
+            elif state == "nested_value":
+                if self._nested_closed(char):
+                    self._complete(buffer[self._start:self._pos + 1], completed)
+            elif state == "literal_value":
+                if char in ",}":
+                    self._complete(buffer[self._start:self._pos].strip(), completed)
+                    self.done = char == "}"
+            self._pos += 1
+        return completed
+
+    def _string_closed(self, char: str) -> bool:
+        if self._escaped:
+            self._escaped = False
+        elif char == "\\":
+            self._escaped = True
+        elif char == '"':
+            return True
+        return False
+
+    def _nested_closed(self, char: str) -> bool:
+        if self._in_string:
+            self._in_string = not self._string_closed(char)
+            return False
+        if char == '"':
+            self._in_string, self._escaped = True, False
+        elif char in "[{":
+            self._depth += 1
+        elif char in "]}":
+            self._depth -= 1
+        return self._depth == 0
+
+    def _complete(self, raw: str, completed: List[str]) -> None:
+        try:
+            key = json.loads(f'"{self._key}"')
+            self.fields[key] = _decode(raw)
+            completed.append(key)
+        except (json.JSONDecodeError, ValueError):
+            pass
+        self._state = "key"
+
+
+class JSONArrayStream:
+    """
+    Incremental parser for the objects of a streamed JSON array.
+    feed() returns the objects completed by that chunk. Anything between
+    objects (brackets, commas, prose) is skipped, and so is an element that
+    isn't an object. finish() returns the fields of a cut-off last object.
+    """
+
+    def __init__(self):
+        self.count = 0  # objects returned so far
+        self._current = JSONObjectStream()
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        objects: List[Dict[str, Any]] = []
+        self._current.feed(text)
+        while self._current.done:
+            parser = self._current
+            if parser.fields:
+                objects.append(parser.fields)
+                self.count += 1
+            self._current = JSONObjectStream()
+            self._current.feed(parser._buffer[parser._pos:])
+        return objects
+
+    def finish(self) -> List[Dict[str, Any]]:
+        if not self._current.fields:
+            return []
+        self.count += 1
+        return [self._current.fields]
+
+
+def parse_json_object(text: str) -> Dict[str, Any]:
+    """
+    The JSON object in `text`, tolerating fences, preamble and trailing commas.
+    Raises:
+        ValueError: when no field could be read
+    """
+    try:
+        value = json.loads(text)
+        if isinstance(value, dict):
+            return value
+    except json.JSONDecodeError:
+        pass
+    parser = JSONObjectStream()
+    parser.feed(text)
+    if not parser.fields:
+        raise ValueError("no JSON object found in reply")
+    return parser.fields
@@ -0,0 +1,38 @@
+"""
+Deferred construction of expensive objects.
+Creating the Gemini client imports google-genai and sets up its transport;
+short-lived CLI jobs and autoscaled workers should only pay for that once a
+request actually needs it.
+"""
+
+import threading
+from typing import Any, Callable
+
+
+class LazyLLM:
+    """
+    Stands in for a chat model and builds it on first use.
+    Attribute access (invoke, ainvoke, astream, ...) is forwarded to the real
+    client, so callers treat it like the model itself.
+    """
+
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+
+    @property
+    def built(self) -> bool:
+        return self._instance is not None
+
+    @property
+    def instance(self) -> Any:
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = self._factory()
+        return self._instance
+
+    def __getattr__(self, name: str) -> Any:
+        # only called for attributes LazyLLM itself doesn't define
+        return getattr(self.instance, name)
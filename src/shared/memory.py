@@ -0,0 +1,196 @@
+"""
+Thread memory stores.
+Each thread keeps a sliding window of its most recent MemoryEntry records.
+Stores load one thread's window at a time, so a worker never needs every
+user's history in RAM.
+"""
+
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Deque, Dict, List
+
+from shared.state import MemoryEntry
+
+
+class MemoryStore(ABC):
+    """
+    Interface all memory backends implement.
+    `window_size` is the number of entries kept per thread.
+    """
+
+    def __init__(self, window_size: int = 5):
+        self.window_size = window_size
+
+    @abstractmethod
+    def append(self, thread_id: int, entry: MemoryEntry) -> List[MemoryEntry]:
+        """
+        Add an entry to the thread's window.
+        Returns:
+            Entries that fell out of the window (oldest first)
+        """
+        pass
+
+    @abstractmethod
+    def window(self, thread_id: int) -> List[MemoryEntry]:
+        """The thread's current window, oldest first."""
+        pass
+
+    @abstractmethod
+    def get_summary(self, thread_id: int) -> str:
+        """Digest of the entries that have left the thread's window."""
+        pass
+
+    @abstractmethod
+    def set_summary(self, thread_id: int, summary: str) -> None:
+        pass
+
+    @abstractmethod
+    def clear(self, thread_id: int) -> None:
+        """Delete the thread's window and digest."""
+        pass
+
+    def unload(self, thread_id: int) -> None:
+        """
+        Drop what this process holds for the thread, e.g. when its session is
+        evicted; durable data is kept. Process-local stores forget the thread.
+        """
+        pass
+
+    @abstractmethod
+    def thread_ids(self) -> List[int]:
+        pass
+
+    def count(self, thread_id: int) -> int:
+        return len(self.window(thread_id))
+
+
+class InMemoryStore(MemoryStore):
+    """Process-local backend; each thread is a bounded deque."""
+
+    def __init__(self, window_size: int = 5):
+        super().__init__(window_size)
+        self._threads: Dict[int, Deque[MemoryEntry]] = {}
+        self._summaries: Dict[int, str] = {}
+
+    def append(self, thread_id: int, entry: MemoryEntry) -> List[MemoryEntry]:
+        entries = self._threads.get(thread_id)
+        if entries is None:
+            entries = self._threads[thread_id] = deque(maxlen=self.window_size)
+        evicted = [entries[0]] if len(entries) == self.window_size else []
+        entries.append(entry)
+        return evicted
+
+    def window(self, thread_id: int) -> List[MemoryEntry]:
+        return list(self._threads.get(thread_id, ()))
+
+    def get_summary(self, thread_id: int) -> str:
+        return self._summaries.get(thread_id, "")
+
+    def set_summary(self, thread_id: int, summary: str) -> None:
+        self._summaries[thread_id] = summary
+
+    def clear(self, thread_id: int) -> None:
+        self._threads.pop(thread_id, None)
+        self._summaries.pop(thread_id, None)
+
+    def unload(self, thread_id: int) -> None:
+        self.clear(thread_id)
+
+    def thread_ids(self) -> List[int]:
+        return list(self._threads)
+
+    def count(self, thread_id: int) -> int:
+        return len(self._threads.get(thread_id, ()))
+
+
+class SQLiteMemoryStore(MemoryStore):
+    """
+    Persistent backend. Several worker processes can share one database file;
+    rows that leave the window are deleted on append.
+    """
+
+    def __init__(self, path: str = "thread_memory.sqlite3", window_size: int = 5):
+        super().__init__(window_size)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS memory ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " thread_id INTEGER NOT NULL,"
+            " prompt TEXT NOT NULL,"
+            " responding_agent TEXT NOT NULL,"
+            " response TEXT NOT NULL,"
+            " timestamp TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS memory_thread ON memory(thread_id, id)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS summaries (thread_id INTEGER PRIMARY KEY, summary TEXT NOT NULL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def _entry(row) -> MemoryEntry:
+        return MemoryEntry(prompt=row[0], responding_agent=row[1], response=row[2], timestamp=row[3])
+
+    def append(self, thread_id: int, entry: MemoryEntry) -> List[MemoryEntry]:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO memory (thread_id, prompt, responding_agent, response, timestamp) VALUES (?, ?, ?, ?, ?)",
+                (thread_id, entry["prompt"], entry["responding_agent"], entry["response"], entry["timestamp"])
+            )
+            # rows older than the newest window_size fall out of the window
+            rows = self._conn.execute(
+                "SELECT id, prompt, responding_agent, response, timestamp FROM memory"
+                " WHERE thread_id = ? ORDER BY id DESC LIMIT -1 OFFSET ?",
+                (thread_id, self.window_size)
+            ).fetchall()
+            if rows:
+                self._conn.executemany("DELETE FROM memory WHERE id = ?", [(row[0],) for row in rows])
+            self._conn.commit()
+        return [self._entry(row[1:]) for row in reversed(rows)]
+
+    def window(self, thread_id: int) -> List[MemoryEntry]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT prompt, responding_agent, response, timestamp FROM memory"
+                " WHERE thread_id = ? ORDER BY id DESC LIMIT ?",
+                (thread_id, self.window_size)
+            ).fetchall()
+        return [self._entry(row) for row in reversed(rows)]
+
+    def get_summary(self, thread_id: int) -> str:
+        with self._lock:
+            row = self._conn.execute("SELECT summary FROM summaries WHERE thread_id = ?", (thread_id,)).fetchone()
+        return row[0] if row else ""
+
+    def set_summary(self, thread_id: int, summary: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO summaries (thread_id, summary) VALUES (?, ?)", (thread_id, summary)
+            )
+            self._conn.commit()
+
+    def clear(self, thread_id: int) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM memory WHERE thread_id = ?", (thread_id,))
+            self._conn.execute("DELETE FROM summaries WHERE thread_id = ?", (thread_id,))
+            self._conn.commit()
+
+    def thread_ids(self) -> List[int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT DISTINCT thread_id FROM memory").fetchall()
+        return [row[0] for row in rows]
+
+    def count(self, thread_id: int) -> int:
+        with self._lock:
+            (count,) = self._conn.execute(
+                "SELECT COUNT(*) FROM memory WHERE thread_id = ?", (thread_id,)
+            ).fetchone()
+        return min(count, self.window_size)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
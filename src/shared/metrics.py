@@ -0,0 +1,302 @@
+"""
+Instrumentation for the LangGraph workflow.
+Records node wall time, LLM latency and token usage, and the routing path of
+each request, and forwards every event to one or more pluggable sinks.
+
+Event shapes:
+    {"event": "node", "node": ..., "seconds": ...}
+    {"event": "llm", "node": ..., "model": ..., "tier": ..., "seconds": ..., "input_tokens": ...,
+     "output_tokens": ..., "cost_usd": ...}
+    {"event": "llm_error", "node": ..., "model": ..., "tier": ..., "seconds": ..., "error": ...}
+
+"tier" is the model role (selector, agent, ...) from shared.models; "cost_usd"
+is computed from that tier's prices and is None when they are unknown.
+    {"event": "request", "seconds": ..., "routing_path": ..., "selected_agent": ..., "parse_fallback": ...}
+"""
+
+import bisect
+import json
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+
+# Latency buckets in seconds, Prometheus-style upper bounds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class MetricsSink(ABC):
+    """Receives instrumentation events."""
+
+    @abstractmethod
+    def record(self, event: Dict[str, Any]) -> None:
+        pass
+
+
+class _Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def quantile(self, q: float) -> float:
+        """Upper bucket bound holding the q-th observation."""
+        if not self.count:
+            return 0.0
+        target, seen = q * self.count, 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+
+class HistogramSink(MetricsSink):
+    """
+    In-memory aggregation: latency histograms per node / LLM node / model tier,
+    token and cost counters, routing-path and fallback counters.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self.node_seconds: Dict[str, _Histogram] = {}
+        self.llm_seconds: Dict[str, _Histogram] = {}
+        self.tier_seconds: Dict[str, _Histogram] = {}
+        self.tier_usage: Dict[str, Dict[str, float]] = {}
+        self.request_seconds = _Histogram(buckets)
+        self.tokens: Dict[str, Dict[str, int]] = {}
+        self.llm_errors: Dict[str, int] = {}
+        self.routing_paths: Dict[str, int] = {}
+        self.parse_fallbacks = 0
+
+    def _histogram(self, table: Dict[str, _Histogram], key: str) -> _Histogram:
+        if key not in table:
+            table[key] = _Histogram(self.buckets)
+        return table[key]
+
+    def record(self, event: Dict[str, Any]) -> None:
+        kind = event.get("event")
+        with self._lock:
+            if kind == "node":
+                self._histogram(self.node_seconds, event["node"]).observe(event["seconds"])
+            elif kind == "llm":
+                node = event.get("node") or "unknown"
+                self._histogram(self.llm_seconds, node).observe(event["seconds"])
+                tokens = self.tokens.setdefault(node, {"input": 0, "output": 0})
+                tokens["input"] += event.get("input_tokens") or 0
+                tokens["output"] += event.get("output_tokens") or 0
+                tier = event.get("tier") or "unknown"
+                self._histogram(self.tier_seconds, tier).observe(event["seconds"])
+                usage = self.tier_usage.setdefault(tier, {"calls": 0, "input_tokens": 0, "output_tokens": 0,
+                                                          "cost_usd": 0.0})
+                usage["calls"] += 1
+                usage["input_tokens"] += event.get("input_tokens") or 0
+                usage["output_tokens"] += event.get("output_tokens") or 0
+                usage["cost_usd"] += event.get("cost_usd") or 0.0
+            elif kind == "llm_error":
+                node = event.get("node") or "unknown"
+                self.llm_errors[node] = self.llm_errors.get(node, 0) + 1
+            elif kind == "request":
+                self.request_seconds.observe(event["seconds"])
+                path = event.get("routing_path") or "unknown"
+                self.routing_paths[path] = self.routing_paths.get(path, 0) + 1
+                if event.get("parse_fallback"):
+                    self.parse_fallbacks += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Plain-dict summary with mean and p50/p95/p99 bucket bounds."""
+        def summary(hist: _Histogram) -> Dict[str, float]:
+            return {
+                "count": hist.count,
+                "mean": hist.total / hist.count if hist.count else 0.0,
+                "p50": hist.quantile(0.50),
+                "p95": hist.quantile(0.95),
+                "p99": hist.quantile(0.99),
+            }
+
+        with self._lock:
+            return {
+                "requests": summary(self.request_seconds),
+                "nodes": {name: summary(hist) for name, hist in self.node_seconds.items()},
+                "llm": {name: summary(hist) for name, hist in self.llm_seconds.items()},
+                "tokens": {name: dict(tokens) for name, tokens in self.tokens.items()},
+                "tiers": {tier: {**summary(hist), **self.tier_usage[tier]}
+                          for tier, hist in self.tier_seconds.items()},
+                "llm_errors": dict(self.llm_errors),
+                "routing_paths": dict(self.routing_paths),
+                "parse_fallbacks": self.parse_fallbacks,
+            }
+
+
+class PrometheusSink(HistogramSink):
+    """HistogramSink that can render the Prometheus text exposition format."""
+
+    def __init__(self, prefix: str = "worldgen", buckets=DEFAULT_BUCKETS):
+        super().__init__(buckets)
+        self.prefix = prefix
+
+    def _histogram_lines(self, name: str, label: str, table: Dict[str, _Histogram]) -> List[str]:
+        lines = [f"# TYPE {name} histogram"]
+        for key, hist in sorted(table.items()):
+            cumulative = 0
+            for bound, count in zip(hist.buckets, hist.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{label}="{key}",le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{label}="{key}",le="+Inf"}} {hist.count}')
+            lines.append(f'{name}_sum{{{label}="{key}"}} {hist.total}')
+            lines.append(f'{name}_count{{{label}="{key}"}} {hist.count}')
+        return lines
+
+    def exposition(self) -> str:
+        p = self.prefix
+        with self._lock:
+            lines = self._histogram_lines(f"{p}_node_seconds", "node", self.node_seconds)
+            lines += self._histogram_lines(f"{p}_llm_seconds", "node", self.llm_seconds)
+            lines += self._histogram_lines(f"{p}_llm_tier_seconds", "tier", self.tier_seconds)
+            lines += self._histogram_lines(f"{p}_request_seconds", "scope", {"all": self.request_seconds})
+
+            lines.append(f"# TYPE {p}_llm_tokens_total counter")
+            for node, tokens in sorted(self.tokens.items()):
+                for direction, value in tokens.items():
+                    lines.append(f'{p}_llm_tokens_total{{node="{node}",direction="{direction}"}} {value}')
+
+            lines.append(f"# TYPE {p}_llm_cost_usd_total counter")
+            for tier, usage in sorted(self.tier_usage.items()):
+                lines.append(f'{p}_llm_cost_usd_total{{tier="{tier}"}} {usage["cost_usd"]}')
+
+            lines.append(f"# TYPE {p}_llm_errors_total counter")
+            for node, value in sorted(self.llm_errors.items()):
+                lines.append(f'{p}_llm_errors_total{{node="{node}"}} {value}')
+
+            lines.append(f"# TYPE {p}_routing_total counter")
+            for path, value in sorted(self.routing_paths.items()):
+                lines.append(f'{p}_routing_total{{path="{path}"}} {value}')
+
+            lines.append(f"# TYPE {p}_routing_parse_fallbacks_total counter")
+            lines.append(f"{p}_routing_parse_fallbacks_total {self.parse_fallbacks}")
+        return "\n".join(lines) + "\n"
+
+
+class JSONLinesSink(MetricsSink):
+    """Appends every event as one JSON object per line."""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._handle = open(path, "a", encoding="utf-8")
+
+    def record(self, event: Dict[str, Any]) -> None:
+        line = json.dumps({"ts": time.time(), **event}, default=str)
+        with self._lock:
+            self._handle.write(line + "\n")
+            self._handle.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._handle.close()
+
+
+def _cost(metadata: Dict[str, Any], usage: Dict[str, int]) -> Optional[float]:
+    """USD cost of one call from the tier's per-million-token prices."""
+    if "input_cost_per_mtok" not in metadata or not usage:
+        return None
+    return ((usage.get("input_tokens") or 0) * metadata["input_cost_per_mtok"]
+            + (usage.get("output_tokens") or 0) * metadata.get("output_cost_per_mtok", 0.0)) / 1_000_000
+
+
+class LLMCallbackHandler(BaseCallbackHandler):
+    """
+    Times chat model calls and reads token usage from the response metadata.
+    The graph node is taken from LangGraph's run metadata, the tier and its
+    prices from the metadata shared.models attaches to each client.
+    """
+
+    def __init__(self, instrumentation: "Instrumentation"):
+        self.instrumentation = instrumentation
+        self._lock = threading.Lock()
+        self._runs: Dict[UUID, tuple] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, metadata: Optional[dict] = None,
+                            **kwargs: Any) -> None:
+        metadata = metadata or {}
+        model = (metadata.get("ls_model_name") or (serialized or {}).get("name") or "unknown")
+        with self._lock:
+            self._runs[run_id] = (time.perf_counter(), metadata.get("langgraph_node"), model, metadata)
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            start = self._runs.pop(run_id, None)
+        if start is None:
+            return
+        started_at, node, model, metadata = start
+
+        usage: Dict[str, int] = {}
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                if message is not None and getattr(message, "usage_metadata", None):
+                    usage = message.usage_metadata
+        self.instrumentation.emit({
+            "event": "llm",
+            "node": node,
+            "model": model,
+            "tier": metadata.get("tier"),
+            "seconds": time.perf_counter() - started_at,
+            "input_tokens": usage.get("input_tokens"),
+            "output_tokens": usage.get("output_tokens"),
+            "cost_usd": _cost(metadata, usage),
+        })
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        if isinstance(error, GeneratorExit) and kwargs.get("response") is not None:
+            # the caller stopped reading a stream it had enough of (the selector does); not a failure
+            self.on_llm_end(kwargs["response"], run_id=run_id)
+            return
+        with self._lock:
+            start = self._runs.pop(run_id, None)
+        if start is None:
+            return
+        started_at, node, model, metadata = start
+        self.instrumentation.emit({
+            "event": "llm_error",
+            "node": node,
+            "model": model,
+            "tier": metadata.get("tier"),
+            "seconds": time.perf_counter() - started_at,
+            "error": type(error).__name__,
+        })
+
+
+class Instrumentation:
+    """
+    Fans events out to sinks and provides the node timer and LLM callback
+    the orchestrator installs.
+    """
+
+    def __init__(self, sinks: Optional[List[MetricsSink]] = None):
+        self.sinks = sinks if sinks is not None else [HistogramSink()]
+        self.callback = LLMCallbackHandler(self)
+
+    def emit(self, event: Dict[str, Any]) -> None:
+        for sink in self.sinks:
+            sink.record(event)
+
+    @contextmanager
+    def node_timer(self, name: str):
+        """Record the wall time of the enclosed block as node `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.emit({"event": "node", "node": name, "seconds": time.perf_counter() - start})
@@ -0,0 +1,149 @@
+"""
+Per-role model configuration and client pools.
+Routing only needs a short JSON answer from a cheap model, while agents
+write ~100-word paragraphs; each role gets its own model, output cap,
+timeout and temperature, and its own clients.
+
+Roles: "selector", "selector_batch" (micro-batched routing, see
+agents.routing_batcher), "agent", or an agent name (e.g. "LoreAgent") to
+override the agent tier for one agent.
+"""
+
+import itertools
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from typing_extensions import TypedDict
+
+from shared.lazy import LazyLLM
+
+
+class ModelConfig(TypedDict, total=False):
+    model: str
+    max_output_tokens: int
+    timeout: float  # seconds per call
+    temperature: float
+    response_schema: Dict[str, Any]  # JSON schema the reply is constrained to
+    input_cost_per_mtok: float  # USD per million input tokens, for instrumentation
+    output_cost_per_mtok: float
+
+
+# List prices at the time of writing; only used to report cost per tier
+DEFAULT_MODEL_CONFIGS: Dict[str, ModelConfig] = {
+    "selector": {
+        "model": "gemini-2.0-flash-lite",
+        "max_output_tokens": 128,  # {"selected_agent": ..., "reasoning": ...}
+        "timeout": 10.0,
+        "temperature": 0.0,
+        "input_cost_per_mtok": 0.075,
+        "output_cost_per_mtok": 0.30,
+    },
+    # model defaults to the selector's; room for one short decision per request
+    "selector_batch": {
+        "max_output_tokens": 1024,
+        "timeout": 20.0,
+        "temperature": 0.0,
+        "input_cost_per_mtok": 0.075,
+        "output_cost_per_mtok": 0.30,
+    },
+    "agent": {
+        "model": "gemini-2.0-flash",
+        "max_output_tokens": 256,  # prompts ask for ~70-100 words
+        "timeout": 30.0,
+        "temperature": 0.0,
+        "input_cost_per_mtok": 0.10,
+        "output_cost_per_mtok": 0.40,
+    },
+}
+
+
+def resolve_model_configs(overrides: Optional[Dict[str, ModelConfig]] = None,
+                          model_name: Optional[str] = None) -> Dict[str, ModelConfig]:
+    """
+    Defaults merged with per-role overrides. Agent-name roles inherit from
+    the agent tier, and batched routing uses the selector's model unless
+    given its own. `model_name` (the old single-model argument) sets the
+    agent tier's model.
+    """
+    configs = {role: dict(config) for role, config in DEFAULT_MODEL_CONFIGS.items()}
+    if model_name:
+        configs["agent"]["model"] = model_name
+    for role, config in (overrides or {}).items():
+        base = configs.get(role, configs["agent"])
+        configs[role] = {**base, **config}
+    configs["selector_batch"].setdefault("model", configs["selector"]["model"])
+    return configs
+
+
+def tier_metadata(tier: str, config: ModelConfig) -> Dict[str, Any]:
+    """Run metadata the instrumentation callback reads to attribute latency and cost."""
+    metadata: Dict[str, Any] = {"tier": tier}
+    for key in ("input_cost_per_mtok", "output_cost_per_mtok"):
+        if key in config:
+            metadata[key] = config[key]
+    return metadata
+
+
+def gemini_client(config: ModelConfig):
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    structured = {}
+    if config.get("response_schema"):
+        structured = {"response_mime_type": "application/json", "response_schema": config["response_schema"]}
+    return ChatGoogleGenerativeAI(
+        model = config["model"],
+        temperature = config.get("temperature", 0.0),
+        max_output_tokens = config.get("max_output_tokens"),
+        timeout = config.get("timeout"),
+        **structured,
+    )
+
+
+class ClientPool:
+    """
+    A role's chat model clients, handed out round-robin per call.
+    Each client is created on first use.
+    Args:
+        factory: Builds one client
+        size: Number of clients in the pool
+        model: Model name the clients serve, part of response cache keys
+    """
+
+    def __init__(self, factory: Callable[[], Any], size: int = 1, model: str = ""):
+        self.model = model
+        self._clients: List[LazyLLM] = [LazyLLM(factory) for _ in range(max(1, size))]
+        self._cycle = itertools.cycle(self._clients)
+        self._lock = threading.Lock()
+
+    def _next(self):
+        with self._lock:
+            return next(self._cycle).instance
+
+    def warm_up(self) -> None:
+        for client in self._clients:
+            client.instance
+
+    def invoke(self, *args, **kwargs):
+        return self._next().invoke(*args, **kwargs)
+
+    async def ainvoke(self, *args, **kwargs):
+        return await self._next().ainvoke(*args, **kwargs)
+
+    def stream(self, *args, **kwargs):
+        return self._next().stream(*args, **kwargs)
+
+    def astream(self, *args, **kwargs):
+        return self._next().astream(*args, **kwargs)
+
+
+def build_client_pool(tier: str, config: ModelConfig, llm=None, size: int = 1) -> ClientPool:
+    """
+    Client pool for one role. An injected `llm` (tests, benchmarks) is shared
+    as is, only tagged with the tier; otherwise Gemini clients are built
+    from `config` on first use.
+    """
+    metadata = tier_metadata(tier, config)
+    if llm is not None:
+        tagged = llm.with_config(metadata=metadata)
+        return ClientPool(lambda: tagged, size=1)
+    return ClientPool(lambda: gemini_client(config).with_config(metadata=metadata), size=size,
+                      model=config["model"])
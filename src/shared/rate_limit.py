@@ -0,0 +1,110 @@
+"""
+Requests-per-minute / tokens-per-minute limiter shared by concurrent workers.
+Each limit is a token bucket refilled continuously at limit/60 per second.
+Callers reserve an estimate up front and release it when done; actual usage
+is charged separately (see workflow.batch), so the bucket can briefly go
+negative and later callers wait it out.
+"""
+
+import asyncio
+import threading
+import time
+from typing import Optional
+
+
+class _Bucket:
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` is available; 0 when it is now."""
+        self._refill(now)
+        amount = min(amount, self.capacity)  # a request bigger than the bucket waits for a full one
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        self.level -= amount
+
+    def give(self, amount: float) -> None:
+        self.level = min(self.capacity, self.level + amount)
+
+
+class RateLimiter:
+    """
+    Shared RPM/TPM limiter, usable from threads and coroutines alike.
+    Args:
+        requests_per_minute: LLM calls allowed per minute, None for unlimited
+        tokens_per_minute: Input + output tokens allowed per minute, None for unlimited
+    """
+
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None):
+        self._lock = threading.Lock()
+        self._requests = _Bucket(requests_per_minute) if requests_per_minute else None
+        self._tokens = _Bucket(tokens_per_minute) if tokens_per_minute else None
+        self.stats = {"acquired": 0, "waited_seconds": 0.0}
+
+    def _try_acquire(self, requests: float, tokens: float) -> float:
+        """Reserve both amounts and return 0, or return how long to wait."""
+        with self._lock:
+            now = time.monotonic()
+            wait = 0.0
+            if self._requests is not None:
+                wait = max(wait, self._requests.wait_time(requests, now))
+            if self._tokens is not None:
+                wait = max(wait, self._tokens.wait_time(tokens, now))
+            if wait > 0:
+                return wait
+
+            if self._requests is not None:
+                self._requests.take(requests)
+            if self._tokens is not None:
+                self._tokens.take(tokens)
+            self.stats["acquired"] += 1
+            return 0.0
+
+    def acquire(self, requests: float = 1, tokens: float = 0) -> None:
+        """Block the calling thread until the reservation fits."""
+        while True:
+            wait = self._try_acquire(requests, tokens)
+            if not wait:
+                return
+            self._record_wait(wait)
+            time.sleep(wait)
+
+    async def aacquire(self, requests: float = 1, tokens: float = 0) -> None:
+        """Async version of acquire; waits without blocking the event loop."""
+        while True:
+            wait = self._try_acquire(requests, tokens)
+            if not wait:
+                return
+            self._record_wait(wait)
+            await asyncio.sleep(wait)
+
+    def release(self, requests: float = 0, tokens: float = 0) -> None:
+        """Return (part of) a reservation that was not used."""
+        with self._lock:
+            if self._requests is not None:
+                self._requests.give(requests)
+            if self._tokens is not None:
+                self._tokens.give(tokens)
+
+    def charge(self, requests: float = 0, tokens: float = 0) -> None:
+        """Deduct usage that happened outside a reservation."""
+        with self._lock:
+            if self._requests is not None:
+                self._requests.take(requests)
+            if self._tokens is not None:
+                self._tokens.take(tokens)
+
+    def _record_wait(self, seconds: float) -> None:
+        with self._lock:
+            self.stats["waited_seconds"] += seconds
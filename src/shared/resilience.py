@@ -0,0 +1,420 @@
+"""
+Deadlines, hedging, retries and circuit breaking around LLM calls.
+One ResilientCaller per model tier (see shared.models) wraps every upstream
+call of that tier:
+    - the whole call, retries included, must finish within `deadline`;
+      each attempt within `attempt_timeout`
+    - if an attempt is slower than the tier's recent p95 latency, a second
+      identical request is sent and whichever answers first wins; at most
+      `hedge_budget` of calls are hedged, and none while the LLM limiter is full
+    - failed attempts are retried with full-jitter exponential backoff
+    - after `failure_threshold` consecutive failures the tier's circuit
+      opens and calls fail fast for `reset_timeout` seconds, then a single
+      probe call decides whether it closes again
+"""
+
+import asyncio
+import contextvars
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from typing_extensions import TypedDict
+
+
+class ResiliencePolicy(TypedDict, total=False):
+    deadline: float  # seconds for the whole call, retries included
+    attempt_timeout: float  # seconds for one attempt (hedge included)
+    max_retries: int
+    backoff_base: float  # first retry waits up to this long, doubling per retry
+    backoff_max: float
+    hedge: bool
+    hedge_quantile: float  # hedge once an attempt is slower than this latency quantile
+    hedge_initial_delay: float  # used until enough latencies have been seen
+    hedge_min_delay: float
+    hedge_budget: float  # max fraction of calls that may send a hedge
+    failure_threshold: int  # consecutive failed attempts that open the circuit
+    reset_timeout: float  # seconds the circuit stays open before a probe
+
+
+# Agent calls are not hedged by default: a hedge would interleave a second
+# token stream into streamed answers, and agents are the expensive tier.
+# Turn it on for non-streaming use (batch, server)
+DEFAULT_RESILIENCE_POLICIES: Dict[str, ResiliencePolicy] = {
+    "selector": {
+        "deadline": 15.0,
+        "attempt_timeout": 6.0,
+        "max_retries": 2,
+        "backoff_base": 0.25,
+        "backoff_max": 2.0,
+        "hedge": True,
+        "hedge_quantile": 0.95,
+        "hedge_initial_delay": 2.0,
+        "hedge_min_delay": 0.05,
+        "hedge_budget": 0.1,
+        "failure_threshold": 5,
+        "reset_timeout": 30.0,
+    },
+    # one call routes a whole batch, so it gets longer and is not hedged
+    "selector_batch": {
+        "deadline": 25.0,
+        "attempt_timeout": 12.0,
+        "max_retries": 1,
+        "backoff_base": 0.25,
+        "backoff_max": 2.0,
+        "hedge": False,
+        "hedge_quantile": 0.95,
+        "hedge_initial_delay": 4.0,
+        "hedge_min_delay": 0.1,
+        "hedge_budget": 0.1,
+        "failure_threshold": 5,
+        "reset_timeout": 30.0,
+    },
+    "agent": {
+        "deadline": 60.0,
+        "attempt_timeout": 30.0,
+        "max_retries": 2,
+        "backoff_base": 0.5,
+        "backoff_max": 4.0,
+        "hedge": False,
+        "hedge_quantile": 0.95,
+        "hedge_initial_delay": 10.0,
+        "hedge_min_delay": 0.5,
+        "hedge_budget": 0.1,
+        "failure_threshold": 5,
+        "reset_timeout": 30.0,
+    },
+}
+
+# Latencies kept per tier for the hedge delay, and how many are needed before using them
+LATENCY_WINDOW = 200
+MIN_LATENCY_SAMPLES = 20
+
+
+class DeadlineExceeded(TimeoutError):
+    """An LLM call (or one attempt of it) ran out of time."""
+
+
+class CircuitOpenError(RuntimeError):
+    """The tier's circuit is open; the call was not sent."""
+
+
+def resolve_policies(overrides: Optional[Dict[str, ResiliencePolicy]] = None) -> Dict[str, ResiliencePolicy]:
+    """
+    Defaults merged with per-role overrides; agent-name roles inherit from the agent tier.
+    """
+    policies = {role: dict(policy) for role, policy in DEFAULT_RESILIENCE_POLICIES.items()}
+    for role, policy in (overrides or {}).items():
+        base = policies.get(role, policies["agent"])
+        policies[role] = {**base, **policy}
+    return policies
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure breaker: closed -> open -> half-open (one probe) -> closed.
+    Args:
+        failure_threshold: Consecutive failures that open the circuit
+        reset_timeout: Seconds before an open circuit lets a probe through
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self.opened = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def allow(self) -> bool:
+        """Whether a call may go upstream now."""
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                self._probing = False
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_abandoned(self) -> None:
+        """A call let through ended without an outcome (cancelled); a half-open circuit may probe again."""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self.opened += 1
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+
+class ResilientCaller:
+    """
+    Runs one tier's LLM calls under its ResiliencePolicy, from threads (`call`)
+    or coroutines (`acall`).
+    stats:
+        calls: logical calls made through the layer
+        attempts: requests sent upstream, hedges included
+        hedges: second requests sent for a slow attempt
+        hedge_wins: hedges that answered before the original
+        retries: attempts after a failed one
+        timeouts: attempts that hit attempt_timeout or the deadline
+        failures: calls that failed after all retries
+        short_circuits: calls refused because the circuit was open
+    Args:
+        policy: Deadline, retry, hedge and breaker settings
+        name: Tier name, used in errors and worker thread names
+    """
+
+    def __init__(self, policy: ResiliencePolicy, name: str = "llm"):
+        self.policy = {**DEFAULT_RESILIENCE_POLICIES["agent"], **policy}
+        self.name = name
+        self.breaker = CircuitBreaker(self.policy["failure_threshold"], self.policy["reset_timeout"])
+        self._lock = threading.Lock()
+        self._latencies: deque = deque(maxlen=LATENCY_WINDOW)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.stats = {"calls": 0, "attempts": 0, "hedges": 0, "hedge_wins": 0, "retries": 0,
+                      "timeouts": 0, "failures": 0, "short_circuits": 0}
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self.stats[key] += 1
+
+    def hedge_delay(self) -> Optional[float]:
+        """
+        Seconds after which a second request is sent, None when hedging is off.
+        """
+        if not self.policy["hedge"]:
+            return None
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < MIN_LATENCY_SAMPLES:
+            return self.policy["hedge_initial_delay"]
+        index = min(len(latencies) - 1, int(self.policy["hedge_quantile"] * len(latencies)))
+        return max(self.policy["hedge_min_delay"], latencies[index])
+
+    def _observe(self, seconds: float) -> None:
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def _may_hedge(self, limiter: Optional[asyncio.Semaphore] = None) -> bool:
+        # hedging a saturated endpoint only adds load; keep hedges within budget
+        if limiter is not None and limiter.locked():
+            return False
+        with self._lock:
+            return self.stats["hedges"] < self.policy["hedge_budget"] * self.stats["calls"]
+
+    def _admit(self) -> None:
+        if not self.breaker.allow():
+            self._count("short_circuits")
+            raise CircuitOpenError(f"{self.name} circuit is open")
+
+    def _backoff(self, retry: int) -> float:
+        # full jitter: spreads retries of many callers hit by the same hiccup
+        return random.uniform(0, min(self.policy["backoff_max"], self.policy["backoff_base"] * 2 ** retry))
+
+    def _attempt_window(self, deadline: float) -> float:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            self._count("timeouts")
+            raise DeadlineExceeded(f"{self.name} call exceeded its {self.policy['deadline']}s deadline")
+        return min(self.policy["attempt_timeout"], remaining)
+
+    def _retry_pause(self, retry: int, deadline: float) -> Optional[float]:
+        """Backoff before the next attempt, None when no attempt is left."""
+        if retry >= self.policy["max_retries"]:
+            return None
+        pause = self._backoff(retry)
+        if time.monotonic() + pause >= deadline:
+            return None
+        self._count("retries")
+        return pause
+
+    # Thread API
+    def call(self, func: Callable[[], Any]) -> Any:
+        """
+        Run func() with deadline, hedging, retries and the circuit breaker.
+        Attempts run on a small worker pool so a stuck request can be abandoned.
+        """
+        self._count("calls")
+        deadline = time.monotonic() + self.policy["deadline"]
+        retry = 0
+        while True:
+            self._admit()
+            try:
+                result = self._attempt(func, self._attempt_window(deadline))
+            except Exception as e:
+                self.breaker.record_failure()
+                pause = self._retry_pause(retry, deadline)
+                if pause is None:
+                    self._count("failures")
+                    raise e
+                retry += 1
+                time.sleep(pause)
+                continue
+            except BaseException:
+                # interrupted, not failed: don't leave a half-open probe taken
+                self.breaker.record_abandoned()
+                raise
+            self.breaker.record_success()
+            return result
+
+    def _submit(self, func: Callable[[], Any]) -> Future:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix=f"llm-{self.name}")
+        self._count("attempts")
+
+        def timed():
+            started = time.monotonic()
+            result = func()
+            self._observe(time.monotonic() - started)
+            return result
+
+        # run in a copy of the caller's context so LangChain callbacks (metrics, streaming) still fire
+        return self._executor.submit(contextvars.copy_context().run, timed)
+
+    def _attempt(self, func: Callable[[], Any], timeout: float) -> Any:
+        start = time.monotonic()
+        end = start + timeout
+        hedge_delay = self.hedge_delay()
+        hedge_pending = hedge_delay is not None and hedge_delay < timeout
+        futures = {self._submit(func): False}
+        error: Optional[BaseException] = None
+
+        while futures:
+            wait_until = min(end, start + hedge_delay) if hedge_pending else end
+            done, _ = wait(futures, timeout=max(0.0, wait_until - time.monotonic()), return_when=FIRST_COMPLETED)
+            for future in done:
+                hedged = futures.pop(future)
+                if future.exception() is None:
+                    if hedged:
+                        self._count("hedge_wins")
+                    for loser in futures:
+                        loser.cancel()
+                    return future.result()
+                error = future.exception()
+            if done:
+                continue
+            if hedge_pending and time.monotonic() < end:
+                hedge_pending = False
+                if self._may_hedge():
+                    self._count("hedges")
+                    futures[self._submit(func)] = True
+                continue
+            # abandoned requests finish on the worker pool; their results are dropped
+            self._count("timeouts")
+            raise DeadlineExceeded(f"{self.name} attempt timed out after {timeout:.1f}s")
+        raise error
+
+    # Async API
+    async def acall(self, afunc: Callable[[], Awaitable[Any]], limiter: Optional[asyncio.Semaphore] = None) -> Any:
+        """
+        Async version of call; slow or abandoned attempts are cancelled.
+        Each attempt, hedges included, holds a slot of `limiter` while it runs.
+        """
+        self._count("calls")
+        deadline = time.monotonic() + self.policy["deadline"]
+        retry = 0
+        while True:
+            self._admit()
+            try:
+                result = await self._aattempt(afunc, limiter, self._attempt_window(deadline))
+            except Exception as e:
+                self.breaker.record_failure()
+                pause = self._retry_pause(retry, deadline)
+                if pause is None:
+                    self._count("failures")
+                    raise e
+                retry += 1
+                await asyncio.sleep(pause)
+                continue
+            except BaseException:
+                # cancelled, not failed: don't leave a half-open probe taken
+                self.breaker.record_abandoned()
+                raise
+            self.breaker.record_success()
+            return result
+
+    def _start(self, afunc: Callable[[], Awaitable[Any]], limiter: Optional[asyncio.Semaphore]) -> asyncio.Task:
+        self._count("attempts")
+
+        async def timed():
+            async with limiter or nullcontext():
+                # latency is measured once the slot is held, so queueing doesn't inflate the hedge delay
+                started = time.monotonic()
+                result = await afunc()
+                self._observe(time.monotonic() - started)
+                return result
+
+        return asyncio.ensure_future(timed())
+
+    async def _aattempt(self, afunc: Callable[[], Awaitable[Any]], limiter: Optional[asyncio.Semaphore],
+                        timeout: float) -> Any:
+        start = time.monotonic()
+        end = start + timeout
+        hedge_delay = self.hedge_delay()
+        hedge_pending = hedge_delay is not None and hedge_delay < timeout
+        tasks = {self._start(afunc, limiter): False}
+        error: Optional[BaseException] = None
+
+        try:
+            while tasks:
+                wait_until = min(end, start + hedge_delay) if hedge_pending else end
+                done, _ = await asyncio.wait(tasks, timeout=max(0.0, wait_until - time.monotonic()),
+                                             return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    hedged = tasks.pop(task)
+                    if task.exception() is None:
+                        if hedged:
+                            self._count("hedge_wins")
+                        return task.result()
+                    error = task.exception()
+                if done:
+                    continue
+                if hedge_pending and time.monotonic() < end:
+                    hedge_pending = False
+                    if self._may_hedge(limiter):
+                        self._count("hedges")
+                        tasks[self._start(afunc, limiter)] = True
+                    continue
+                self._count("timeouts")
+                raise DeadlineExceeded(f"{self.name} attempt timed out after {timeout:.1f}s")
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counters plus the breaker state and current hedge delay."""
+        with self._lock:
+            stats = dict(self.stats)
+        return {**stats, "circuit": self.breaker.state, "circuit_opened": self.breaker.opened,
+                "hedge_delay": self.hedge_delay()}
@@ -0,0 +1,227 @@
+"""
+Conversation thread sessions.
+Allocates thread IDs, serializes requests within a thread, and bounds the
+memory held for threads: whole threads are evicted once idle for `idle_ttl`
+seconds, or least recently used first when there are more than
+`max_threads` of them or their memory exceeds `max_memory_bytes`. A thread
+with a request in flight is never evicted. A thread's memory is measured
+once when its session opens, then tracked from the byte deltas its owner
+reports (grow()).
+"""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+
+class _Session:
+    __slots__ = ("last_used", "bytes", "measured", "in_use", "lock", "alock")
+
+    def __init__(self, now: float):
+        self.last_used = now
+        self.bytes = 0
+        self.measured = False
+        self.in_use = 0
+        self.lock: Optional[threading.Lock] = None
+        self.alock: Optional[asyncio.Lock] = None
+
+
+class SessionManager:
+    """
+    Tracks every live thread in LRU order.
+    A thread is serialized separately for the sync API (hold) and the async
+    API (ahold); don't drive one thread through both at once.
+    Args:
+        on_evict: Drops an evicted thread's in-process memory; called without the
+            manager's lock, and off the event loop for async requests
+        measure: Bytes of memory a thread already holds, read once when its
+            session opens (e.g. threads in a persistent store)
+        max_threads: Live threads kept before LRU eviction (None for no limit)
+        max_memory_bytes: Total thread memory kept before LRU eviction (None for no limit)
+        idle_ttl: Seconds without a request before a thread is evicted (None to keep)
+        first_thread_id: First ID new_thread() hands out
+    """
+
+    def __init__(self, on_evict: Callable[[int], None], measure: Callable[[int], int],
+                 max_threads: Optional[int] = None, max_memory_bytes: Optional[int] = None,
+                 idle_ttl: Optional[float] = None, first_thread_id: int = 1):
+        self.on_evict = on_evict
+        self.measure = measure
+        self.max_threads = max_threads
+        self.max_memory_bytes = max_memory_bytes
+        self.idle_ttl = idle_ttl
+        self._next_id = first_thread_id
+        self._sessions: "OrderedDict[int, _Session]" = OrderedDict()
+        self._bytes = 0
+        # threads whose memory on_evict is forgetting; set once it is gone
+        self._evicting: Dict[int, threading.Event] = {}
+        self._lock = threading.Lock()
+        self.stats = {"allocated": 0, "opened": 0, "evicted_idle": 0, "evicted_lru": 0, "evicted_memory": 0}
+
+    def new_thread(self) -> int:
+        """A thread ID no other session has used."""
+        with self._lock:
+            thread_id = self._next_id
+            self._next_id += 1
+            self.stats["allocated"] += 1
+            return thread_id
+
+    def _acquire(self, thread_id: int) -> Optional[_Session]:
+        """The thread's session, marked in use; None while it is being evicted."""
+        with self._lock:
+            # IDs chosen by callers must not be handed out again
+            self._next_id = max(self._next_id, thread_id + 1)
+            if thread_id in self._evicting:
+                return None
+            now = time.monotonic()
+            session = self._sessions.get(thread_id)
+            if session is None:
+                session = self._sessions[thread_id] = _Session(now)
+                self.stats["opened"] += 1
+            else:
+                self._sessions.move_to_end(thread_id)
+                session.last_used = now
+            session.in_use += 1
+            return session
+
+    def _wait_evicted(self, thread_id: int) -> None:
+        with self._lock:
+            evicting = self._evicting.get(thread_id)
+        if evicting is not None:
+            evicting.wait()
+
+    def _measure(self, thread_id: int, session: _Session) -> None:
+        """Count what the thread held before its session opened; called holding the thread."""
+        if not session.measured:
+            session.measured = True
+            self.grow(thread_id, self.measure(thread_id))
+
+    def _release(self, session: _Session) -> List[int]:
+        """Returns the threads to forget (see _forget)."""
+        with self._lock:
+            session.in_use -= 1
+            session.last_used = time.monotonic()
+            return self._evict(session.last_used)
+
+    def _evict(self, now: float) -> List[int]:
+        """
+        Stop tracking sessions past the idle TTL or over the limits, oldest
+        first. Called with self._lock held; the caller passes the result to
+        _forget once it has released the lock. Until then the threads can't
+        be acquired again.
+        """
+        count, total = len(self._sessions), self._bytes
+        evicted = []
+        for thread_id, session in self._sessions.items():
+            if session.in_use:
+                continue
+            if self.idle_ttl is not None and now - session.last_used > self.idle_ttl:
+                reason = "evicted_idle"
+            elif self.max_threads is not None and count > self.max_threads:
+                reason = "evicted_lru"
+            elif self.max_memory_bytes is not None and total > self.max_memory_bytes:
+                reason = "evicted_memory"
+            else:
+                # the rest are newer: not idle, and the limits already hold
+                break
+            count -= 1
+            total -= session.bytes
+            evicted.append((thread_id, reason))
+
+        for thread_id, reason in evicted:
+            self._bytes -= self._sessions.pop(thread_id).bytes
+            self.stats[reason] += 1
+            self._evicting[thread_id] = threading.Event()
+        return [thread_id for thread_id, _ in evicted]
+
+    def _forget(self, thread_ids: List[int]) -> None:
+        for thread_id in thread_ids:
+            try:
+                self.on_evict(thread_id)
+            finally:
+                with self._lock:
+                    self._evicting.pop(thread_id).set()
+
+    @contextmanager
+    def hold(self, thread_id: int) -> Iterator[None]:
+        """Run one sync request on the thread, after any earlier one finishes."""
+        while (session := self._acquire(thread_id)) is None:
+            self._wait_evicted(thread_id)
+        try:
+            with self._lock:
+                if session.lock is None:
+                    session.lock = threading.Lock()
+            with session.lock:
+                self._measure(thread_id, session)
+                yield
+        finally:
+            self._forget(self._release(session))
+
+    @asynccontextmanager
+    async def ahold(self, thread_id: int) -> AsyncIterator[None]:
+        """Async version of hold; waiting doesn't block the event loop."""
+        while (session := self._acquire(thread_id)) is None:
+            await asyncio.to_thread(self._wait_evicted, thread_id)
+        try:
+            if session.alock is None:
+                session.alock = asyncio.Lock()
+            async with session.alock:
+                self._measure(thread_id, session)
+                yield
+        finally:
+            evicted = self._release(session)
+            if evicted:
+                await asyncio.to_thread(self._forget, evicted)
+
+    def grow(self, thread_id: int, delta: int) -> None:
+        """
+        Add `delta` bytes (negative when it shrank) to the memory tracked for
+        a thread. Call while holding the thread; limits apply on release.
+        """
+        with self._lock:
+            session = self._sessions.get(thread_id)
+            if session is not None:
+                session.bytes += delta
+                self._bytes += delta
+
+    def size(self, thread_id: int) -> int:
+        """Bytes of memory tracked for the thread."""
+        with self._lock:
+            session = self._sessions.get(thread_id)
+            return session.bytes if session is not None else 0
+
+    def forget(self, thread_id: int) -> None:
+        """Stop tracking a thread whose memory was cleared elsewhere."""
+        with self._lock:
+            session = self._sessions.get(thread_id)
+            if session is not None and not session.in_use:
+                del self._sessions[thread_id]
+                self._bytes -= session.bytes
+
+    def sweep(self) -> int:
+        """
+        Evict idle and over-limit threads now instead of after the next
+        request. Returns how many were evicted.
+        """
+        with self._lock:
+            evicted = self._evict(time.monotonic())
+        self._forget(evicted)
+        return len(evicted)
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                **self.stats,
+                "active_threads": len(self._sessions),
+                "in_flight_threads": sum(1 for session in self._sessions.values() if session.in_use),
+                "memory_bytes": self._bytes,
+            }
+
+    def __contains__(self, thread_id: int) -> bool:
+        return thread_id in self._sessions
+
+    def __len__(self) -> int:
+        return len(self._sessions)
@@ -0,0 +1,129 @@
+"""
+In-flight coalescing ("single-flight") of identical LLM calls.
+While a call for a given message list is running, other callers asking for
+exactly the same messages wait for it and share its result instead of
+sending their own request. Unlike the response cache nothing is kept once
+the call returns.
+"""
+
+import asyncio
+import hashlib
+import json
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.messages import BaseMessage
+
+
+def call_key(llm: Any, messages: List[BaseMessage]) -> str:
+    """Key for one LLM call: the client instance plus the exact formatted messages."""
+    raw = json.dumps([id(llm)] + [[message.type, message.content] for message in messages], default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _share(result: Any) -> Any:
+    # each caller appends the message to its own state; hand followers their own copy
+    return result.model_copy() if hasattr(result, "model_copy") else result
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class _AsyncFlight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls, for threads (`do`) and coroutines (`ado`).
+    stats:
+        calls: every call made through the layer
+        leaders: calls that actually went upstream
+        coalesced: calls that shared a leader's result
+        errors: leader calls that raised (their followers see the same error)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[str, _Flight] = {}
+        self._async_flights: Dict[Tuple[int, str], _AsyncFlight] = {}
+        self.stats = {"calls": 0, "leaders": 0, "coalesced": 0, "errors": 0}
+
+    def do(self, key: str, func: Callable[[], Any]) -> Any:
+        """
+        Run func() unless an identical call is already in flight, in which
+        case block until it finishes and return (or raise) its outcome.
+        """
+        with self._lock:
+            self.stats["calls"] += 1
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.stats["leaders"] += 1
+            else:
+                self.stats["coalesced"] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return _share(flight.result)
+
+        try:
+            flight.result = func()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            with self._lock:
+                self.stats["errors"] += 1
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    async def ado(self, key: str, afunc: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Async version of do. The upstream call runs as its own task; it is
+        only cancelled once every caller waiting on it has been cancelled.
+        """
+        loop = asyncio.get_running_loop()
+        flight_key = (id(loop), key)
+        with self._lock:
+            self.stats["calls"] += 1
+            flight = self._async_flights.get(flight_key)
+            leader = flight is None
+            if leader:
+                flight = self._async_flights[flight_key] = _AsyncFlight(loop.create_task(afunc()))
+                flight.task.add_done_callback(lambda task: self._finish(flight_key, flight))
+                self.stats["leaders"] += 1
+            else:
+                self.stats["coalesced"] += 1
+            flight.waiters += 1
+
+        try:
+            result = await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            with self._lock:
+                flight.waiters -= 1
+                abandoned = flight.waiters == 0
+            if abandoned:
+                flight.task.cancel()
+            raise
+        with self._lock:
+            flight.waiters -= 1
+        return result if leader else _share(result)
+
+    def _finish(self, flight_key: Tuple[int, str], flight: _AsyncFlight) -> None:
+        with self._lock:
+            if self._async_flights.get(flight_key) is flight:
+                del self._async_flights[flight_key]
+            if not flight.task.cancelled() and flight.task.exception() is not None:
+                self.stats["errors"] += 1
@@ -3,7 +3,8 @@ Shared state definitions and types used by all agents.
 Acts as a "contract" that all components must follow.
 """
 
-from typing import Dict, Any, List
+import operator
+from typing import Annotated, Dict, Any, List
 from langchain_core.messages import BaseMessage
 from typing_extensions import TypedDict
 
@@ -13,16 +14,44 @@ class MemoryEntry(TypedDict):
     response: str
     timestamp: str
 
+class WorldEntity(TypedDict):
+    name: str
+    kind: str  # place, faction, figure, resource or name
+    description: str  # sentence it was last mentioned in
+    mentions: int
+    agent: str  # agent that last mentioned it
+
+class WorldSection(TypedDict):
+    agent: str  # agent that owns the section
+    content: str
+    digest: str  # content_digest() of content
+    inputs: Dict[str, str]  # digest of each dependency section it was written from
+    edited: bool  # written by the user; kept when its inputs change
+    instruction: str  # the user's last revision request, kept on regeneration
+    revision: int
+
+def merge_outputs(left: Dict[str, str], right: Dict[str, str]) -> Dict[str, str]:
+    """Reducer for agent_outputs: parallel branches each add their own agent's answer."""
+    return {**(left or {}), **(right or {})}
+
 class AgentState(TypedDict):
     """
     The central state object that flows through our agent system.
+    Nodes return only the keys they change; annotated channels are merged by
+    their reducer instead of being replaced.
     """
-    messages : List[BaseMessage] # full conversation history
+    messages : Annotated[List[BaseMessage], operator.add] # this request's messages; nodes return only new ones
     selected_agent : str
+    selected_agents : List[str] # every agent a composite request fans out to, primary first
+    agent_outputs : Annotated[Dict[str, str], merge_outputs] # per-agent answers from parallel branches
     agent_reasoning : str
     input_prompt : str
     thread_id: int  # unique identifier for the conversation thread
-    thread_memory: Dict[int, List[MemoryEntry]]
+    thread_memory: Dict[int, List[MemoryEntry]]  # memory window of the active thread only
+    memory_summary: str  # digest of the thread's entries older than the window
+    world_entities: List[WorldEntity]  # the thread's entities relevant to this prompt
+    routing_path: str  # how the agent was chosen: local, llm, cache, fallback or degraded
+    speculation_hit: bool  # agent response was produced speculatively alongside selection
 
 class AgentConfig(TypedDict):
     """
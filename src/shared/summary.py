@@ -0,0 +1,179 @@
+"""
+Incremental "world so far" digests and token-budgeted story context.
+Entries that fall out of a thread's sliding window are folded into one
+compact digest per thread, so long sessions stay coherent while the prompt
+size stays flat.
+"""
+
+import math
+import re
+from abc import ABC, abstractmethod
+from typing import Dict, List, Sequence
+
+from shared.state import MemoryEntry
+
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+_WORD_RE = re.compile(r"[A-Za-z][A-Za-z'-]*")
+
+_STOPWORDS = frozenset("""
+a an and are as at be but by for from has have her his in into is it its of on or our
+that the their them there these they this to was were which while who with within
+""".split())
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token), good enough for budgeting."""
+    return math.ceil(len(text) / 4) if text else 0
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to about max_tokens, preferring a sentence or word boundary."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    cut = text[:max(0, max_tokens * 4)]
+    boundary = max(cut.rfind(". "), cut.rfind("! "), cut.rfind("? "))
+    if boundary > len(cut) // 2:
+        return cut[:boundary + 1]
+    return cut.rsplit(" ", 1)[0] + "…" if " " in cut else cut
+
+
+def split_sentences(text: str) -> List[str]:
+    return [sentence.strip() for sentence in _SENTENCE_RE.split(text.strip()) if sentence.strip()]
+
+
+class Summarizer(ABC):
+    """
+    Folds evicted memory entries into a thread's running digest.
+    """
+
+    @abstractmethod
+    def update(self, digest: str, evicted: List[MemoryEntry]) -> str:
+        pass
+
+    async def aupdate(self, digest: str, evicted: List[MemoryEntry]) -> str:
+        return self.update(digest, evicted)
+
+
+class ExtractiveSummarizer(Summarizer):
+    """
+    Local, LLM-free summarizer. Keeps the most salient sentences of the old
+    digest plus the evicted responses, favouring named things (capitalised
+    words mid-sentence) and terms that recur across the world.
+    """
+
+    def __init__(self, max_tokens: int = 250):
+        self.max_tokens = max_tokens
+
+    def _sentence_score(self, sentence: str, term_counts: Dict[str, int]) -> float:
+        words = _WORD_RE.findall(sentence)
+        if not words:
+            return 0.0
+        score = 0.0
+        for position, word in enumerate(words):
+            lower = word.lower()
+            if lower in _STOPWORDS:
+                continue
+            score += math.log(1 + term_counts.get(lower, 0))
+            if position > 0 and word[0].isupper():
+                score += 2.0  # names of places, factions, figures
+        return score / math.sqrt(len(words))
+
+    def update(self, digest: str, evicted: List[MemoryEntry]) -> str:
+        sentences = split_sentences(digest)
+        for entry in evicted:
+            sentences.extend(split_sentences(entry["response"]))
+        if not sentences:
+            return digest
+
+        term_counts: Dict[str, int] = {}
+        for sentence in sentences:
+            for word in set(w.lower() for w in _WORD_RE.findall(sentence)):
+                term_counts[word] = term_counts.get(word, 0) + 1
+
+        ranked = sorted(range(len(sentences)),
+                        key=lambda i: self._sentence_score(sentences[i], term_counts), reverse=True)
+
+        kept, used = set(), 0
+        for index in ranked:
+            cost = estimate_tokens(sentences[index]) + 1
+            if used + cost > self.max_tokens:
+                continue
+            kept.add(index)
+            used += cost
+
+        # keep story order: older digest sentences first, then newer material
+        return " ".join(sentences[i] for i in sorted(kept))
+
+
+class LLMSummarizer(Summarizer):
+    """
+    Optional summarizer that asks the LLM to rewrite the digest.
+    Better compression than the extractive one, at the cost of an extra call
+    per eviction.
+    """
+
+    def __init__(self, llm, max_words: int = 150):
+        from langchain_core.prompts import ChatPromptTemplate
+
+        self.llm = llm
+        self.max_words = max_words
+        self.prompt = ChatPromptTemplate.from_messages([
+            ("system", "You maintain a compact digest of a fictional world. Merge the new passages into the "
+                       "digest, keeping every named place, faction, figure and resource and any established "
+                       "facts. Use at most {max_words} words. Output only the digest."),
+            ("human", "Current digest:\n{digest}\n\nNew passages:\n{passages}")
+        ])
+
+    def _messages(self, digest: str, evicted: List[MemoryEntry]):
+        passages = "\n".join(f"- {entry['response']}" for entry in evicted)
+        return self.prompt.format_messages(max_words=self.max_words, digest=digest or "(empty)", passages=passages)
+
+    def update(self, digest: str, evicted: List[MemoryEntry]) -> str:
+        return self.llm.invoke(self._messages(digest, evicted)).content
+
+    async def aupdate(self, digest: str, evicted: List[MemoryEntry]) -> str:
+        return (await self.llm.ainvoke(self._messages(digest, evicted))).content
+
+
+def build_story_context(digest: str, entries: List[MemoryEntry], token_budget: int,
+                        entity_lines: Sequence[str] = ()) -> str:
+    """
+    Story context for an agent prompt: the known entities relevant to the
+    prompt, the thread digest, and as many of the most recent entries as fit
+    in token_budget. Entities get up to a third of the budget and the digest
+    is guaranteed up to half of what is left; recent entries fill the rest.
+    """
+    if not digest and not entries and not entity_lines:
+        return "Nothing has been established yet."
+
+    known: List[str] = []
+    entity_budget = token_budget // 3
+    for line in entity_lines:
+        cost = estimate_tokens(line)
+        if cost > entity_budget:
+            break
+        known.append(line)
+        entity_budget -= cost
+    token_budget -= sum(estimate_tokens(line) for line in known)
+
+    digest_reserve = min(estimate_tokens(digest), token_budget // 2)
+    remaining = token_budget - digest_reserve
+
+    recent: List[str] = []
+    for entry in reversed(entries):
+        line = f"- ({entry['responding_agent']}) {entry['response'].strip()}"
+        cost = estimate_tokens(line)
+        if cost > remaining:
+            break
+        recent.append(line)
+        remaining -= cost
+
+    parts = []
+    if known:
+        parts.append("Established names (keep them consistent):\n" + "\n".join(known))
+    if digest:
+        parts.append("World so far: " + truncate_to_tokens(digest, digest_reserve + remaining))
+    if recent:
+        parts.append("Recent additions:\n" + "\n".join(reversed(recent)))
+    return "\n".join(parts) or "Nothing has been established yet."
@@ -0,0 +1,123 @@
+"""
+Traffic recording for load replay.
+With a recorder attached, the orchestrator logs one compact JSON line per
+request: when it arrived, its thread and input, how it was routed, how long
+it waited for its thread and took overall, every LLM call it made (tier,
+seconds, output tokens), the response size and the thread's memory after
+it. benchmarks/replay.py re-drives a recorded log against a new build.
+Paths ending in .gz are gzip-compressed.
+"""
+
+import gzip
+import json
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from typing_extensions import TypedDict
+
+from shared.metrics import LLMCallbackHandler
+
+
+class TrafficRecord(TypedDict):
+    ts: float  # arrival, seconds since the epoch
+    thread_id: int
+    input: str
+    agents: List[str]
+    routing_path: str
+    seconds: float  # arrival to response, waiting included
+    queue_seconds: float  # waiting for the thread's earlier requests
+    llm: List[list]  # [tier, seconds, output tokens (None on failure)] per call, in completion order
+    response_chars: int
+    memory_bytes: int  # the thread's memory after the request
+
+
+class RequestTrace:
+    """
+    One request in flight: its arrival, and the LLM calls made on its behalf
+    (seen through its own callback, so concurrent requests don't mix).
+    """
+
+    def __init__(self, user_input: str, thread_id: int):
+        self.input = user_input
+        self.thread_id = thread_id
+        self.ts = time.time()
+        self.arrived = time.perf_counter()
+        self.calls: List[list] = []
+        self._lock = threading.Lock()
+        self.callback = LLMCallbackHandler(self)
+
+    def emit(self, event: Dict[str, Any]) -> None:
+        """Collect the handler's llm / llm_error events."""
+        call = [event["tier"], round(event["seconds"], 4),
+                event["output_tokens"] if event["event"] == "llm" else None]
+        with self._lock:
+            self.calls.append(call)
+
+    def config(self, run_config: dict) -> dict:
+        """The orchestrator's run config with this request's callback added."""
+        return {**run_config, "callbacks": [*run_config.get("callbacks", []), self.callback]}
+
+
+class TrafficRecorder:
+    """
+    Appends TrafficRecords to a JSON-lines file, or keeps them in
+    self.records when `path` is None (replays and tests).
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._lock = threading.Lock()
+        self.records: List[TrafficRecord] = []
+        self._handle = None
+        if path is not None:
+            self._handle = gzip.open(path, "at", encoding="utf-8") if path.endswith(".gz") \
+                else open(path, "a", encoding="utf-8")
+
+    def trace(self, user_input: str, thread_id: int) -> RequestTrace:
+        """Start tracing a request as it arrives."""
+        return RequestTrace(user_input, thread_id)
+
+    def record(self, trace: RequestTrace, started: float, result: dict, response: str, memory_bytes: int) -> None:
+        """
+        Log a finished request.
+        Args:
+            trace: The request's trace
+            started: perf_counter() once the request held its thread
+            result: Final workflow state
+            response: The answer returned
+            memory_bytes: The thread's memory after the request
+        """
+        record = TrafficRecord(
+            ts=round(trace.ts, 4),
+            thread_id=trace.thread_id,
+            input=trace.input,
+            agents=result.get("selected_agents") or [result.get("selected_agent", "")],
+            routing_path=result.get("routing_path", ""),
+            seconds=round(time.perf_counter() - trace.arrived, 4),
+            queue_seconds=round(started - trace.arrived, 4),
+            llm=trace.calls,
+            response_chars=len(response),
+            memory_bytes=memory_bytes,
+        )
+        with self._lock:
+            if self._handle is None:
+                self.records.append(record)
+                return
+            self._handle.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+            self._handle.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._handle is not None:
+                self._handle.close()
+                self._handle = None
+
+
+def read_traffic(path: str) -> Iterator[TrafficRecord]:
+    """Records of a traffic log, in file order."""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as handle:
+        for line in handle:
+            if line.strip():
+                yield json.loads(line)
@@ -0,0 +1,216 @@
+"""
+Batch (offline) world generation.
+Reads seed prompts from a JSONL file, runs them through the orchestrator on a
+bounded async or thread worker pool under a shared RPM/TPM limit, and appends
+each result to a JSONL output as soon as it finishes.
+
+Input lines:  {"id": "w-001", "prompt": "A desert trading empire", "thread_id": 7}
+              (id defaults to the line number; thread_id to a fresh thread per item)
+Output lines: {"id": "w-001", "prompt": ..., "response": ..., "selected_agents": [...],
+               "reasoning": ..., "seconds": ...}  or  {"id": ..., "prompt": ..., "error": "..."}
+
+The output file doubles as the checkpoint: on restart, items that already
+have a successful line are skipped, failed ones are retried.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Set
+
+from shared.metrics import MetricsSink
+from shared.rate_limit import RateLimiter
+from shared.summary import estimate_tokens
+from workflow.orchestrator import WorkFlowOrchestrator
+
+logger = logging.getLogger(__name__)
+
+def load_items(path: str) -> List[Dict[str, Any]]:
+    """
+    Read the input JSONL. Blank lines are ignored; every item gets a string id.
+    """
+    items = []
+    with open(path, encoding="utf-8") as handle:
+        for line_number, line in enumerate(handle, start=1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if "prompt" not in item:
+                raise ValueError(f"{path}:{line_number}: missing 'prompt'")
+            item["id"] = str(item.get("id", line_number))
+            items.append(item)
+    return items
+
+
+def completed_ids(path: str) -> Set[str]:
+    """
+    Ids with a successful result in an existing output file. A torn last line
+    from a killed run is ignored.
+    """
+    done: Set[str] = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as handle:
+        for line in handle:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if "error" not in record:
+                done.add(str(record.get("id")))
+    return done
+
+
+class _UsageSink(MetricsSink):
+    """Charges every finished LLM call's real token usage to the limiter."""
+
+    def __init__(self, limiter: RateLimiter):
+        self.limiter = limiter
+
+    def record(self, event: Dict[str, Any]) -> None:
+        if event.get("event") in ("llm", "llm_error"):
+            tokens = (event.get("input_tokens") or 0) + (event.get("output_tokens") or 0)
+            self.limiter.charge(requests=1, tokens=tokens)
+
+
+class BatchRunner:
+    """
+    Runs a file of prompts through one orchestrator.
+    Each item reserves `calls_per_item` requests and an estimated token count
+    before it starts; the reservation is returned when it finishes and the
+    actual LLM calls and tokens (from the response usage metadata) are charged
+    instead, so the limiter tracks real consumption.
+    Args:
+        orchestrator: The orchestrator to run items through
+        workers: Items in flight at once
+        requests_per_minute: LLM call budget, None for unlimited
+        tokens_per_minute: Token budget, None for unlimited
+        calls_per_item: LLM calls reserved per item (selector + agent)
+        tokens_per_item: Tokens reserved per item on top of the prompt itself
+    """
+
+    def __init__(self, orchestrator: WorkFlowOrchestrator, workers: int = 8,
+                 requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None,
+                 calls_per_item: int = 2, tokens_per_item: int = 1500):
+        self.orchestrator = orchestrator
+        self.workers = workers
+        self.limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.calls_per_item = calls_per_item
+        self.tokens_per_item = tokens_per_item
+        self.stats = {"completed": 0, "failed": 0, "skipped": 0}
+        self._write_lock = threading.Lock()
+        orchestrator.add_metrics_sink(_UsageSink(self.limiter))
+
+    def _reservation(self, item: Dict[str, Any]) -> Dict[str, float]:
+        return {"requests": self.calls_per_item,
+                "tokens": estimate_tokens(item["prompt"]) + self.tokens_per_item}
+
+    def _thread_id(self, item: Dict[str, Any]) -> int:
+        if "thread_id" in item:
+            return int(item["thread_id"])
+        return self.orchestrator.sessions.new_thread()
+
+    def _pending(self, items: List[Dict[str, Any]], out_path: str) -> List[tuple]:
+        done = completed_ids(out_path)
+        pending = [(index, item) for index, item in enumerate(items) if item["id"] not in done]
+        self.stats["skipped"] = len(items) - len(pending)
+        if self.stats["skipped"]:
+            logger.info("Resuming: %d of %d items already done", self.stats["skipped"], len(items))
+        return pending
+
+    def _result_record(self, item: Dict[str, Any], result: Optional[dict], error: Optional[Exception],
+                       seconds: float) -> Dict[str, Any]:
+        # run() calls this from its pool threads
+        with self._write_lock:
+            self.stats["failed" if error is not None else "completed"] += 1
+        if error is not None:
+            return {"id": item["id"], "prompt": item["prompt"], "error": f"{type(error).__name__}: {error}"}
+        return {
+            "id": item["id"],
+            "prompt": item["prompt"],
+            "response": result["response"],
+            "selected_agents": result["selected_agents"],
+            "reasoning": result["reasoning"],
+            "seconds": round(seconds, 3),
+        }
+
+    def _write(self, handle, record: Dict[str, Any]) -> None:
+        # one flushed, fsynced line per item so a killed run loses at most the line being written
+        with self._write_lock:
+            handle.write(json.dumps(record) + "\n")
+            handle.flush()
+            os.fsync(handle.fileno())
+
+    def _forget_thread(self, item: Dict[str, Any], thread_id: int) -> None:
+        # auto-assigned threads are one-shot; don't let thousands of them pile up in memory
+        if "thread_id" not in item:
+            self.orchestrator.clear_thread(thread_id)
+
+    # Thread pool
+    def run(self, in_path: str, out_path: str) -> dict:
+        """
+        Process every pending item with `workers` threads using the sync API.
+        Returns:
+            The run's counters
+        """
+        pending = self._pending(load_items(in_path), out_path)
+
+        def work(entry):
+            index, item = entry
+            thread_id = self._thread_id(item)
+            reservation = self._reservation(item)
+            self.limiter.acquire(**reservation)
+            start, result, error = time.perf_counter(), None, None
+            try:
+                result = self.orchestrator.process_request(item["prompt"], thread_id=thread_id)
+            except Exception as e:
+                error = e
+            finally:
+                self.limiter.release(**reservation)
+            self._write(handle, self._result_record(item, result, error, time.perf_counter() - start))
+            self._forget_thread(item, thread_id)
+
+        with open(out_path, "a", encoding="utf-8") as handle:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="batch") as pool:
+                list(pool.map(work, pending))
+        return dict(self.stats)
+
+    # Async pool
+    async def arun(self, in_path: str, out_path: str) -> dict:
+        """
+        Process every pending item with `workers` coroutines using the async API.
+        Returns:
+            The run's counters
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        for entry in self._pending(load_items(in_path), out_path):
+            queue.put_nowait(entry)
+
+        async def worker():
+            while True:
+                try:
+                    index, item = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                thread_id = self._thread_id(item)
+                reservation = self._reservation(item)
+                await self.limiter.aacquire(**reservation)
+                start, result, error = time.perf_counter(), None, None
+                try:
+                    result = await self.orchestrator.aprocess_request(item["prompt"], thread_id=thread_id)
+                except Exception as e:
+                    error = e
+                finally:
+                    self.limiter.release(**reservation)
+                # fsync off the event loop
+                await asyncio.to_thread(self._write, handle,
+                                        self._result_record(item, result, error, time.perf_counter() - start))
+                self._forget_thread(item, thread_id)
+
+        with open(out_path, "a", encoding="utf-8") as handle:
+            await asyncio.gather(*(worker() for _ in range(self.workers)))
+        return dict(self.stats)
@@ -1,17 +1,123 @@
 """
 The main orchestrator that builds and manages the LangGraph workflow.
+LangGraph and the Gemini client are imported on first use, and the compiled
+graph is shared by every orchestrator in the process, so constructing one is
+cheap.
 """
 
-from langgraph.graph import StateGraph, END
-from langchain_google_genai import ChatGoogleGenerativeAI
+import asyncio
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple, Union
 
-from shared.state import AgentState
-from agents.agent_selector import AgentSelector
-from agents.geo import GeographyAgent
-from agents.culture import CultureAgent
-from agents.lore import LoreAgent
-from agents.ecnomics import EconomicsAgent
-from agents.politics import PoliticsAgent
+from langchain_core.messages import AIMessage
+
+from shared.archive import WorldArchive
+from shared.cache import ResponseCache
+from shared.entities import EntityIndex, InMemoryEntityIndex, extract_entities, format_entity
+from shared.memory import InMemoryStore, MemoryStore
+from shared.metrics import Instrumentation, MetricsSink
+from shared.models import ClientPool, ModelConfig, build_client_pool, resolve_model_configs
+from shared.resilience import ResiliencePolicy, ResilientCaller, resolve_policies
+from shared.sessions import SessionManager
+from shared.singleflight import SingleFlight
+from shared.state import AgentState, MemoryEntry, WorldEntity, merge_outputs
+from shared.summary import ExtractiveSummarizer, Summarizer
+from shared.traffic import RequestTrace, TrafficRecorder
+from agents.agent_selector import AgentSelector, batch_routing_schema, routing_schema
+from agents.base_agent import BaseAgent
+from agents.registry import AGENT_CLASSES, LazyAgents
+from agents.routing_batcher import RoutingBatcher
+from workflow.speculative import EARLY_START_TAG, SpeculativeSelector
+from workflow.world import WORLD_DEPENDENCIES, WorldBuilder
+
+if TYPE_CHECKING:
+    from langchain_core.language_models.chat_models import BaseChatModel
+
+logger = logging.getLogger(__name__)
+
+# LangGraph's END node name, kept here so routing doesn't import langgraph
+END = "__end__"
+
+# Compiled graphs keyed by agent names. Nodes find their orchestrator in the
+# run config, so every instance with the same agents shares one graph.
+_GRAPH_CACHE: Dict[Tuple[str, ...], Any] = {}
+_GRAPH_LOCK = threading.Lock()
+
+
+def _entry_bytes(entry: MemoryEntry) -> int:
+    return len(entry["prompt"].encode("utf-8")) + len(entry["response"].encode("utf-8"))
+
+
+def _graph_node(name: str):
+    """
+    Graph node that dispatches to the orchestrator running the graph.
+    """
+    from langchain_core.runnables import RunnableLambda
+
+    def func(state, config):
+        return config["configurable"]["orchestrator"]._call_node(name, state)
+
+    async def afunc(state, config):
+        return await config["configurable"]["orchestrator"]._acall_node(name, state)
+
+    return RunnableLambda(func, afunc=afunc, name=name)
+
+
+def compiled_graph(agent_names: Tuple[str, ...]):
+    """
+    The compiled workflow for these agents, built on first use and cached
+    for the life of the process.
+    """
+    with _GRAPH_LOCK:
+        graph = _GRAPH_CACHE.get(agent_names)
+        if graph is None:
+            graph = _GRAPH_CACHE[agent_names] = _compile_graph(agent_names)
+        return graph
+
+
+def _compile_graph(agent_names: Tuple[str, ...]):
+    """
+    Construct the LangGraph workflow that defines agent interactions.
+    """
+    from langgraph.graph import StateGraph
+
+    # create state graph managing workflow
+    workflow = StateGraph(AgentState)
+
+    # entry point node
+    # each node carries a sync and an async implementation so the same graph
+    # serves both invoke and ainvoke
+    workflow.add_node("agent_selector", _graph_node("agent_selector"))
+
+    # Add nodes for each specialized agent
+    for agent_name in agent_names:
+        workflow.add_node(agent_name, _graph_node(agent_name))
+
+    # Composite requests: one branch per selected agent, then a single merge
+    workflow.add_node("agent_branch", _graph_node("agent_branch"))
+    workflow.add_node("merge_outputs", _graph_node("merge_outputs"))
+
+    # starting node
+    workflow.set_entry_point("agent_selector")
+
+    # add conditional routing from selector to agents
+    workflow.add_conditional_edges(
+        "agent_selector",
+        WorkFlowOrchestrator._route_to_agent,
+        {**{agent_name: agent_name for agent_name in agent_names}, "agent_branch": "agent_branch", END: END}
+    )
+
+    # After each agent is done, the workflow ends
+    for agent_name in agent_names:
+        workflow.add_edge(agent_name, END)
+    workflow.add_edge("agent_branch", "merge_outputs")
+    workflow.add_edge("merge_outputs", END)
+
+    # Compile and return the workflow graph
+    return workflow.compile()
 
 
 class WorkFlowOrchestrator:
@@ -20,154 +126,740 @@ class WorkFlowOrchestrator:
     the LangGraph workflow that coordinates all the agents.
     """
 
-    def __init__(self, model_name: str = "gemini-2.0-flash-lite"):
+    def __init__(self, model_name: Optional[str] = None, routing_threshold: float = 0.6,
+                 max_concurrent_llm_calls: int = 16, speculative: bool = False,
+                 speculation_budget: int = 1, cache: Optional[ResponseCache] = None,
+                 memory_store: Optional[MemoryStore] = None, memory_window: int = 5,
+                 summarizer: Optional[Summarizer] = None, context_token_budget: int = 600,
+                 llm: Optional["BaseChatModel"] = None, instrumentation: Optional[Instrumentation] = None,
+                 max_agents_per_request: int = 1, coalesce_llm_calls: bool = True,
+                 entity_index: Optional[EntityIndex] = None, entity_limit: int = 8,
+                 model_configs: Optional[Dict[str, ModelConfig]] = None, clients_per_tier: int = 1,
+                 resilient_llm_calls: bool = True,
+                 resilience_policies: Optional[Dict[str, ResiliencePolicy]] = None,
+                 early_agent_start: bool = True, structured_routing: bool = False,
+                 max_threads: Optional[int] = None, max_memory_bytes: Optional[int] = None,
+                 thread_idle_ttl: Optional[float] = None, batch_routing: bool = False,
+                 routing_batch_size: int = 8, routing_batch_wait: float = 0.01,
+                 world_dependencies: Optional[Dict[str, Tuple[str, ...]]] = None,
+                 archive: Optional[WorldArchive] = None, recorder: Optional[TrafficRecorder] = None):
         
-        self.llm = ChatGoogleGenerativeAI(
-            model = model_name,
-            temperature = 0.0
-        )
-        # Setup agent selector and agents
-        self.selector = AgentSelector(self.llm)
-        self.agents = {
-            "GeographyAgent": GeographyAgent(self.llm),
-            "CultureAgent": CultureAgent(self.llm),
-            "LoreAgent": LoreAgent(self.llm),
-            "EconomicsAgent": EconomicsAgent(self.llm),
-            "PoliticsAgent": PoliticsAgent(self.llm)
+        # Per-role model, output cap, timeout and temperature (see shared.models);
+        # model_name still sets the agent tier's model
+        self.model_configs = resolve_model_configs(model_configs, model_name)
+        if structured_routing:
+            # constrain the selector's reply to the routing schema (Gemini clients only)
+            self.model_configs["selector"]["response_schema"] = routing_schema(AGENT_CLASSES, max_agents_per_request)
+            self.model_configs["selector_batch"]["response_schema"] = batch_routing_schema(AGENT_CLASSES,
+                                                                                           max_agents_per_request)
+        # Each role gets its own client pool. Any LangChain chat model can be
+        # injected instead (e.g. shared.fake_llm.FakeChatModel); Gemini clients
+        # are only created when the first call needs them
+        self.clients: Dict[str, ClientPool] = {
+            role: build_client_pool(role, config, llm, clients_per_tier)
+            for role, config in self.model_configs.items()
         }
-        
-        # Build the LangGraph workflow
-        self.thread_memory = {} # Initialize empty thread memory
+        self.llm = self.clients["agent"]
+
+        # Global cap on in-flight Gemini calls for the async path
+        self.llm_limiter = asyncio.Semaphore(max_concurrent_llm_calls)
+        # Optional response cache around every LLM call (see shared.cache)
+        self.cache = cache
+        # Identical concurrent LLM calls share one upstream request (see shared.singleflight)
+        self.single_flight = SingleFlight() if coalesce_llm_calls else None
+        # Per-tier deadlines, hedging, retries and circuit breaker (see shared.resilience)
+        self.resilience: Dict[str, ResilientCaller] = {}
+        if resilient_llm_calls:
+            policies = resolve_policies(resilience_policies)
+            for role in set(policies) | set(self.clients):
+                policy = policies.get(role, policies["agent"])
+                self.resilience[role] = ResilientCaller(policy, name=role)
+        self.context_token_budget = context_token_budget
+
+        # Agents come from the registry and are each built on first use; the selector shares them
+        self.agents = LazyAgents(self.llm, on_build=self._configure_agent, llm_for=self._agent_client)
+        # max_agents_per_request > 1 lets composite prompts fan out to several agents in parallel
+        self.selector = AgentSelector(self.clients["selector"], self.agents, confidence_threshold=routing_threshold,
+                                      max_agents=max_agents_per_request)
+        self.selector.llm_limiter = self.llm_limiter
+        self.selector.cache = cache
+        self.selector.single_flight = self.single_flight
+        self.selector.resilience = self.resilience.get("selector")
+        # Opt-in: prompts the selector LLM routes within routing_batch_wait seconds
+        # of each other share one call (up to routing_batch_size per call)
+        if batch_routing:
+            batcher = RoutingBatcher(self.clients["selector_batch"], self.selector.build_batch_prompt,
+                                     max_batch_size=routing_batch_size, max_wait=routing_batch_wait)
+            batcher.llm_limiter = self.llm_limiter
+            batcher.resilience = self.resilience.get("selector_batch")
+            self.selector.batcher = batcher
+        # Opt-in: run the selector and likely agents concurrently. Early start
+        # begins the selected agent while the selector's reasoning still streams
+        self.speculator = None
+        if speculative or early_agent_start:
+            self.speculator = SpeculativeSelector(self.selector, self.agents, speculation_budget if speculative else 0,
+                                                  early_start=early_agent_start)
+
+        # Sliding-window thread memory; only the active thread's window is loaded per request
+        self.memory = memory_store if memory_store is not None else InMemoryStore(window_size=memory_window)
+        # Entries leaving the window are folded into a per-thread digest
+        self.summarizer = summarizer if summarizer is not None else ExtractiveSummarizer()
+        # Named places, factions, figures and resources per thread; only the
+        # entities relevant to a prompt are injected into it
+        self.entity_index = entity_index if entity_index is not None else InMemoryEntityIndex()
+        self.entity_limit = entity_limit
+        # Per-thread world document, one section per agent, regenerated along
+        # the section dependency DAG after an edit (see workflow.world)
+        self.world = WorldBuilder(self.agents, world_dependencies or WORLD_DEPENDENCIES)
+        # Optional append-only archive of every answer and world section (see shared.archive)
+        self.archive = archive
+        self.world.archive = archive
         self.current_thread_id = 1 # Default thread ID
-        self.workflow = self._build_workflow()
+        # Allocates thread IDs, serializes requests per thread and evicts whole
+        # threads when idle or over the thread/memory limits (see shared.sessions);
+        # memory is measured once per session, then tracked per change
+        self._entity_bytes: Dict[int, Dict[str, int]] = {}
+        self.sessions = SessionManager(self._unload_thread, self._thread_bytes, max_threads=max_threads,
+                                       max_memory_bytes=max_memory_bytes, idle_ttl=thread_idle_ttl,
+                                       first_thread_id=max(self.memory.thread_ids(), default=self.current_thread_id) + 1)
+
+        # Optional per-node timing and LLM token/latency instrumentation
+        self.instrumentation = instrumentation
+        # Optional per-request traffic log for load replay (see shared.traffic)
+        self.recorder = recorder
+        self._run_config = self._make_run_config()
 
-   
-    def _build_workflow(self) -> StateGraph:
+    def _agent_client(self, name: str) -> ClientPool:
         """
-        Construct the LangGraph workflow that defines agent interactions.
+        An agent's own pool when it has a model config, else the agent tier's.
         """
-        # create state graph managing workflow
-        workflow = StateGraph(AgentState)
+        return self.clients.get(name, self.clients["agent"])
 
-        # entry point node
-        workflow.add_node("agent_selector", self.selector.select_agent)  #select_agent is fnct name
+    def _configure_agent(self, name: str, agent: BaseAgent) -> None:
+        """
+        Share the orchestrator's limiter, cache, coalescing and the agent's
+        tier resilience with a newly built agent.
+        """
+        agent.llm_limiter = self.llm_limiter
+        agent.cache = self.cache
+        agent.single_flight = self.single_flight
+        agent.resilience = self.resilience.get(name, self.resilience.get("agent"))
+        agent.context_token_budget = self.context_token_budget
 
-        # Add nodes for each specialized agent
-        workflow.add_node("GeographyAgent", self.agents["GeographyAgent"].process_request)
-        workflow.add_node("CultureAgent", self.agents["CultureAgent"].process_request)
-        workflow.add_node("LoreAgent", self.agents["LoreAgent"].process_request)
-        workflow.add_node("EconomicsAgent", self.agents["EconomicsAgent"].process_request)
-        workflow.add_node("PoliticsAgent", self.agents["PoliticsAgent"].process_request)
-        
-        # starting node
-        workflow.set_entry_point("agent_selector")
-
-        # add conditional routing from selector to agents
-        workflow.add_conditional_edges(
-            "agent_selector",
-            self._route_to_agent,
-            {
-                "GeographyAgent": "GeographyAgent",
-                "CultureAgent": "CultureAgent",
-                "LoreAgent": "LoreAgent",
-                "EconomicsAgent": "EconomicsAgent",
-                "PoliticsAgent": "PoliticsAgent"
-            }
-        )
-
-        # After each agent is done, the workflow ends
-        for agent_name in self.agents.keys():
-            workflow.add_edge(agent_name, END)
-          
-        # Compile and return the workflow graph
-        return workflow.compile()
-
-    def _route_to_agent(self, state: AgentState ) -> str:
+    def _make_run_config(self) -> dict:
+        config = {"configurable": {"orchestrator": self}}
+        if self.instrumentation is not None:
+            config["callbacks"] = [self.instrumentation.callback]
+        return config
+
+    @property
+    def workflow(self):
+        """
+        The compiled LangGraph workflow, shared with other orchestrators that
+        have the same agents and compiled on first use.
+        """
+        return self._build_workflow()
+
+    def _build_workflow(self):
+        return compiled_graph(tuple(self.agents))
+
+    def warm_up(self) -> None:
+        """
+        Do the deferred startup work now: compile the graph and create the
+        LLM clients. Safe to run in a background thread while the CLI waits
+        for the first prompt; failures are logged and retried on first use.
+        """
+        try:
+            self._build_workflow()
+            for pool in self.clients.values():
+                pool.warm_up()
+        except Exception as e:
+            logger.warning("Warm-up failed: %s: %s", type(e).__name__, e)
+
+    def _node_handlers(self, name: str):
+        """
+        Sync and async implementation of graph node `name`.
+        """
+        if name == "agent_selector":
+            if self.speculator is not None:
+                return self.speculator.run, self.speculator.arun
+            return self.selector.select_agent, self.selector.aselect_agent
+        if name == "agent_branch":
+            return self._run_branch, self._arun_branch
+        if name == "merge_outputs":
+            return self._merge_outputs, self._amerge_outputs
+        agent = self.agents[name]
+        return agent.process_request, agent.aprocess_request
+
+    def _call_node(self, name: str, state: AgentState) -> dict:
+        """
+        Run node `name`, timed when instrumentation is enabled.
+        """
+        func, _ = self._node_handlers(name)
+        if self.instrumentation is None:
+            return func(state)
+        with self.instrumentation.node_timer(name):
+            return func(state)
+
+    async def _acall_node(self, name: str, state: AgentState) -> dict:
+        _, afunc = self._node_handlers(name)
+        if self.instrumentation is None:
+            return await afunc(state)
+        with self.instrumentation.node_timer(name):
+            return await afunc(state)
+
+    @staticmethod
+    def _route_to_agent(state: AgentState ) -> Union[str, list]:
         """
         Routing function that determines the next agent based on selector decision.        
         Args:
             state: Current workflow state containing the selector's decision
         Returns:
-            Name of the agent that should handle the request
+            Name of the agent that should handle the request, END when a
+            speculative run already produced the selected agent's answer, or
+            one Send per agent when the selector picked several
         """
+        if state.get("speculation_hit"):
+            return END
+        selected_agents = state.get("selected_agents") or [state["selected_agent"]]
+        if len(selected_agents) > 1:
+            from langgraph.types import Send
+            return [Send("agent_branch", WorkFlowOrchestrator._branch_state(state, agent_name))
+                    for agent_name in selected_agents]
         return state["selected_agent"]
 
+    # Composite requests
+    @staticmethod
+    def _branch_state(state: AgentState, agent_name: str) -> dict:
+        """
+        The slice of state one branch works on: the request and the thread's
+        context, but none of the other branches' messages.
+        """
+        return {
+            "branch_agent": agent_name,
+            "messages": [],
+            "input_prompt": state["input_prompt"],
+            "thread_id": state["thread_id"],
+            "thread_memory": state["thread_memory"],
+            "memory_summary": state.get("memory_summary", ""),
+            "world_entities": state.get("world_entities", []),
+        }
+
+    def _run_branch(self, branch: dict) -> dict:
+        agent_name = branch["branch_agent"]
+        result = self.agents[agent_name].process_request(branch)
+        return {"agent_outputs": {agent_name: result["messages"][-1].content}}
+
+    async def _arun_branch(self, branch: dict) -> dict:
+        agent_name = branch["branch_agent"]
+        result = await self.agents[agent_name].aprocess_request(branch)
+        return {"agent_outputs": {agent_name: result["messages"][-1].content}}
+
+    def _merge_outputs(self, state: AgentState) -> dict:
+        """
+        Combine the branch answers into one response, in the selector's order.
+        """
+        outputs = state.get("agent_outputs") or {}
+        sections = [outputs[name] for name in state["selected_agents"] if outputs.get(name)]
+        return {"messages": [AIMessage(content="\n\n".join(sections))]}
+
+    async def _amerge_outputs(self, state: AgentState) -> dict:
+        return self._merge_outputs(state)
+
     # Thread
     def start_new_thread(self) -> int:
         """
-        Start a fresh conversation thread. Clears all memory.
+        Start a fresh conversation thread and make it the default for
+        requests that don't name one. Other threads keep their memory.
         Returns:
-            New thread ID (always 1 for simplicity)
+            New thread ID
         """
-        self.current_thread_id = 1
-        # Clear all memory for fresh start
-        if 1 in self.thread_memory:
-            del self.thread_memory[1]
-        
+        self.current_thread_id = self.sessions.new_thread()
         print(f" Started fresh thread: {self.current_thread_id}")
         return self.current_thread_id
 
-    
-    def process_request(self, user_input : str) -> dict:
+    def clear_thread(self, thread_id: int) -> None:
+        """
+        Forget a thread's memory window, digest and world entities.
+        """
+        self._forget_thread(thread_id)
+        self.sessions.forget(thread_id)
+
+    def _forget_thread(self, thread_id: int) -> None:
+        self.memory.clear(thread_id)
+        self.entity_index.clear(thread_id)
+        self.world.forget(thread_id)
+        self._entity_bytes.pop(thread_id, None)
+
+    def _unload_thread(self, thread_id: int) -> None:
+        """
+        Evict a thread from this process. Unlike clear_thread, its history in
+        durable stores is kept and is read again on its next request.
+        """
+        self.memory.unload(thread_id)
+        self.entity_index.unload(thread_id)
+        self.world.forget(thread_id)
+        self._entity_bytes.pop(thread_id, None)
+
+    def _thread_bytes(self, thread_id: int) -> int:
+        """
+        Approximate memory a thread holds: its window, digest, entities and
+        world document as UTF-8. Reads the whole thread (and re-derives its
+        entity sizes); after a session opens, changes are reported to it as
+        deltas instead.
+        """
+        size = len(self.memory.get_summary(thread_id).encode("utf-8")) + self.world.size_bytes(thread_id)
+        for entry in self.memory.window(thread_id):
+            size += _entry_bytes(entry)
+        self._entity_bytes.pop(thread_id, None)
+        return size + self._entity_growth(thread_id, self.entity_index.entities(thread_id))
+
+    def _entity_growth(self, thread_id: int, entities: List[WorldEntity]) -> int:
+        """Bytes the thread's entity index grows by when `entities` are added; re-added names replace theirs."""
+        sizes = self._entity_bytes.setdefault(thread_id, {})
+        growth = 0
+        for entity in entities:
+            key = entity["name"].lower()
+            size = len(format_entity(entity).encode("utf-8"))
+            growth += size - sizes.get(key, 0)
+            sizes[key] = size
+        return growth
+
+    def _set_summary(self, thread_id: int, digest: str) -> None:
+        growth = len(digest.encode("utf-8")) - len(self.memory.get_summary(thread_id).encode("utf-8"))
+        self.memory.set_summary(thread_id, digest)
+        self.sessions.grow(thread_id, growth)
+
+    def thread_ids(self) -> List[int]:
+        """Threads with memory or a world document in this orchestrator."""
+        return sorted(set(self.memory.thread_ids()) | set(self.world.documents))
+
+    def export_thread(self, thread_id: int) -> dict:
+        """
+        Everything the orchestrator holds for a thread, as JSON-serializable
+        data for import_thread() in another process. Don't export a thread
+        with a request in flight.
+        """
+        return {
+            "window": self.memory.window(thread_id),
+            "summary": self.memory.get_summary(thread_id),
+            "entities": self.entity_index.entities(thread_id),
+            "world": self.world.export(thread_id),
+        }
+
+    def import_thread(self, thread_id: int, state: dict) -> None:
+        """
+        Replace the thread's memory, digest, entities and world with an
+        export_thread() result.
+        """
+        self._forget_thread(thread_id)
+        for entry in state["window"]:
+            self.memory.append(thread_id, entry)
+        if state["summary"]:
+            self.memory.set_summary(thread_id, state["summary"])
+        self.entity_index.add(thread_id, state["entities"])
+        if state["world"] is not None:
+            self.world.restore(thread_id, state["world"])
+        self.sessions.grow(thread_id, self._thread_bytes(thread_id) - self.sessions.size(thread_id))
+
+    # World document
+    def build_world(self, premise: str, thread_id: Optional[int] = None) -> dict:
+        """
+        Write the thread's world document: one section per agent, each built
+        on the sections it depends on. Sections that are already up to date
+        are kept, so calling it again costs nothing.
+        Returns:
+            The sections in dependency order, and which were regenerated or reused
+        """
+        thread_id = self.current_thread_id if thread_id is None else thread_id
+        with self.sessions.hold(thread_id):
+            before = self.world.size_bytes(thread_id)
+            result = self.world.build(thread_id, premise, self._run_config)
+            self.sessions.grow(thread_id, self.world.size_bytes(thread_id) - before)
+            return result
+
+    async def abuild_world(self, premise: str, thread_id: Optional[int] = None) -> dict:
+        """
+        Async version of build_world.
+        """
+        thread_id = self.current_thread_id if thread_id is None else thread_id
+        async with self.sessions.ahold(thread_id):
+            before = self.world.size_bytes(thread_id)
+            result = await self.world.abuild(thread_id, premise, self._run_config)
+            self.sessions.grow(thread_id, self.world.size_bytes(thread_id) - before)
+            return result
+
+    def revise_world(self, section: str, content: Optional[str] = None, instruction: Optional[str] = None,
+                     thread_id: Optional[int] = None) -> dict:
+        """
+        Edit one section of the thread's world, then regenerate only the
+        sections downstream of it whose inputs changed.
+        Args:
+            section: Section to edit, e.g. "geography" or "GeographyAgent"
+            content: The user's own text for the section; kept as written
+            instruction: Otherwise, what the section's agent should change
+            thread_id: Conversation thread (default: current_thread_id)
+        Returns:
+            Same as build_world
+        """
+        thread_id = self.current_thread_id if thread_id is None else thread_id
+        with self.sessions.hold(thread_id):
+            before = self.world.size_bytes(thread_id)
+            result = self.world.revise(thread_id, section, content, instruction, self._run_config)
+            self.sessions.grow(thread_id, self.world.size_bytes(thread_id) - before)
+            return result
+
+    async def arevise_world(self, section: str, content: Optional[str] = None, instruction: Optional[str] = None,
+                            thread_id: Optional[int] = None) -> dict:
+        """
+        Async version of revise_world.
+        """
+        thread_id = self.current_thread_id if thread_id is None else thread_id
+        async with self.sessions.ahold(thread_id):
+            before = self.world.size_bytes(thread_id)
+            result = await self.world.arevise(thread_id, section, content, instruction, self._run_config)
+            self.sessions.grow(thread_id, self.world.size_bytes(thread_id) - before)
+            return result
+
+    def add_metrics_sink(self, sink: MetricsSink) -> None:
+        """
+        Attach another metrics sink, turning instrumentation on if it was off.
+        """
+        if self.instrumentation is not None:
+            self.instrumentation.sinks.append(sink)
+            return
+        self.instrumentation = Instrumentation([sink])
+        self._run_config = self._make_run_config()
+
+    def routing_stats(self) -> dict:
+        """
+        How many requests were routed by the local classifier vs the selector LLM.
+        """
+        return dict(self.selector.routing_stats)
+
+    def routing_batch_stats(self) -> dict:
+        """
+        Batched routing calls, prompts routed through them, the largest batch
+        and prompts the batched reply had no decision for. Empty when
+        batching is off.
+        """
+        if self.selector.batcher is None:
+            return {}
+        stats = dict(self.selector.batcher.stats)
+        stats["mean_batch"] = stats["items"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
+
+    def cache_stats(self) -> dict:
+        """
+        Hit/miss/eviction counters of the response cache. Empty when caching is off.
+        """
+        return dict(self.cache.stats) if self.cache is not None else {}
+
+    def coalescing_stats(self) -> dict:
+        """
+        How many LLM calls shared an identical in-flight call instead of going
+        upstream. Empty when coalescing is off.
+        """
+        if self.single_flight is None:
+            return {}
+        return dict(self.single_flight.stats)
+
+    def resilience_stats(self) -> dict:
+        """
+        Per-tier attempts, hedges, retries, timeouts, failures and circuit
+        state. Empty when the resilience layer is off.
+        """
+        return {role: caller.snapshot() for role, caller in sorted(self.resilience.items())}
+
+    def session_stats(self) -> dict:
+        """
+        Live threads, threads with a request in flight, estimated memory
+        bytes, and how many threads were allocated, opened and evicted.
+        """
+        return self.sessions.snapshot()
+
+    def world_stats(self) -> dict:
+        """
+        World sections generated (and how many came out unchanged), reused
+        without a call, and edited by users, plus live world documents.
+        """
+        return {**self.world.stats, "documents": len(self.world.documents)}
+
+    def archive_stats(self) -> dict:
+        """
+        Records appended to the archive by this process, records re-indexed
+        from its segment on open, and its total records. Empty without an archive.
+        """
+        if self.archive is None:
+            return {}
+        return {**self.archive.stats, "records": len(self.archive)}
+
+    def speculation_stats(self) -> dict:
+        """
+        How often speculative agent calls matched the selector's choice, and
+        how many agents were started early from the selector's stream.
+        Empty when both speculative mode and early start are off.
+        """
+        if self.speculator is None:
+            return {}
+        return {**self.speculator.stats, "hit_rate": self.speculator.hit_rate()}
+
+    def process_request(self, user_input : str, thread_id: Optional[int] = None) -> dict:
         """
         Process a user request through the complete multi-agent workflow.
+        Requests on the same thread are serialized; requests on different
+        threads run concurrently.
         Args:
             user_input: The user's question or request
+            thread_id: Conversation thread the request belongs to (default: current_thread_id)
         Returns:
             Dictionary containing response and metadata about the process
         """
-        
-        initial_state = {
+        thread_id = self.current_thread_id if thread_id is None else thread_id
+        trace = self._trace(user_input, thread_id)
+        with self.sessions.hold(thread_id):
+            started = time.perf_counter()
+            # execute workflow
+            result = self.workflow.invoke(self._initial_state(user_input, thread_id), config=self._request_config(trace))
+            payload, evicted = self._finalize_request(user_input, thread_id, result)
+            if evicted:
+                digest = self.summarizer.update(self.memory.get_summary(thread_id), evicted)
+                self._set_summary(thread_id, digest)
+            self._record_request(started, result)
+            self._record_traffic(trace, started, result, payload)
+            return payload
+
+    async def aprocess_request(self, user_input : str, thread_id: Optional[int] = None) -> dict:
+        """
+        Async version of process_request.
+        Args:
+            user_input: The user's question or request
+            thread_id: Conversation thread the request belongs to (default: current_thread_id)
+        Returns:
+            Dictionary containing response and metadata about the process
+        """
+        thread_id = self.current_thread_id if thread_id is None else thread_id
+        trace = self._trace(user_input, thread_id)
+        async with self.sessions.ahold(thread_id):
+            started = time.perf_counter()
+            result = await self.workflow.ainvoke(self._initial_state(user_input, thread_id),
+                                                 config=self._request_config(trace))
+            payload, evicted = self._finalize_request(user_input, thread_id, result)
+            if evicted:
+                digest = await self.summarizer.aupdate(self.memory.get_summary(thread_id), evicted)
+                self._set_summary(thread_id, digest)
+            self._record_request(started, result)
+            self._record_traffic(trace, started, result, payload)
+            return payload
+
+    def stream_request(self, user_input : str, thread_id: Optional[int] = None) -> Iterator[dict]:
+        """
+        Streaming version of process_request; holds the thread until done.
+        Yields, in order:
+            {"type": "route", "selected_agent": ..., "selected_agents": [...], "reasoning": ...}
+            {"type": "chunk", "content": ...}  (one per token chunk)
+            {"type": "done", **payload}        (same payload as process_request)
+        Memory is only updated once the stream completes.
+        """
+        thread_id = self.current_thread_id if thread_id is None else thread_id
+        trace = self._trace(user_input, thread_id)
+        with self.sessions.hold(thread_id):
+            started = time.perf_counter()
+            initial_state = self._initial_state(user_input, thread_id)
+            progress = {"state": dict(initial_state), "routed": False, "streamed": False}
+
+            for mode, data in self.workflow.stream(initial_state, config=self._request_config(trace),
+                                                   stream_mode=["updates", "messages"]):
+                yield from self._stream_events(progress, mode, data)
+
+            payload, evicted = self._finalize_request(user_input, thread_id, progress["state"])
+            if evicted:
+                digest = self.summarizer.update(self.memory.get_summary(thread_id), evicted)
+                self._set_summary(thread_id, digest)
+            self._record_request(started, progress["state"])
+            self._record_traffic(trace, started, progress["state"], payload)
+            yield {"type": "done", **payload}
+
+    async def astream_request(self, user_input : str, thread_id: Optional[int] = None) -> AsyncIterator[dict]:
+        """
+        Async version of stream_request; holds the thread until done.
+        """
+        thread_id = self.current_thread_id if thread_id is None else thread_id
+        trace = self._trace(user_input, thread_id)
+        async with self.sessions.ahold(thread_id):
+            started = time.perf_counter()
+            initial_state = self._initial_state(user_input, thread_id)
+            progress = {"state": dict(initial_state), "routed": False, "streamed": False}
+
+            async for mode, data in self.workflow.astream(initial_state, config=self._request_config(trace),
+                                                          stream_mode=["updates", "messages"]):
+                for event in self._stream_events(progress, mode, data):
+                    yield event
+
+            payload, evicted = self._finalize_request(user_input, thread_id, progress["state"])
+            if evicted:
+                digest = await self.summarizer.aupdate(self.memory.get_summary(thread_id), evicted)
+                self._set_summary(thread_id, digest)
+            self._record_request(started, progress["state"])
+            self._record_traffic(trace, started, progress["state"], payload)
+            yield {"type": "done", **payload}
+
+    def _stream_events(self, progress: dict, mode: str, data) -> List[dict]:
+        """
+        Turn one LangGraph stream part into CLI events.
+        Token chunks only come from agent nodes and early-started agents; the
+        selector's JSON and any speculative candidates are not shown. Early
+        chunks arriving before the route event are held until it is sent.
+        Answers produced without a live LLM stream (cache hits, speculative
+        hits) are emitted as one chunk.
+        """
+        events = []
+        if mode == "messages":
+            chunk, metadata = data
+            early = EARLY_START_TAG in (metadata.get("tags") or ())
+            if (early or metadata.get("langgraph_node") in self.agents) and isinstance(chunk.content, str) and chunk.content:
+                progress["streamed"] = True
+                event = {"type": "chunk", "content": chunk.content}
+                if early and not progress["routed"]:
+                    progress.setdefault("held", []).append(event)
+                else:
+                    events.append(event)
+            return events
+
+        for node_name, update in data.items():
+            if not update:
+                continue
+            state = self._apply_update(progress["state"], update)
+
+            if not progress["routed"] and state.get("selected_agent"):
+                progress["routed"] = True
+                events.append({"type": "route", "selected_agent": state["selected_agent"],
+                               "selected_agents": state.get("selected_agents") or [state["selected_agent"]],
+                               "reasoning": state["agent_reasoning"]})
+                events.extend(progress.pop("held", []))
+
+            answered = node_name in self.agents or node_name == "merge_outputs" or state.get("speculation_hit")
+            if answered and not progress["streamed"] and state["messages"]:
+                progress["streamed"] = True
+                events.append({"type": "chunk", "content": state["messages"][-1].content})
+        return events
+
+    @staticmethod
+    def _apply_update(state: dict, update: dict) -> dict:
+        """
+        Fold one node's partial update into the streamed copy of the state,
+        following the reducers declared on AgentState.
+        """
+        for key, value in update.items():
+            if key == "messages":
+                state["messages"] = state["messages"] + value
+            elif key == "agent_outputs":
+                state["agent_outputs"] = merge_outputs(state.get("agent_outputs"), value)
+            else:
+                state[key] = value
+        return state
+
+    def _record_request(self, started: float, result: AgentState) -> None:
+        if self.instrumentation is None:
+            return
+        self.instrumentation.emit({
+            "event": "request",
+            "seconds": time.perf_counter() - started,
+            "thread_id": result.get("thread_id"),
+            "selected_agent": result.get("selected_agent"),
+            "selected_agents": result.get("selected_agents"),
+            "routing_path": result.get("routing_path"),
+            "parse_fallback": result.get("routing_path") == "fallback",
+            "speculation_hit": bool(result.get("speculation_hit")),
+        })
+
+    def _trace(self, user_input: str, thread_id: int) -> Optional[RequestTrace]:
+        return self.recorder.trace(user_input, thread_id) if self.recorder is not None else None
+
+    def _request_config(self, trace: Optional[RequestTrace]) -> dict:
+        """The run config, plus the request's own LLM callback when traffic is recorded."""
+        return trace.config(self._run_config) if trace is not None else self._run_config
+
+    def _record_traffic(self, trace: Optional[RequestTrace], started: float, result: AgentState,
+                        payload: dict) -> None:
+        if trace is None:
+            return
+        self.recorder.record(trace, started, result, payload["response"], self.sessions.size(payload["thread_id"]))
+
+    def _initial_state(self, user_input: str, thread_id: int) -> AgentState:
+        return {
             "messages" : [],
             "selected_agent": "",
+            "selected_agents": [],
+            "agent_outputs": {},
             "agent_reasoning": "",
-            "input_prompt": user_input
+            "input_prompt": user_input,
             "thread_id": thread_id,
-            "thread_memory": self.thread_memory
+            "thread_memory": {thread_id: self.memory.window(thread_id)},
+            "memory_summary": self.memory.get_summary(thread_id),
+            "world_entities": self.entity_index.search(thread_id, user_input, self.entity_limit),
+            "routing_path": "",
+            "speculation_hit": False
         }
 
-        # execute workflow
-        result = self.workflow.invoke(initial_state)
-
+    def _finalize_request(self, user_input: str, thread_id: int,
+                          result: AgentState) -> Tuple[dict, List[MemoryEntry]]:
+        """
+        Extract the agent's answer from the final state and update thread memory.
+        Returns:
+            The response payload and the memory entries that left the window
+        """
         # extract final response
         final_response = None
+        evicted: List[MemoryEntry] = []
         for message in reversed(result["messages"]):
             # Skip selector messages, get the actual agent response
             if hasattr(message, 'content') and not message.content.startswith("Selected"):
                 final_response = message.content
                 break
         
+        # Composite answers are remembered as one entry from all contributing agents
+        selected_agents = result.get("selected_agents") or [result["selected_agent"]]
+
         # Update thread memory - SLIDING WINDOW
         if final_response:
             # Create new memory entry
             memory_entry = MemoryEntry(
                 prompt = user_input,
-                responding_agent = result["selected_agent"],
+                responding_agent = "+".join(selected_agents),
                 response = final_response,
                 timestamp=datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             )
 
-        # Initialize thread memory if this is a new thread
-        if thread_id not in self.thread_memory:
-            self.thread_memory[thread_id] = []
-        
-        # Add new entry to thread's memory
-        self.thread_memory[thread_id].append(memory_entry)
+            # Add new entry to thread's memory; the store drops the oldest beyond the window
+            evicted = self.memory.append(thread_id, memory_entry)
+            # Index the names the answer established for later prompts
+            entities = extract_entities(final_response, memory_entry["responding_agent"])
+            self.entity_index.add(thread_id, entities)
+            self.sessions.grow(thread_id, _entry_bytes(memory_entry) - sum(_entry_bytes(entry) for entry in evicted)
+                               + self._entity_growth(thread_id, entities))
+            if self.archive is not None:
+                self.archive.append({
+                    "thread_id": thread_id,
+                    "agent": memory_entry["responding_agent"],
+                    "agents": selected_agents,
+                    "kind": "response",
+                    "prompt": user_input,
+                    "content": final_response,
+                    "timestamp": memory_entry["timestamp"],
+                })
 
-        # SLIDING WINDOW: Keep only last 5 entries (remove oldest if > 5)
-        if len(self.thread_memory[self.current_thread_id]) > 5:
-            self.thread_memory[self.current_thread_id] = self.thread_memory[self.current_thread_id][-5:]
-            
-            # Show current memory status
-        memory_count = len(self.thread_memory[self.current_thread_id])
-        print(f" Memory: {memory_count}/5 interactions in sliding window")
+        # Show current memory status
+        memory_count = self.memory.count(thread_id)
+        logger.debug("Memory: %d/%d interactions in sliding window", memory_count, self.memory.window_size)
 
         return {
             "response": final_response or "No response generated",
             "selected_agent": result["selected_agent"],
+            "selected_agents": selected_agents,
             "reasoning": result["agent_reasoning"],
             "full_conversation": result["messages"],
-            "thread_id": self.current_thread_id,
-            "memory_count": len(self.thread_memory.get(self.current_thread_id, []))
-        }
+            "thread_id": thread_id,
+            "memory_count": memory_count
+        }, evicted
         
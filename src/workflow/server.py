@@ -0,0 +1,129 @@
+"""
+Asyncio session server that exposes the orchestrator over TCP.
+
+Protocol: one JSON object per line.
+    -> {"input": "Describe the northern wastes", "thread_id": 7}
+    <- {"response": "...", "selected_agent": "...", "selected_agents": ["..."], "reasoning": "...",
+        "thread_id": 7, "memory_count": 1}
+Connections without a thread_id get their own thread for their lifetime;
+it is forgotten when the connection closes. A request's "id", if any, is
+echoed in its reply, so replies can be matched when they come back out of
+order.
+
+Thread operations, used by the sharded dispatcher (workflow.sharding) to
+move threads between worker processes; only a worker's server
+(connection_threads=False, which only the dispatcher connects to) accepts
+them, any other server answers them with an error:
+    -> {"op": "threads"}                          <- {"threads": [7, 9]}
+    -> {"op": "export", "thread_id": 7}           <- {"thread_id": 7, "state": {...}}
+    -> {"op": "import", "thread_id": 7, "state": {...}}
+    -> {"op": "clear", "thread_id": 7}            <- {"thread_id": 7}
+"""
+
+import asyncio
+import json
+from typing import Optional
+
+from workflow.orchestrator import WorkFlowOrchestrator
+
+# Longest request or reply line; an exported thread travels as one line
+MAX_LINE_BYTES = 16 * 2**20
+
+
+class SessionServer:
+    """
+    Serves many concurrent conversation threads from one orchestrator.
+    Concurrency limits live in the orchestrator (per-thread sessions, LLM limiter).
+    """
+
+    def __init__(self, orchestrator: WorkFlowOrchestrator, host: str = "127.0.0.1", port: int = 8765,
+                 connection_threads: bool = True):
+        self.orchestrator = orchestrator
+        self.host = host
+        self.port = port
+        # False when a dispatcher assigns every thread ID (requests must name one)
+        self.connection_threads = connection_threads
+
+    async def start(self) -> asyncio.AbstractServer:
+        """Start listening; with port 0 the chosen port is stored in self.port."""
+        server = await asyncio.start_server(self._handle_connection, self.host, self.port, limit=MAX_LINE_BYTES)
+        self.port = server.sockets[0].getsockname()[1]
+        return server
+
+    async def serve_forever(self) -> None:
+        server = await self.start()
+        print(f" Session server listening on {self.host}:{self.port}")
+        async with server:
+            await server.serve_forever()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        default_thread_id = self.orchestrator.sessions.new_thread() if self.connection_threads else None
+        pending = set()
+        write_lock = asyncio.Lock()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                # requests on one connection are handled concurrently; the
+                # orchestrator serializes those that share a thread
+                task = asyncio.create_task(self._handle_line(line, default_thread_id, writer, write_lock))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        finally:
+            writer.close()
+            # the connection's own thread can't be reached again
+            if default_thread_id is not None:
+                self.orchestrator.clear_thread(default_thread_id)
+
+    async def _handle_line(self, line: bytes, default_thread_id: Optional[int],
+                           writer: asyncio.StreamWriter, write_lock: asyncio.Lock) -> None:
+        request = {}
+        try:
+            request = json.loads(line)
+            op = request.get("op", "process")
+            if op != "process" and self.connection_threads:
+                raise ValueError(f"Unknown op: {op}")
+            if op == "threads":
+                reply = {"threads": self.orchestrator.thread_ids()}
+            else:
+                thread_id = int(request.get("thread_id", default_thread_id))
+                reply = await self._thread_op(op, thread_id, request)
+        except Exception as e:
+            reply = {"error": f"{type(e).__name__}: {e}"}
+        if isinstance(request, dict) and "id" in request:
+            reply["id"] = request["id"]
+
+        async with write_lock:
+            writer.write((json.dumps(reply) + "\n").encode("utf-8"))
+            await writer.drain()
+
+    async def _thread_op(self, op: str, thread_id: int, request: dict) -> dict:
+        if op == "process":
+            result = await self.orchestrator.aprocess_request(request["input"], thread_id=thread_id)
+            return {
+                "response": result["response"],
+                "selected_agent": result["selected_agent"],
+                "selected_agents": result["selected_agents"],
+                "reasoning": result["reasoning"],
+                "thread_id": result["thread_id"],
+                "memory_count": result["memory_count"],
+            }
+        # wait for the thread's requests in flight
+        async with self.orchestrator.sessions.ahold(thread_id):
+            if op == "export":
+                return {"thread_id": thread_id, "state": self.orchestrator.export_thread(thread_id)}
+            if op == "import":
+                self.orchestrator.import_thread(thread_id, request["state"])
+            elif op != "clear":
+                raise ValueError(f"Unknown op: {op}")
+        if op == "clear":
+            # after release, or the session would be tracked again
+            self.orchestrator.clear_thread(thread_id)
+        return {"thread_id": thread_id}
@@ -0,0 +1,438 @@
+"""
+Multi-process sharded serving.
+One orchestrator process spends much of its time in the GIL (JSON parsing,
+prompt formatting, state copies). The ShardedServer speaks the session
+server protocol (workflow.server) to clients, and forwards every request to
+one of N worker processes chosen by consistent hashing of its thread_id
+(shared.hash_ring). Each worker runs its own WorkFlowOrchestrator holding
+only its shard of the threads, so a thread's memory stays in one process
+and no lock is shared between processes.
+
+Workers are supervised: one that crashes is restarted with backoff (the
+threads it held in process memory are lost unless the factory gives it
+durable stores), and its in-flight requests are answered with an error.
+resize() changes the number of workers: requests are paused while the
+threads whose shard changed are exported from their old worker and
+imported into their new one. A thread that fails to move stays pinned to
+the worker holding it, which is kept running until a later resize moves it.
+
+Clients may only send requests ("op" absent or "process"); thread
+operations, stats (snapshot()) and resize() are for the process running
+the dispatcher.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import multiprocessing
+import time
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+from shared.hash_ring import HashRing
+from workflow.server import MAX_LINE_BYTES
+
+if TYPE_CHECKING:
+    from workflow.orchestrator import WorkFlowOrchestrator
+
+logger = logging.getLogger(__name__)
+
+# Builds a worker's orchestrator from its shard number; must be picklable
+# (a module-level function or a functools.partial of one)
+OrchestratorFactory = Callable[[int], "WorkFlowOrchestrator"]
+
+
+def _worker_main(factory: OrchestratorFactory, shard: int, host: str, ready) -> None:
+    """Worker process entry point: serve one shard until killed."""
+    asyncio.run(_serve_shard(factory, shard, host, ready))
+
+
+async def _serve_shard(factory: OrchestratorFactory, shard: int, host: str, ready) -> None:
+    from workflow.server import SessionServer
+    # the dispatcher assigns every thread ID
+    server = SessionServer(factory(shard), host, 0, connection_threads=False)
+    listener = await server.start()
+    ready.send(server.port)
+    ready.close()
+    async with listener:
+        await listener.serve_forever()
+
+
+class _Worker:
+    """A shard's process and the dispatcher's connection to it."""
+
+    def __init__(self, shard: int):
+        self.shard = shard
+        self.process: Optional[multiprocessing.Process] = None
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.write_lock = asyncio.Lock()
+        self.pending: Dict[int, asyncio.Future] = {}
+        self.ready = asyncio.Event()
+        self.supervisor: Optional[asyncio.Task] = None
+        self.stopping = False
+        self.started = 0.0
+        self.failures = 0  # crashes in a row, for the restart backoff
+        self.requests = 0
+
+
+class ShardedServer:
+    """
+    Dispatches session-server requests to worker processes by thread.
+    Args:
+        factory: Builds each worker's orchestrator (see OrchestratorFactory)
+        workers: Worker processes to start with
+        host, port: Address clients connect to
+        replicas: Hash ring points per worker
+        start_timeout: Seconds a worker may take to build its orchestrator
+        max_restart_delay: Cap on the backoff between restarts of a crashing worker
+    """
+
+    def __init__(self, factory: OrchestratorFactory, workers: int = 2, host: str = "127.0.0.1",
+                 port: int = 8765, replicas: int = 64, start_timeout: float = 60.0,
+                 max_restart_delay: float = 30.0):
+        self.factory = factory
+        self.host = host
+        self.port = port
+        self.ring = HashRing(range(workers), replicas)
+        # thread -> shard, for threads that failed to move off a shard and live there still
+        self._pinned: Dict[int, int] = {}
+        self.start_timeout = start_timeout
+        self.max_restart_delay = max_restart_delay
+        # spawn, not fork: the dispatcher's event loop and threads must not be copied
+        self._context = multiprocessing.get_context("spawn")
+        self.workers: Dict[int, _Worker] = {}
+        self._next_thread_id = 1
+        self._request_ids = itertools.count(1)
+        # cleared while threads move between workers
+        self._open = asyncio.Event()
+        self._open.set()
+        self._in_flight = 0
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._resize_lock = asyncio.Lock()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.stats = {"requests": 0, "errors": 0, "restarts": 0, "rebalances": 0, "moved_threads": 0,
+                      "failed_moves": 0, "rejected": 0}
+
+    # Thread IDs
+    def new_thread(self) -> int:
+        """A thread ID unique across every worker."""
+        thread_id = self._next_thread_id
+        self._next_thread_id += 1
+        return thread_id
+
+    def _seen(self, thread_id: int) -> None:
+        # IDs chosen by clients must not be handed out again
+        self._next_thread_id = max(self._next_thread_id, thread_id + 1)
+
+    # Workers
+    async def _spawn(self, worker: _Worker) -> None:
+        """Start the worker's process and connect to it. Raises if it fails to start."""
+        ready, child_end = self._context.Pipe(duplex=False)
+        process = self._context.Process(target=_worker_main, name=f"shard-{worker.shard}", daemon=True,
+                                        args=(self.factory, worker.shard, "127.0.0.1", child_end))
+        process.start()
+        child_end.close()
+        worker.process = process
+        loop = asyncio.get_running_loop()
+        try:
+            # poll() also returns once the process has exited without a port
+            if not await loop.run_in_executor(None, ready.poll, self.start_timeout):
+                raise TimeoutError(f"shard {worker.shard} did not start within {self.start_timeout}s")
+            port = ready.recv()
+        except EOFError:
+            process.join(5)
+            raise RuntimeError(f"shard {worker.shard} exited during start (code {process.exitcode})") from None
+        except BaseException:
+            self._reap(worker)
+            raise
+        finally:
+            ready.close()
+        worker.reader, worker.writer = await asyncio.open_connection("127.0.0.1", port, limit=MAX_LINE_BYTES)
+        worker.started = time.monotonic()
+        worker.ready.set()
+
+    def _reap(self, worker: _Worker) -> None:
+        process = worker.process
+        if process is not None and process.is_alive():
+            process.terminate()
+            process.join(5)
+            if process.is_alive():
+                process.kill()
+                process.join()
+
+    async def _listen(self, worker: _Worker) -> None:
+        """Hand the worker's replies to their requests until its connection drops."""
+        try:
+            while line := await worker.reader.readline():
+                reply = json.loads(line)
+                future = worker.pending.pop(reply.pop("id", None), None)
+                if future is not None and not future.done():
+                    future.set_result(reply)
+        except (ConnectionError, ValueError) as e:
+            logger.warning("Lost shard %d: %s", worker.shard, e)
+
+    def _down(self, worker: _Worker) -> None:
+        worker.ready.clear()
+        worker.writer.close()
+        pending, worker.pending = worker.pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError(f"shard {worker.shard} went away"))
+        self._reap(worker)
+
+    async def _supervise(self, worker: _Worker) -> None:
+        """Restart the worker, with exponential backoff, whenever it dies."""
+        while True:
+            await self._listen(worker)
+            self._down(worker)
+            if worker.stopping:
+                return
+            # a worker that ran for a while before dying starts a new series
+            worker.failures = 1 if time.monotonic() - worker.started > 60 else worker.failures + 1
+            while not worker.stopping:
+                delay = min(self.max_restart_delay, 0.5 * 2 ** (worker.failures - 1))
+                logger.warning("Shard %d exited (code %s); restarting in %.1fs",
+                               worker.shard, worker.process.exitcode, delay)
+                await asyncio.sleep(delay)
+                self.stats["restarts"] += 1
+                try:
+                    await self._spawn(worker)
+                    break
+                except Exception as e:
+                    logger.warning("Shard %d failed to restart: %s", worker.shard, e)
+                    worker.failures += 1
+            if worker.stopping:
+                self._reap(worker)
+                return
+
+    async def _add_worker(self, shard: int) -> None:
+        worker = _Worker(shard)
+        await self._spawn(worker)
+        self.workers[shard] = worker
+        worker.supervisor = asyncio.create_task(self._supervise(worker))
+
+    async def _retire_unused(self) -> None:
+        """Stop workers outside the ring that hold no pinned thread."""
+        used = set(self.ring.shards) | set(self._pinned.values())
+        for worker in [worker for shard, worker in self.workers.items() if shard not in used]:
+            await self._retire(worker)
+
+    async def _retire(self, worker: _Worker) -> None:
+        worker.stopping = True
+        del self.workers[worker.shard]
+        if worker.writer is not None:
+            worker.writer.close()
+        self._reap(worker)
+        if worker.supervisor is not None:
+            await worker.supervisor
+
+    async def _call(self, worker: _Worker, request: dict, check: bool = True) -> dict:
+        # a restarting worker is waited for
+        await worker.ready.wait()
+        request_id = next(self._request_ids)
+        future = asyncio.get_running_loop().create_future()
+        worker.pending[request_id] = future
+        try:
+            async with worker.write_lock:
+                worker.writer.write((json.dumps({**request, "id": request_id}) + "\n").encode("utf-8"))
+                await worker.writer.drain()
+            reply = await future
+        finally:
+            worker.pending.pop(request_id, None)
+        if check and "error" in reply:
+            raise RuntimeError(f"shard {worker.shard}: {reply['error']}")
+        return reply
+
+    # Dispatch
+    async def dispatch(self, request: dict) -> dict:
+        """
+        Forward a request naming a thread_id to the worker that owns the
+        thread. Returns its reply, errors included.
+        """
+        await self._open.wait()
+        self._in_flight += 1
+        self._drained.clear()
+        try:
+            worker = self.workers[self.shard_for(int(request["thread_id"]))]
+            worker.requests += 1
+            return await self._call(worker, request, check=False)
+        finally:
+            self._in_flight -= 1
+            if not self._in_flight:
+                self._drained.set()
+
+    def shard_for(self, thread_id: int) -> int:
+        """The shard serving the thread: its pinned shard, else the ring's."""
+        return self._pinned.get(thread_id, self.ring.shard_for(thread_id))
+
+    async def resize(self, workers: int) -> dict:
+        """
+        Run `workers` worker processes, moving every thread whose shard
+        changes. Requests wait while threads move. A thread that fails to
+        move stays pinned to its old worker, which keeps running; the next
+        resize tries to move it again.
+        Raises:
+            Whatever starting a new worker or listing threads raised; the
+            ring, threads and workers are then as before
+        """
+        async with self._resize_lock:
+            ring = HashRing(range(workers), self.ring.replicas)
+            started = await asyncio.gather(*(self._add_worker(shard) for shard in ring.shards
+                                             if shard not in self.workers), return_exceptions=True)
+            failure = next((result for result in started if isinstance(result, BaseException)), None)
+            if failure is not None:
+                await self._retire_unused()
+                raise failure
+            self._open.clear()
+            try:
+                await self._drained.wait()
+                # where each thread actually lives, rather than where the old ring puts it
+                listings = await asyncio.gather(*(self._call(worker, {"op": "threads"})
+                                                  for worker in self.workers.values()))
+                moves, stale = self._plan(ring, zip(list(self.workers.values()), listings))
+                limit = asyncio.Semaphore(32)
+                moved = await asyncio.gather(*(self._move(thread_id, source, target, limit)
+                                               for thread_id, source, target in moves),
+                                             *(self._clear(worker, thread_id, limit) for thread_id, worker in stale))
+                moved = moved[:len(moves)]
+                self._pinned = {thread_id: source.shard for (thread_id, source, _), ok in zip(moves, moved) if not ok}
+                self.ring = ring
+            except BaseException:
+                await self._retire_unused()
+                raise
+            finally:
+                self._open.set()
+            await self._retire_unused()
+            self.stats["rebalances"] += 1
+            self.stats["moved_threads"] += sum(moved)
+            self.stats["failed_moves"] += len(moved) - sum(moved)
+            return {"workers": len(ring), "moved_threads": sum(moved), "failed_moves": len(self._pinned)}
+
+    def _plan(self, ring: HashRing, listings) -> Tuple[List[Tuple[int, _Worker, _Worker]], List[Tuple[int, _Worker]]]:
+        """
+        Returns:
+            (thread, source, target) for each thread whose shard changes, and
+            (thread, worker) for copies left behind by a failed clear
+        """
+        moves, stale = [], []
+        for worker, listing in listings:
+            for thread_id in listing["threads"]:
+                if self.shard_for(thread_id) != worker.shard:
+                    stale.append((thread_id, worker))
+                elif ring.shard_for(thread_id) != worker.shard:
+                    moves.append((thread_id, worker, self.workers[ring.shard_for(thread_id)]))
+        return moves, stale
+
+    async def _move(self, thread_id: int, source: _Worker, target: _Worker, limit: asyncio.Semaphore) -> bool:
+        """Copy the thread to its new worker, then drop it from the old one. Never raises."""
+        async with limit:
+            try:
+                exported = await self._call(source, {"op": "export", "thread_id": thread_id})
+                await self._call(target, {"op": "import", "thread_id": thread_id, "state": exported["state"]})
+            except Exception as e:
+                logger.warning("Could not move thread %d from shard %d to %d: %s",
+                               thread_id, source.shard, target.shard, e)
+                return False
+        # the target owns the thread now; a copy left behind is cleared by the next resize
+        await self._clear(source, thread_id, limit)
+        return True
+
+    async def _clear(self, worker: _Worker, thread_id: int, limit: asyncio.Semaphore) -> None:
+        async with limit:
+            try:
+                await self._call(worker, {"op": "clear", "thread_id": thread_id})
+            except Exception as e:
+                logger.warning("Could not clear thread %d on shard %d: %s", thread_id, worker.shard, e)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "workers": len(self.workers),
+            "shard_requests": {shard: worker.requests for shard, worker in sorted(self.workers.items())},
+            "shards_up": sum(1 for worker in self.workers.values() if worker.ready.is_set()),
+            "pinned_threads": len(self._pinned),
+        }
+
+    # Serving
+    async def start(self) -> None:
+        """Start the workers, then listen for clients."""
+        await asyncio.gather(*(self._add_worker(shard) for shard in self.ring.shards))
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port,
+                                                  limit=MAX_LINE_BYTES)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+        for worker in list(self.workers.values()):
+            await self._retire(worker)
+
+    async def serve_forever(self) -> None:
+        await self.start()
+        print(f" Sharded server listening on {self.host}:{self.port} with {len(self.workers)} workers")
+        try:
+            async with self._server:
+                await self._server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # the connection's own thread, allocated by its first request without a
+        # thread_id (allocating up front could take an ID a client picked)
+        connection: Dict[str, Optional[int]] = {"thread_id": None}
+        pending = set()
+        write_lock = asyncio.Lock()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                task = asyncio.create_task(self._handle_line(line, connection, writer, write_lock))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        finally:
+            writer.close()
+            # the connection's own thread can't be reached again
+            if connection["thread_id"] is not None:
+                try:
+                    await self.dispatch({"op": "clear", "thread_id": connection["thread_id"]})
+                except Exception as e:
+                    logger.debug("Could not clear thread %d: %s", connection["thread_id"], e)
+
+    async def _handle_line(self, line: bytes, connection: Dict[str, Optional[int]],
+                           writer: asyncio.StreamWriter, write_lock: asyncio.Lock) -> None:
+        request: Any = {}
+        try:
+            request = json.loads(line)
+            op = request.get("op", "process")
+            if op != "process":
+                self.stats["rejected"] += 1
+                reply = {"error": f"ValueError: Unknown op: {op}"}
+            else:
+                if "thread_id" in request:
+                    thread_id = int(request["thread_id"])
+                    self._seen(thread_id)
+                else:
+                    if connection["thread_id"] is None:
+                        connection["thread_id"] = self.new_thread()
+                    thread_id = connection["thread_id"]
+                self.stats["requests"] += 1
+                forwarded = {key: value for key, value in request.items() if key != "id"}
+                reply = await self.dispatch({**forwarded, "thread_id": thread_id})
+        except Exception as e:
+            self.stats["errors"] += 1
+            reply = {"error": f"{type(e).__name__}: {e}"}
+        if isinstance(request, dict) and "id" in request:
+            reply["id"] = request["id"]
+
+        async with write_lock:
+            writer.write((json.dumps(reply) + "\n").encode("utf-8"))
+            await writer.drain()
@@ -0,0 +1,183 @@
+"""
+Speculative execution of the selector and the most likely agents.
+Runs the selector LLM call and up to `budget` candidate agents at the same
+time, keeps the candidate the selector picks and discards the rest.
+
+With early start, the agent the selector names is started as soon as the
+"selected_agent" field has streamed, while the selector is still writing
+its reasoning. Its tokens are tagged EARLY_START_TAG so they can be shown
+live even though they run inside the selector node.
+"""
+
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable
+
+from agents.agent_selector import AgentSelector
+from agents.base_agent import BaseAgent
+from shared.state import AgentState
+
+# Run tag of agent calls started early from the selector's stream
+EARLY_START_TAG = "early_start"
+
+
+class SpeculativeSelector:
+    """
+    Graph node that replaces the plain selector node in speculative or
+    early-start mode.
+    Sets `speculation_hit` when the chosen agent's answer is already in the state.
+    Args:
+        selector: The selector whose decision is awaited
+        agents: Agents that may be started ahead of the decision
+        budget: Candidate agents launched before the selector answers (0 for none)
+        early_start: Start the selected agent while the selector's reasoning streams;
+            ignored for composite routing, where the full reply decides
+        max_workers: Threads for the sync node
+    """
+
+    def __init__(self, selector: AgentSelector, agents: Dict[str, BaseAgent], budget: int = 1,
+                 early_start: bool = False, max_workers: int = 8):
+        self.selector = selector
+        self.agents = agents
+        self.budget = budget  # max extra agent calls launched per request
+        self.early_start = early_start and selector.max_agents == 1
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speculative")
+        self.stats = {"speculated": 0, "hits": 0, "misses": 0, "extra_calls": 0, "wasted_calls": 0,
+                      "early_starts": 0}
+        # the sync node runs on many graph threads at once
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    def _candidates(self, state: AgentState):
+        if not self.budget:
+            return []
+        return [name for name in self.selector.candidate_agents(state["input_prompt"], self.budget)
+                if name in self.agents]
+
+    def _merge(self, selector_state: dict, agent_state: dict) -> dict:
+        return {
+            **selector_state,
+            "messages": selector_state["messages"] + agent_state["messages"],
+            "speculation_hit": True
+        }
+
+    def _record(self, selector_state: dict, started: Dict[str, Any], candidates: Iterable[str]) -> bool:
+        # a composite selection runs its own branches, so a lone agent can't stand in for it
+        composite = len(selector_state.get("selected_agents") or []) > 1
+        selected_agent = selector_state["selected_agent"]
+        hit = not composite and selected_agent in started
+        if candidates:
+            self._count("hits" if not composite and selected_agent in candidates else "misses")
+        self._count("wasted_calls", len(started) - (1 if hit else 0))
+        return hit
+
+    def _early_runner(self, agent: BaseAgent):
+        """The agent's request as a runnable tagged EARLY_START_TAG (tags reach its LLM call)."""
+        from langchain_core.runnables import RunnableLambda
+        return RunnableLambda(agent.process_request, afunc=agent.aprocess_request).with_config(
+            tags=[EARLY_START_TAG])
+
+    def run(self, state: AgentState) -> dict:
+        """
+        Sync node. Losing agents cannot be interrupted once running, so
+        their results are simply discarded.
+        """
+        if "input_prompt" not in state:
+            return self.selector.select_agent(state)
+
+        local_state = self.selector.route_locally(state)
+        if local_state is not None:
+            return {**local_state, "speculation_hit": False}
+
+        candidates = self._candidates(state)
+        if not candidates and not self.early_start:
+            return {**self.selector.select_with_llm(state), "speculation_hit": False}
+
+        if candidates:
+            self._count("speculated")
+            self._count("extra_calls", len(candidates))
+        # copy the context so callbacks (streaming, instrumentation) follow the call into the pool
+        futures = {name: self._executor.submit(contextvars.copy_context().run, self.agents[name].process_request, state)
+                   for name in candidates}
+        lock, closed = threading.Lock(), [False]
+
+        def on_agent(name: str) -> None:
+            # hedged or retried selector attempts may announce again; only the first starts an agent
+            with lock:
+                if closed[0] or name in futures or name not in self.agents or len(futures) > len(candidates):
+                    return
+                runner = self._early_runner(self.agents[name])
+                futures[name] = self._executor.submit(contextvars.copy_context().run, runner.invoke, state)
+                self._count("early_starts")
+
+        selector_state = self.selector.select_with_llm(state, on_agent=on_agent if self.early_start else None)
+        with lock:
+            closed[0] = True
+        selected_agent = selector_state["selected_agent"]
+
+        if self._record(selector_state, futures, candidates):
+            for name, future in futures.items():
+                if name != selected_agent:
+                    future.cancel()
+            return self._merge(selector_state, futures[selected_agent].result())
+
+        for future in futures.values():
+            future.cancel()
+        return {**selector_state, "speculation_hit": False}
+
+    async def arun(self, state: AgentState) -> dict:
+        """
+        Async node. Losing agents are cancelled as soon as the selector answers.
+        """
+        if "input_prompt" not in state:
+            return await self.selector.aselect_agent(state)
+
+        local_state = self.selector.route_locally(state)
+        if local_state is not None:
+            return {**local_state, "speculation_hit": False}
+
+        candidates = self._candidates(state)
+        if not candidates and not self.early_start:
+            return {**await self.selector.aselect_with_llm(state), "speculation_hit": False}
+
+        if candidates:
+            self._count("speculated")
+            self._count("extra_calls", len(candidates))
+        tasks = {name: asyncio.create_task(self.agents[name].aprocess_request(state)) for name in candidates}
+
+        def on_agent(name: str) -> None:
+            # runs on the event loop, inside the selector's stream loop
+            if name in tasks or name not in self.agents or len(tasks) > len(candidates):
+                return
+            tasks[name] = asyncio.ensure_future(self._early_runner(self.agents[name]).ainvoke(state))
+            self._count("early_starts")
+
+        try:
+            selector_state = await self.selector.aselect_with_llm(state, on_agent=on_agent if self.early_start else None)
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            raise
+        finally:
+            for task in tasks.values():
+                # losing agents may fail after we stop caring; don't warn about it
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+        selected_agent = selector_state["selected_agent"]
+        hit = self._record(selector_state, tasks, candidates)
+        for name, task in tasks.items():
+            if not hit or name != selected_agent:
+                task.cancel()
+
+        if hit:
+            return self._merge(selector_state, await tasks[selected_agent])
+        return {**selector_state, "speculation_hit": False}
+
+    def hit_rate(self) -> float:
+        speculated = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / speculated if speculated else 0.0
@@ -0,0 +1,335 @@
+"""
+Per-thread world document with dependency-aware regeneration.
+A world is one section per agent, and sections build on the sections they
+depend on (WORLD_DEPENDENCIES). Each section remembers the digest of every
+input it was written from, so after an edit only the sections whose inputs
+actually changed are regenerated: wave by wave in dependency order, the
+sections of one wave in parallel. A regenerated section whose text comes
+out the same (e.g. from the response cache) stops the cascade there.
+Every new revision of a section is appended to the world archive, if any.
+"""
+
+import asyncio
+import contextvars
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from agents.base_agent import BaseAgent
+from shared.archive import WorldArchive
+from shared.state import AgentState, MemoryEntry, WorldSection
+
+# Section -> sections it builds on; must be acyclic
+WORLD_DEPENDENCIES: Dict[str, Tuple[str, ...]] = {
+    "GeographyAgent": (),
+    "CultureAgent": ("GeographyAgent",),
+    "EconomicsAgent": ("GeographyAgent",),
+    "PoliticsAgent": ("CultureAgent", "EconomicsAgent"),
+    "LoreAgent": ("GeographyAgent", "CultureAgent", "PoliticsAgent"),
+}
+
+# Agent prompts already name their domain, so the premise is the request
+GUIDED_PROMPT = """{premise}
+
+Follow this request from the user: {instruction}"""
+
+REVISION_PROMPT = """{premise}
+
+Revise your current version as requested: {instruction}
+Current version:
+{content}"""
+
+
+def content_digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def dependency_waves(dependencies: Mapping[str, Tuple[str, ...]]) -> List[List[str]]:
+    """
+    Sections grouped so each depends only on sections of earlier groups.
+    Raises:
+        ValueError: on an unknown dependency or a cycle
+    """
+    for name, deps in dependencies.items():
+        unknown = [dep for dep in deps if dep not in dependencies]
+        if unknown:
+            raise ValueError(f"{name} depends on unknown sections: {unknown}")
+
+    waves, placed = [], set()
+    while len(placed) < len(dependencies):
+        wave = [name for name, deps in dependencies.items()
+                if name not in placed and all(dep in placed for dep in deps)]
+        if not wave:
+            raise ValueError(f"Dependency cycle among {sorted(set(dependencies) - placed)}")
+        waves.append(wave)
+        placed.update(wave)
+    return waves
+
+
+class WorldDocument:
+    """
+    One thread's world: the premise and a section per agent.
+    """
+
+    def __init__(self, premise: str, dependencies: Mapping[str, Tuple[str, ...]]):
+        self.premise = premise
+        self.dependencies = dependencies
+        self.sections: Dict[str, WorldSection] = {}
+
+    def _digest(self, name: str) -> str:
+        section = self.sections.get(name)
+        return section["digest"] if section is not None else ""
+
+    def inputs(self, name: str) -> Dict[str, str]:
+        """Current digests of the section's dependencies."""
+        return {dep: self._digest(dep) for dep in self.dependencies[name]}
+
+    def is_stale(self, name: str) -> bool:
+        """
+        Missing, or written from inputs that have changed since. Sections
+        the user wrote are never stale.
+        """
+        section = self.sections.get(name)
+        if section is None:
+            return True
+        return not section["edited"] and section["inputs"] != self.inputs(name)
+
+    def set(self, name: str, content: str, edited: bool = False, instruction: Optional[str] = None) -> bool:
+        """
+        Store a section written from the current inputs. `instruction`
+        replaces the section's standing revision request when given.
+        Returns:
+            Whether its text changed
+        """
+        previous = self.sections.get(name)
+        if instruction is None:
+            instruction = previous["instruction"] if previous is not None else ""
+        digest = content_digest(content)
+        self.sections[name] = WorldSection(
+            agent=name,
+            content=content,
+            digest=digest,
+            inputs=self.inputs(name),
+            edited=edited,
+            instruction=instruction,
+            revision=previous["revision"] + 1 if previous is not None else 1,
+        )
+        return previous is None or previous["digest"] != digest
+
+    def prompt(self, name: str) -> str:
+        """Request that (re)writes the section: the premise, plus any standing instruction."""
+        section = self.sections.get(name)
+        if section is None or not section["instruction"]:
+            return self.premise
+        return GUIDED_PROMPT.format(premise=self.premise, instruction=section["instruction"])
+
+    def context(self, name: str) -> List[MemoryEntry]:
+        """The section's dependencies as story-context entries for its agent."""
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        return [MemoryEntry(prompt=self.premise, responding_agent=dep, response=self.sections[dep]["content"],
+                            timestamp=timestamp)
+                for dep in self.dependencies[name] if dep in self.sections]
+
+    def size_bytes(self) -> int:
+        return len(self.premise.encode("utf-8")) + sum(
+            len(section["content"].encode("utf-8")) for section in self.sections.values())
+
+
+class WorldBuilder:
+    """
+    Builds and maintains the world document of every thread.
+    Sections are written by the agent of the same name, through its cache,
+    limiter and resilience layers, with its dependencies as story context.
+    Args:
+        agents: Name -> agent, shared with the orchestrator
+        dependencies: Section -> sections it builds on
+        max_workers: Threads for the sync API
+    """
+
+    def __init__(self, agents: Mapping[str, BaseAgent],
+                 dependencies: Mapping[str, Tuple[str, ...]] = WORLD_DEPENDENCIES, max_workers: int = 8):
+        self.agents = agents
+        self.dependencies = {name: tuple(deps) for name, deps in dependencies.items() if name in agents}
+        self.waves = dependency_waves(self.dependencies)
+        self.documents: Dict[int, WorldDocument] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="world")
+        # Optional archive receiving every changed section
+        self.archive: Optional[WorldArchive] = None
+        self.stats = {"generated": 0, "unchanged": 0, "reused": 0, "edits": 0}
+
+    def section_name(self, name: str) -> str:
+        """
+        Resolve "geography", "Geography" or "GeographyAgent" to a section.
+        Raises:
+            KeyError: for an unknown section
+        """
+        wanted = name.strip().lower()
+        for section in self.dependencies:
+            if wanted in (section.lower(), section.lower().removesuffix("agent")):
+                return section
+        raise KeyError(f"Unknown world section: {name}")
+
+    def forget(self, thread_id: int) -> None:
+        self.documents.pop(thread_id, None)
+
+    def size_bytes(self, thread_id: int) -> int:
+        document = self.documents.get(thread_id)
+        return document.size_bytes() if document is not None else 0
+
+    def export(self, thread_id: int) -> Optional[Dict[str, Any]]:
+        """The thread's premise and sections as JSON-serializable data, or None."""
+        document = self.documents.get(thread_id)
+        if document is None:
+            return None
+        return {"premise": document.premise, "sections": dict(document.sections)}
+
+    def restore(self, thread_id: int, data: Dict[str, Any]) -> None:
+        """Replace the thread's world with an export() result."""
+        document = self.documents[thread_id] = WorldDocument(data["premise"], self.dependencies)
+        document.sections = {name: WorldSection(**section) for name, section in data["sections"].items()
+                             if name in self.dependencies}
+
+    def _document(self, thread_id: int) -> WorldDocument:
+        document = self.documents.get(thread_id)
+        if document is None:
+            raise KeyError(f"Thread {thread_id} has no world yet")
+        return document
+
+    def _start(self, thread_id: int, premise: str) -> WorldDocument:
+        # a new premise is a new world
+        document = self.documents.get(thread_id)
+        if document is None or document.premise != premise:
+            document = self.documents[thread_id] = WorldDocument(premise, self.dependencies)
+        return document
+
+    def _state(self, thread_id: int, document: WorldDocument, name: str, prompt: str) -> AgentState:
+        return {
+            "messages": [],
+            "input_prompt": prompt,
+            "thread_id": thread_id,
+            "thread_memory": {thread_id: document.context(name)},
+            "memory_summary": "",
+            "world_entities": [],
+        }
+
+    def _runner(self, name: str):
+        """The agent as a runnable, so run config callbacks reach its LLM call."""
+        from langchain_core.runnables import RunnableLambda
+        agent = self.agents[name]
+        return RunnableLambda(agent.process_request, afunc=agent.aprocess_request, name=name)
+
+    def _revision_prompt(self, document: WorldDocument, name: str, instruction: str) -> str:
+        section = document.sections.get(name)
+        return REVISION_PROMPT.format(premise=document.premise, instruction=instruction,
+                                      content=section["content"] if section is not None else "")
+
+    def _report(self, thread_id: int, document: WorldDocument, regenerated: List[str]) -> Dict[str, Any]:
+        kept = [name for name in self.dependencies if name not in regenerated]
+        self.stats["reused"] += len(kept)
+        return {
+            "thread_id": thread_id,
+            "premise": document.premise,
+            "sections": {name: document.sections[name]["content"]
+                         for wave in self.waves for name in wave if name in document.sections},
+            "regenerated": regenerated,
+            "reused": kept,
+            "edited": [name for name, section in document.sections.items() if section["edited"]],
+        }
+
+    def _store(self, thread_id: int, document: WorldDocument, name: str, content: str,
+               instruction: Optional[str] = None, edited: bool = False) -> None:
+        self.stats["edits" if edited else "generated"] += 1
+        changed = document.set(name, content, edited=edited, instruction=instruction)
+        if not changed and not edited:
+            self.stats["unchanged"] += 1
+        if changed and self.archive is not None:
+            section = document.sections[name]
+            self.archive.append({
+                "thread_id": thread_id,
+                "agent": name,
+                "kind": "section",
+                "prompt": document.premise,
+                "content": content,
+                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "edited": edited,
+                "revision": section["revision"],
+            })
+
+    # Sync
+    def build(self, thread_id: int, premise: str, config: Optional[dict] = None) -> Dict[str, Any]:
+        """
+        Write every missing or stale section of the thread's world.
+        Returns:
+            The sections in dependency order, and which were regenerated or reused
+        """
+        document = self._start(thread_id, premise)
+        return self._report(thread_id, document, self._refresh(thread_id, document, config))
+
+    def revise(self, thread_id: int, section: str, content: Optional[str] = None,
+               instruction: Optional[str] = None, config: Optional[dict] = None) -> Dict[str, Any]:
+        """
+        Replace a section with the user's `content`, or have its agent rewrite
+        it following `instruction`, then regenerate whatever that made stale.
+        """
+        document, name = self._document(thread_id), self.section_name(section)
+        regenerated = []
+        if content is not None:
+            self._store(thread_id, document, name, content, edited=True)
+        else:
+            state = self._state(thread_id, document, name, self._revision_prompt(document, name, instruction or ""))
+            self._store(thread_id, document, name, self._runner(name).invoke(state, config)["messages"][-1].content,
+                        instruction or "")
+            regenerated.append(name)
+        regenerated += self._refresh(thread_id, document, config)
+        return self._report(thread_id, document, regenerated)
+
+    def _refresh(self, thread_id: int, document: WorldDocument, config: Optional[dict]) -> List[str]:
+        regenerated = []
+        for wave in self.waves:
+            stale = [name for name in wave if document.is_stale(name)]
+            # copy the context so callbacks follow the calls into the pool
+            futures = {name: self._executor.submit(contextvars.copy_context().run, self._runner(name).invoke,
+                                                   self._state(thread_id, document, name, document.prompt(name)), config)
+                       for name in stale}
+            for name, future in futures.items():
+                self._store(thread_id, document, name, future.result()["messages"][-1].content)
+            regenerated += stale
+        return regenerated
+
+    # Async
+    async def abuild(self, thread_id: int, premise: str, config: Optional[dict] = None) -> Dict[str, Any]:
+        """
+        Async version of build.
+        """
+        document = self._start(thread_id, premise)
+        return self._report(thread_id, document, await self._arefresh(thread_id, document, config))
+
+    async def arevise(self, thread_id: int, section: str, content: Optional[str] = None,
+                      instruction: Optional[str] = None, config: Optional[dict] = None) -> Dict[str, Any]:
+        """
+        Async version of revise.
+        """
+        document, name = self._document(thread_id), self.section_name(section)
+        regenerated = []
+        if content is not None:
+            self._store(thread_id, document, name, content, edited=True)
+        else:
+            state = self._state(thread_id, document, name, self._revision_prompt(document, name, instruction or ""))
+            result = await self._runner(name).ainvoke(state, config)
+            self._store(thread_id, document, name, result["messages"][-1].content, instruction or "")
+            regenerated.append(name)
+        regenerated += await self._arefresh(thread_id, document, config)
+        return self._report(thread_id, document, regenerated)
+
+    async def _arefresh(self, thread_id: int, document: WorldDocument, config: Optional[dict]) -> List[str]:
+        regenerated = []
+        for wave in self.waves:
+            stale = [name for name in wave if document.is_stale(name)]
+            results = await asyncio.gather(*(
+                self._runner(name).ainvoke(self._state(thread_id, document, name, document.prompt(name)), config)
+                for name in stale))
+            for name, result in zip(stale, results):
+                self._store(thread_id, document, name, result["messages"][-1].content)
+            regenerated += stale
+        return regenerated
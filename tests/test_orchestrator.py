@@ -0,0 +1,100 @@
+"""
+The four request paths on the offline FakeChatModel, and thread eviction
+with the persistent stores.
+"""
+
+import asyncio
+import sqlite3
+
+import pytest
+
+from agents.registry import AGENT_CLASSES
+from shared.entities import SQLiteEntityIndex
+from shared.fake_llm import FakeChatModel
+from shared.memory import SQLiteMemoryStore
+from workflow.orchestrator import WorkFlowOrchestrator
+
+PROMPTS = ["Describe the mountains of the north", "Tell me about the trade in its markets"]
+
+
+@pytest.fixture
+def orchestrator():
+    return WorkFlowOrchestrator(llm=FakeChatModel(latency=0.0))
+
+
+def check_payload(payload: dict, thread_id: int, memory_count: int) -> None:
+    assert payload["response"]
+    assert payload["selected_agent"] in AGENT_CLASSES
+    assert payload["thread_id"] == thread_id
+    assert payload["memory_count"] == memory_count
+
+
+def test_process_request(orchestrator):
+    for turn, prompt in enumerate(PROMPTS, start=1):
+        check_payload(orchestrator.process_request(prompt, thread_id=7), 7, turn)
+
+
+def test_aprocess_request(orchestrator):
+    async def run():
+        return [await orchestrator.aprocess_request(prompt, thread_id=7) for prompt in PROMPTS]
+
+    for turn, payload in enumerate(asyncio.run(run()), start=1):
+        check_payload(payload, 7, turn)
+
+
+def check_stream(events: list, thread_id: int, memory_count: int) -> None:
+    kinds = [event["type"] for event in events]
+    assert kinds[0] == "route" and kinds[-1] == "done"
+    assert set(kinds[1:-1]) == {"chunk"}
+    done = events[-1]
+    check_payload(done, thread_id, memory_count)
+    assert "".join(event["content"] for event in events[1:-1]).strip() == done["response"].strip()
+
+
+def test_stream_request(orchestrator):
+    for turn, prompt in enumerate(PROMPTS, start=1):
+        check_stream(list(orchestrator.stream_request(prompt, thread_id=7)), 7, turn)
+
+
+def test_astream_request(orchestrator):
+    async def run(prompt):
+        return [event async for event in orchestrator.astream_request(prompt, thread_id=7)]
+
+    for turn, prompt in enumerate(PROMPTS, start=1):
+        check_stream(asyncio.run(run(prompt)), 7, turn)
+
+
+def test_concurrent_threads_keep_their_own_memory(orchestrator):
+    async def run():
+        await asyncio.gather(*(orchestrator.aprocess_request(prompt, thread_id=thread_id)
+                               for thread_id in range(1, 11) for prompt in PROMPTS[:1]))
+        return await asyncio.gather(*(orchestrator.aprocess_request(PROMPTS[1], thread_id=thread_id)
+                                      for thread_id in range(1, 11)))
+
+    assert [payload["memory_count"] for payload in asyncio.run(run())] == [2] * 10
+
+
+def stored_rows(path: str, thread_id: int) -> int:
+    with sqlite3.connect(path) as conn:
+        return sum(conn.execute(f"SELECT COUNT(*) FROM {table} WHERE thread_id = ?", (thread_id,)).fetchone()[0]
+                   for table in ("memory", "entities"))
+
+
+def test_eviction_keeps_persistent_history(tmp_path):
+    path = str(tmp_path / "threads.sqlite3")
+    orchestrator = WorkFlowOrchestrator(llm=FakeChatModel(latency=0.0), memory_store=SQLiteMemoryStore(path),
+                                        entity_index=SQLiteEntityIndex(path), max_threads=1)
+    orchestrator.process_request(PROMPTS[0], thread_id=1)
+    rows = stored_rows(path, 1)
+    assert rows > 0
+
+    # serving a second thread evicts the first from the process only
+    orchestrator.process_request(PROMPTS[0], thread_id=2)
+    assert orchestrator.session_stats()["evicted_lru"] == 1
+    assert 1 not in orchestrator.sessions
+    assert stored_rows(path, 1) == rows
+    assert orchestrator.process_request(PROMPTS[1], thread_id=1)["memory_count"] == 2
+
+    # an explicit clear deletes it
+    orchestrator.clear_thread(1)
+    assert stored_rows(path, 1) == 0
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+from shared.resilience import CircuitOpenError, ResilientCaller
+
+POLICY = {"failure_threshold": 1, "reset_timeout": 0.0, "max_retries": 0, "hedge": False}
+
+
+def test_cancelled_half_open_probe_frees_the_circuit():
+    caller = ResilientCaller(dict(POLICY), "test")
+
+    async def fail():
+        raise RuntimeError("upstream down")
+
+    async def hang():
+        await asyncio.sleep(30)
+
+    async def succeed():
+        return "ok"
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            await caller.acall(fail)
+        assert caller.breaker.state == "open"
+
+        # the probe is cancelled, e.g. a losing speculative agent
+        probe = asyncio.create_task(caller.acall(hang))
+        await asyncio.sleep(0.05)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        assert await caller.acall(succeed) == "ok"
+        assert caller.breaker.state == "closed"
+
+    asyncio.run(run())
+
+
+def test_interrupted_sync_probe_frees_the_circuit():
+    caller = ResilientCaller(dict(POLICY), "test")
+
+    class Interrupted(BaseException):
+        pass
+
+    def fail():
+        raise RuntimeError("upstream down")
+
+    def interrupt():
+        raise Interrupted()
+
+    with pytest.raises(RuntimeError):
+        caller.call(fail)
+    with pytest.raises(Interrupted):
+        caller.call(interrupt)
+    assert caller.call(lambda: "ok") == "ok"
+
+
+def test_open_circuit_short_circuits():
+    caller = ResilientCaller({**POLICY, "reset_timeout": 60.0}, "test")
+
+    def fail():
+        raise RuntimeError("upstream down")
+
+    with pytest.raises(RuntimeError):
+        caller.call(fail)
+    with pytest.raises(CircuitOpenError):
+        caller.call(lambda: "ok")
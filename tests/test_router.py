@@ -0,0 +1,45 @@
+import threading
+
+from agents.router import DEFAULT_KEYWORDS, LocalRouter
+
+
+def make_router(**kwargs) -> LocalRouter:
+    return LocalRouter({name: f"{name} domain expert" for name in DEFAULT_KEYWORDS}, **kwargs)
+
+
+def test_learns_from_examples():
+    router = make_router()
+    router.add_example("zephyr glass bells", "LoreAgent")
+    assert router.predict("zephyr glass bells") == ("LoreAgent", 1.0)
+
+
+def test_concurrent_add_and_predict():
+    router = make_router(max_examples=50)
+    errors, done = [], threading.Event()
+
+    def predict():
+        while not done.is_set():
+            try:
+                router.predict("mountain trade routes through the valley")
+            except Exception as e:
+                errors.append(e)
+                return
+
+    def add():
+        for i in range(2000):
+            router.add_example(f"valley market {i}", "EconomicsAgent")
+
+    predictors = [threading.Thread(target=predict) for _ in range(2)]
+    adders = [threading.Thread(target=add) for _ in range(2)]
+    for thread in predictors + adders:
+        thread.start()
+    for thread in adders:
+        thread.join()
+    done.set()
+    for thread in predictors:
+        thread.join()
+
+    assert errors == []
+    # nothing added during a rebuild is lost
+    router.add_example("zephyr glass bells", "LoreAgent")
+    assert router.predict("zephyr glass bells")[0] == "LoreAgent"